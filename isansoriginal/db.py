@@ -0,0 +1,119 @@
+"""
+Database settings from the environment.
+
+    DB_ENGINE            'sqlite' (default) or 'postgresql'
+    DB_NAME              database name, or the SQLite file path (default BASE_DIR/db.sqlite3)
+    DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+    DB_CONN_MAX_AGE      seconds to keep a connection open between requests (default 60)
+    DB_POOL              'true' to use Django's built-in PostgreSQL pool instead of
+                         persistent connections; needs psycopg 3 with psycopg-pool
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+    SQLITE_TUNED         'false' to open SQLite with its stock rollback journal
+    SQLITE_TIMEOUT       seconds a writer waits for the lock (default 20)
+    SQLITE_MMAP_SIZE     bytes of the file to memory-map (default 256 MiB)
+    DB_REPLICAS          comma-separated read replicas: host[:port] on PostgreSQL, file
+                         paths on SQLite. They become the aliases 'replica', 'replica2', ...
+                         with the primary's other settings, see isansoriginal/routing.py
+"""
+import copy
+import os
+
+
+def env(name, default=None):
+    return os.environ.get(name, default)
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def sqlite_options(tuned=True):
+    if not tuned:
+        return {}
+    timeout = env_int('SQLITE_TIMEOUT', 20)
+    pragmas = [
+        # Readers no longer block the writer and vice versa
+        'PRAGMA journal_mode=WAL',
+        # Safe with WAL: a crash can lose the last commits but never corrupt the file
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA busy_timeout={timeout * 1000}',
+        f"PRAGMA mmap_size={env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+        'PRAGMA cache_size=-65536',
+        'PRAGMA temp_store=MEMORY',
+    ]
+    return {
+        'timeout': timeout,
+        # Take the write lock at BEGIN: a transaction that reads and then writes cannot
+        # fail on lock upgrade, it queues for up to `timeout` seconds instead
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join(pragmas),
+    }
+
+
+def sqlite_database(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env('DB_NAME', str(base_dir / 'db.sqlite3')),
+        'CONN_MAX_AGE': env_int('DB_CONN_MAX_AGE', 60),
+        'OPTIONS': sqlite_options(env_bool('SQLITE_TUNED', True)),
+    }
+
+
+def postgresql_database():
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env('DB_NAME', 'isansdb'),
+        'USER': env('DB_USER', 'isans'),
+        'PASSWORD': env('DB_PASSWORD', ''),
+        'HOST': env('DB_HOST', 'localhost'),
+        'PORT': env('DB_PORT', '5432'),
+        'CONN_MAX_AGE': env_int('DB_CONN_MAX_AGE', 60),
+        # Persistent connections are pinged before reuse, so a restarted server or a
+        # dropped connection costs one reconnect instead of a failed request
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if env_bool('DB_POOL'):
+        # The pool owns connection lifetime; Django refuses persistent connections with it
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': env_int('DB_POOL_MIN_SIZE', 2),
+            'max_size': env_int('DB_POOL_MAX_SIZE', 10),
+            'timeout': env_int('DB_POOL_TIMEOUT', 10),
+        }
+    return database
+
+
+def replica_databases(primary):
+    replicas = {}
+    locations = [location.strip() for location in env('DB_REPLICAS', '').split(',') if location.strip()]
+    for number, location in enumerate(locations, 1):
+        replica = copy.deepcopy(primary)
+        # Tests read replicas through the primary's test database
+        replica['TEST'] = {'MIRROR': 'default'}
+        if primary['ENGINE'].endswith('sqlite3'):
+            replica['NAME'] = location
+        else:
+            host, _, port = location.partition(':')
+            replica['HOST'] = host
+            replica['PORT'] = port or primary['PORT']
+        replicas['replica' if number == 1 else f'replica{number}'] = replica
+    return replicas
+
+
+def databases(base_dir):
+    engine = env('DB_ENGINE', 'sqlite').lower()
+    if engine in ('postgres', 'postgresql'):
+        primary = postgresql_database()
+    elif engine == 'sqlite':
+        primary = sqlite_database(base_dir)
+    else:
+        raise ValueError(f"Unsupported DB_ENGINE {engine!r}; use 'sqlite' or 'postgresql'.")
+    return {'default': primary, **replica_databases(primary)}
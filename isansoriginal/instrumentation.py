@@ -0,0 +1,247 @@
+"""
+Per-request cost instrumentation.
+
+InstrumentationMiddleware times every request and attributes it to the view class and
+HTTP method that served it. For each request it records:
+
+- wall time
+- the number of SQL queries and the time spent in them, on every database alias
+- time spent building `.data` in serializers that use TimedSerializerMixin
+- response size
+
+Each request is logged as one JSON line on the `isansoriginal.requests` logger (at
+INFO, so only shown with REQUEST_LOG_LEVEL=INFO) and folded into Prometheus histograms
+served by `metrics_view` (mounted at /metrics). The histograms are per process: scrape
+every worker, or run one worker per target.
+
+A request that runs the same SQL shape more than QUERY_REPEAT_THRESHOLD times is
+logged as a likely N+1. Shapes ignore parameter values and IN-list lengths.
+"""
+import hmac
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+logger = logging.getLogger('isansoriginal.requests')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'shapes', 'serializer_time', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper() around every query of the request
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.shapes[IN_LIST.sub('(...)', sql)] += 1
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            label_text = _labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.series = Counter()
+
+    def inc(self, labels):
+        self.series[labels] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{{{_labels(labels)}}} {value}' for labels, value in sorted(self.series.items()))
+        return lines
+
+
+def _labels(labels):
+    names = ('view', 'method', 'status')
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, labels))
+
+
+_registry_lock = threading.Lock()
+REQUESTS = CounterMetric('http_requests_total', 'Requests by view, method and status.')
+REPEATED_QUERIES = CounterMetric('http_repeated_query_requests_total', 'Requests flagged for repeating a query shape.')
+DURATION = Histogram('http_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS)
+QUERY_COUNT = Histogram('http_request_queries', 'SQL queries per request.', QUERY_BUCKETS)
+DB_TIME = Histogram('http_request_db_seconds', 'Time spent in SQL per request.', DURATION_BUCKETS)
+SERIALIZER_TIME = Histogram('http_request_serializer_seconds', 'Time spent in serializers per request.', DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+METRICS = (REQUESTS, REPEATED_QUERIES, DURATION, QUERY_COUNT, DB_TIME, SERIALIZER_TIME, RESPONSE_SIZE)
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent building `.data` to the current request's serializer time.
+    Mix it into the serializers a view renders; outside a request it costs nothing.
+    """
+
+    @property
+    def data(self):
+        metrics = _current.get()
+        if metrics is None:
+            return super().data
+        # A serializer rendered inside another one is already inside the outer timing
+        metrics.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            metrics.serializer_depth -= 1
+            if not metrics.serializer_depth:
+                metrics.serializer_time += time.perf_counter() - start
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        # With many=True the ListSerializer builds .data, so it carries the timer instead
+        if type(serializer) is serializers.ListSerializer:
+            serializer.__class__ = TimedListSerializer
+        return serializer
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.repeat_threshold = settings.QUERY_REPEAT_THRESHOLD
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+
+        view = getattr(request, 'instrumented_view', 'unresolved')
+        size = None if response.streaming else len(response.content)
+        self.record((view, request.method), response.status_code, duration, metrics, size)
+        self.log(request, view, response.status_code, duration, metrics, size)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        request.instrumented_view = (view_class or view_func).__name__
+
+    def record(self, labels, status, duration, metrics, size):
+        with _registry_lock:
+            REQUESTS.inc((*labels, str(status)))
+            DURATION.observe(labels, duration)
+            QUERY_COUNT.observe(labels, metrics.queries)
+            DB_TIME.observe(labels, metrics.db_time)
+            SERIALIZER_TIME.observe(labels, metrics.serializer_time)
+            if size is not None:
+                RESPONSE_SIZE.observe(labels, size)
+            if metrics.shapes and max(metrics.shapes.values()) > self.repeat_threshold:
+                REPEATED_QUERIES.inc(labels)
+
+    def log(self, request, view, status, duration, metrics, size):
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'serializer_ms': round(metrics.serializer_time * 1000, 2),
+            'response_bytes': size,
+        }))
+        repeated = [(sql, count) for sql, count in metrics.shapes.most_common() if count > self.repeat_threshold]
+        for sql, count in repeated:
+            logger.warning(json.dumps({
+                'event': 'repeated_query', 'view': view, 'method': request.method,
+                'path': request.path, 'count': count, 'sql': sql,
+            }))
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except APIException:
+            return False
+        user = authenticated[0] if authenticated else None
+    return bool(user and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition. Requires `Authorization: Bearer <METRICS_TOKEN>`, or a
+    staff user (session or JWT) when no token is configured.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not _is_staff(request):
+        return HttpResponseForbidden()
+    with _registry_lock:
+        lines = [line for metric in METRICS for line in metric.render()]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
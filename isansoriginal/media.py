@@ -0,0 +1,141 @@
+"""
+Production delivery of media and static files.
+
+With SENDFILE_BACKEND set, Django only resolves and authorizes the path and hands the
+byte copying to the front server:
+
+    'nginx'      X-Accel-Redirect to an internal location, e.g.
+                     location /protected/media/ { internal; alias /srv/isans/media/; }
+    'xsendfile'  X-Sendfile with the absolute path (Apache mod_xsendfile, lighttpd)
+
+Without a backend the file is streamed from Python with single-range support; a Range
+header it cannot parse is ignored and the whole file sent. Either way, content-hashed
+names are marked immutable for a year: base.5af6a0c7b1e2.css from
+ManifestStaticFilesStorage, product uploads stored as dress.5af6a0c7b1e2.jpg and their
+variants (dress.5af6a0c7b1e2.thumbnail.webp). Everything else gets a short max-age plus
+ETag and Last-Modified validators.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+# A hex hash before the extension, optionally followed by one variant label
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}(?:\.[a-z]+)?\.[^./]+$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+
+
+def cache_control_for(path):
+    if HASHED_NAME.search(path):
+        return IMMUTABLE
+    return f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _parse_range(header, size):
+    """
+    The (start, end) byte positions of a single-range header, or None when the header is
+    malformed or asks for several ranges and is ignored. Raises RangeNotSatisfiable for a
+    well-formed range that lies outside the file.
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if not length or not size:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve(request, path, document_root, accel_prefix=None):
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found.")
+    if not os.path.isfile(fullpath):
+        raise Http404("File not found.")
+
+    stat = os.stat(fullpath)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    headers = {
+        'Cache-Control': cache_control_for(path),
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+    }
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if (if_none_match and etag in if_none_match) or (
+        not if_none_match and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime)
+    ):
+        return HttpResponseNotModified(headers=headers)
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    backend = settings.SENDFILE_BACKEND
+
+    if backend == 'nginx' and accel_prefix:
+        # nginx serves the body (and any Range request) from its internal location
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path)
+        return response
+    if backend == 'xsendfile':
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Sendfile'] = fullpath
+        return response
+
+    headers['Accept-Ranges'] = 'bytes'
+    range_header = request.META.get('HTTP_RANGE')
+    byte_range = None
+    if range_header and request.method == 'GET':
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except RangeNotSatisfiable:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{stat.st_size}'})
+    if byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _iter_range(fullpath, start, end - start + 1), status=206, content_type=content_type, headers=headers
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+    response = FileResponse(open(fullpath, 'rb'), content_type=content_type, headers=headers)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
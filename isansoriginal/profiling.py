@@ -0,0 +1,157 @@
+"""
+Opt-in production profiling.
+
+ProfilingMiddleware runs cProfile around a request when it carries
+`X-Profile: <PROFILE_TOKEN>` or, with PROFILE_SAMPLE_RATE > 0, for that fraction of
+requests picked at random. Each profile is written to PROFILE_DIR as a .prof file
+(open it with `python -m pstats` or snakeviz); header-triggered requests get the file
+name back in an `X-Profile-Id` response header. Only the newest PROFILE_MAX_FILES
+profiles are kept.
+
+SlowQueryMiddleware logs every SQL statement slower than SLOW_QUERY_MS on the
+`isansoriginal.profiling` logger, with the view that ran it and the project frames of the
+stack that issued it.
+
+Both raise MiddlewareNotUsed when unconfigured, so Django drops them from the chain at
+startup and a disabled hook costs nothing per request.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import time
+import traceback
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('isansoriginal.profiling')
+
+UNSAFE_FILENAME = re.compile(r'[^A-Za-z0-9_.-]+')
+# Logged stacks skip this package: it holds the middleware, not the code that queried
+PROJECT_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.token = settings.PROFILE_TOKEN
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE
+        if not self.token and self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.directory = settings.PROFILE_DIR
+        self.max_files = settings.PROFILE_MAX_FILES
+        os.makedirs(self.directory, exist_ok=True)
+
+    def requested(self, request):
+        header = request.headers.get('X-Profile')
+        return bool(self.token and header and hmac.compare_digest(header, self.token))
+
+    def __call__(self, request):
+        requested = self.requested(request)
+        if not requested and not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler already owns this thread
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        view = getattr(request, 'instrumented_view', None) or request.path
+        name = UNSAFE_FILENAME.sub('_', f"{time.strftime('%Y%m%dT%H%M%S')}-{request.method}-{view}-{elapsed_ms:.0f}ms")
+        name = f"{name.strip('_')[:150]}-{os.getpid()}-{random.getrandbits(32):08x}.prof"
+        profiler.dump_stats(os.path.join(self.directory, name))
+        self.prune()
+        logger.info(json.dumps({
+            'event': 'profile', 'view': view, 'method': request.method, 'path': request.path,
+            'duration_ms': round(elapsed_ms, 2), 'file': name,
+        }))
+        if requested:
+            response['X-Profile-Id'] = name
+        return response
+
+    def prune(self):
+        """Delete the oldest profiles beyond PROFILE_MAX_FILES."""
+        profiles = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.prof') and entry.is_file():
+                    try:
+                        profiles.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+        profiles.sort()
+        for _, path in profiles[:max(len(profiles) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+
+
+class SlowQueryRecorder:
+    def __init__(self, threshold, request):
+        self.threshold = threshold
+        self.request = request
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                self.log(sql, params, elapsed, context['connection'].alias)
+
+    def log(self, sql, params, elapsed, alias):
+        stack = [
+            f'{os.path.relpath(frame.filename, settings.BASE_DIR)}:{frame.lineno} in {frame.name}'
+            for frame in traceback.extract_stack()[:-2]
+            if frame.filename.startswith(str(settings.BASE_DIR))
+            and not frame.filename.startswith(PROJECT_PACKAGE)
+            and 'site-packages' not in frame.filename
+            and not frame.filename.endswith('manage.py')
+        ]
+        logger.warning(json.dumps({
+            'event': 'slow_query',
+            'duration_ms': round(elapsed * 1000, 2),
+            'database': alias,
+            'view': self.view,
+            'method': self.request.method,
+            'path': self.request.path,
+            # Parameters stay out of the log: they carry emails and password hashes
+            'sql': sql,
+            'stack': stack,
+        }))
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_MS <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = settings.SLOW_QUERY_MS / 1000
+
+    def __call__(self, request):
+        recorder = request.slow_query_recorder = SlowQueryRecorder(self.threshold, request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        request.slow_query_recorder.view = (view_class or view_func).__name__
@@ -0,0 +1,139 @@
+"""
+Read-replica routing.
+
+Views that only read opt in with a `replica_reads = True` class attribute; their GET
+requests read from a replica configured in DATABASE_REPLICAS. Reporting code outside a
+request opts in with `with read_from_replica():`. Everything else, and every write,
+uses the primary.
+
+A user who has just written (any successful non-GET request) is pinned to the primary
+for REPLICA_STICKY_SECONDS through a cache key on their user id, so they see their own
+cart update or order even while the replicas lag behind. JWT clients send no cookies,
+so the pin is found by reading the user id from the bearer token before the view runs.
+Pins live in the default cache: set REDIS_URL so a pin made by one worker holds in all.
+
+One replica is picked per request, so its reads never mix replicas that lag by
+different amounts.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db-primary:{user_id}'
+
+# {'replica': reads may use a replica, 'pinned': this user wrote recently,
+#  'alias': the replica picked for this request}
+_routing = ContextVar('db_routing', default=None)
+
+
+def _state(replica=False, pinned=False):
+    return {'replica': replica, 'pinned': pinned, 'alias': None}
+
+
+@contextmanager
+def read_from_replica():
+    token = _routing.set(_state(replica=True))
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def replica_for_read():
+    """The replica alias to read from right now, or None for the primary."""
+    state = _routing.get()
+    if not state or not state['replica'] or state['pinned'] or not settings.DATABASE_REPLICAS:
+        return None
+    # Reads inside a transaction must see its own writes
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    if state['alias'] is None:
+        state['alias'] = random.choice(settings.DATABASE_REPLICAS)
+    return state['alias']
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id=user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id=user_id), False)
+
+
+def user_id(user):
+    # The identifier access tokens carry (SIMPLE_JWT's USER_ID_FIELD), so a pin can be
+    # checked from the token alone
+    return getattr(user, jwt_settings.USER_ID_FIELD)
+
+
+def request_user_id(request):
+    """
+    The id of the user making `request`, from the session or a valid bearer token, without
+    loading the user: DRF authenticates JWT requests only once the view runs.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user_id(user)
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return replica_for_read() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wrote = request.method not in SAFE_METHODS
+        token = _routing.set(_state(pinned=wrote))
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if wrote and response.status_code < 400 and settings.DATABASE_REPLICAS:
+            # DRF hands the user it authenticated back to the Django request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user_id(user))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        state = _routing.get()
+        if (
+            state is None or request.method not in SAFE_METHODS or not settings.DATABASE_REPLICAS
+            or not getattr(view_class, 'replica_reads', False)
+        ):
+            return
+        requester = request_user_id(request)
+        state['replica'] = not (requester is not None and is_pinned(requester))
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+from .db import databases
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,7 +51,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'isansoriginal.instrumentation.InstrumentationMiddleware',
+    'isansoriginal.profiling.ProfilingMiddleware',
+    'isansoriginal.profiling.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'isansoriginal.routing.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,25 +89,29 @@ WSGI_APPLICATION = 'isansoriginal.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql_psycopg2',
-#         'NAME': 'isansdb',
-#         'USER': 'isans',
-#         'PASSWORD': 'isanspassword',
-#         'HOST': 'localhost',
-#         'PORT': '5432',
-#     }
-# }
-#isansadmin123
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Configured from DB_* environment variables, see isansoriginal/db.py
+DATABASES = databases(BASE_DIR)
+
+# Read-only views and reporting read from these; see isansoriginal/routing.py
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['isansoriginal.routing.ReplicaRouter']
+# After a write, the client reads from the primary for this long
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# Set REDIS_URL (needs the redis package) so every worker shares one cache; the local
+# memory fallback is per process, so writes in one worker never reach another's cache
+REDIS_URL = os.getenv('REDIS_URL', '')
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}
+    if REDIS_URL else {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+# How long the delivery directory may be served from cache; without a shared cache
+# this bounds how stale another worker's copy can get
+DELIVERY_CACHE_TIMEOUT = 60 * 60 * 24 if REDIS_URL else 60
 
 
 # Password validation
@@ -180,14 +189,74 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 MAX_UPLOAD_SIZE = 5242880 
 
+# Threads generating resized product image variants after upload
+IMAGE_VARIANT_WORKERS = 2
+
+# Seconds a worker trusts its cached barcode scan entry before re-reading it
+SCAN_INDEX_TTL = 30
+
+# Seconds before a worker reloads its autocomplete index to pick up other workers' writes
+AUTOCOMPLETE_INDEX_TTL = 300
+
+# How long checkout holds per-size stock before the sweeper releases it
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
-if DEBUG:
-    # Media files (User uploads)
-    MEDIA_URL = '/media/'
-    MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# Media files (User uploads)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+
+# Outside DEBUG, file bodies are handed to the front server: 'nginx' (X-Accel-Redirect),
+# 'xsendfile' (X-Sendfile) or '' to stream from Django with range support
+SENDFILE_BACKEND = os.environ.get('SENDFILE_BACKEND', '')
+# Internal nginx locations aliased to MEDIA_ROOT and STATIC_ROOT
+SENDFILE_MEDIA_PREFIX = os.environ.get('SENDFILE_MEDIA_PREFIX', '/protected/media/')
+SENDFILE_STATIC_PREFIX = os.environ.get('SENDFILE_STATIC_PREFIX', '/protected/static/')
+# Cache lifetime for files without a content hash in their name
+MEDIA_CACHE_MAX_AGE = 3600
+
+# A request running one SQL shape more times than this is logged as a likely N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '10'))
+# Bearer token Prometheus must send to read /metrics; unset, only staff users may read it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Opt-in profiling, see isansoriginal/profiling.py. A request is profiled when it sends
+# `X-Profile: <PROFILE_TOKEN>`, or at random for PROFILE_SAMPLE_RATE of requests
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+# Older profiles are deleted once the directory holds this many
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+# Log SQL slower than this many milliseconds; 0 turns the slow-query log off
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        # One JSON line per request at INFO (REQUEST_LOG_LEVEL=INFO); by default only the
+        # repeated-query warnings, see isansoriginal/instrumentation.py
+        'isansoriginal.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'isansoriginal.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 
 
 AUTHENTICATION_BACKENDS = [
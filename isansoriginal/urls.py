@@ -14,10 +14,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from . import instrumentation, media
 
 
 
@@ -25,7 +27,19 @@ urlpatterns = [
     path('admin/', admin.site.urls), 
     path('shop/', include('shop.urls')),  
     path('users/', include('users.urls')),  
+    path('metrics', instrumentation.metrics_view, name='metrics'),
 ]
 
-urlpatterns+=static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns+=static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+if settings.DEBUG:
+    urlpatterns+=static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    urlpatterns+=static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+else:
+    # static() is a no-op outside DEBUG; these hand file bodies to the front server
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), media.serve, {
+            'document_root': settings.STATIC_ROOT, 'accel_prefix': settings.SENDFILE_STATIC_PREFIX,
+        }),
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve, {
+            'document_root': settings.MEDIA_ROOT, 'accel_prefix': settings.SENDFILE_MEDIA_PREFIX,
+        }),
+    ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'isansoriginal.settings')
 
 application = get_wsgi_application()
+
+# Apps are loaded now, so the process-local scan index can be filled before the first request
+from shop.scanner import barcode_index
+
+barcode_index.warm()
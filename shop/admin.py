@@ -1,23 +1,45 @@
 from django.contrib import admin
-from .models import Category, Product, Barcode, DeliveryCompany, Order
+from .inventory import apply_stock_levels, size_stock
+from .models import Category, Product, ProductSize, Barcode, DeliveryCompany, Order, OrderLine
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
     search_fields = ('name',)
 
+class ProductSizeInline(admin.TabularInline):
+    model = ProductSize
+    extra = 0
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'price', 'category', 'barcode', 'sizes')
+    list_display = ('id', 'name', 'price', 'category', 'barcode', 'size_list')
     list_filter = ('category', 'price',)
     search_fields = ('name', 'description',)
     autocomplete_fields = ('category', 'barcode')
     readonly_fields = ('barcode',)
     fieldsets = (
         (None, {
-            'fields': ('name', 'image', 'price', 'description', 'category', 'sizes', 'barcode')
+            'fields': ('name', 'image', 'price', 'description', 'category', 'barcode')
         }),
     )
+    inlines = [ProductSizeInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('product_sizes')
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not ProductSize or not formset.has_changed():
+            return super().save_formset(request, form, formset, change)
+        # Only the change in per-size stock moves the total: checkouts without a
+        # reservation sell from the total alone, and a recount would hand those units back
+        before = size_stock(form.instance.pk)
+        super().save_formset(request, form, formset, change)
+        apply_stock_levels([{'product_id': form.instance.pk, 'delta': size_stock(form.instance.pk) - before}])
+
+    @admin.display(description='Sizes')
+    def size_list(self, obj):
+        return ', '.join(obj.get_sizes_list())
 
 @admin.register(Barcode)
 class BarcodeAdmin(admin.ModelAdmin):
@@ -36,14 +58,25 @@ class DeliveryCompanyAdmin(admin.ModelAdmin):
         }),
     )
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    fields = ('product', 'product_name', 'quantity', 'unit_price', 'line_total')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'delivery_company', 'status', 'created_at', 'updated_at')
+    list_display = ('id', 'user', 'delivery_company', 'status', 'total_price', 'created_at', 'updated_at')
     list_filter = ('status', 'created_at', 'updated_at',)
     search_fields = ('user__email', 'delivery_company__name',)
-    readonly_fields = ('created_at', 'updated_at',)
+    readonly_fields = ('total_price', 'created_at', 'updated_at',)
     fieldsets = (
         (None, {
-            'fields': ('user', 'delivery_company', 'status', 'created_at', 'updated_at')
+            'fields': ('user', 'delivery_company', 'status', 'total_price', 'created_at', 'updated_at')
         }),
     )
+    inlines = [OrderLineInline]
@@ -0,0 +1,241 @@
+"""
+In-process prefix index for search-box autocomplete.
+
+Product and category names are tokenized into a trie; every node keeps the set of
+entries with a token starting at that prefix and lazily caches its top-ranked entries.
+Suggestions are ranked by order volume. The index is loaded from the database on first
+use and then kept current by the signal handlers in shop/signals.py, so answering a
+keystroke never touches the database. Updates are applied once the writing transaction
+commits, so a rolled-back save never reaches the index. Each worker process holds its
+own copy and only sees its own writes, so the whole index is also reloaded once it is
+AUTOCOMPLETE_INDEX_TTL seconds old.
+"""
+import heapq
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from .models import Category, OrderLine, Product
+
+MAX_SUGGESTIONS = 10
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+class _Node:
+    __slots__ = ('children', 'keys', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = set()
+        self.top = None
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._root = _Node()
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _nodes(self, token, create=False):
+        node = self._root
+        for char in token:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return
+                child = node.children[char] = _Node()
+            node = child
+            yield node
+
+    def _find(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _invalidate(self, key):
+        for token in set(tokenize(self._entries[key]['label'])):
+            for node in self._nodes(token):
+                node.top = None
+
+    def add(self, key, label, score=0, **payload):
+        with self._lock:
+            if key in self._entries:
+                self.remove(key)
+            self._entries[key] = {'label': label, 'score': score, **payload}
+            for token in set(tokenize(label)):
+                for node in self._nodes(token, create=True):
+                    node.keys.add(key)
+                    node.top = None
+
+    def remove(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return
+            for token in set(tokenize(self._entries[key]['label'])):
+                for node in self._nodes(token):
+                    node.keys.discard(key)
+                    node.top = None
+            # Empty branches are left in place; they are reused when names are re-added
+            del self._entries[key]
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def add_score(self, key, amount):
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]['score'] += amount
+                self._invalidate(key)
+
+    def _rank(self, keys, limit):
+        entries = self._entries
+        return heapq.nsmallest(limit, keys, key=lambda k: (-entries[k]['score'], entries[k]['label'], k))
+
+    def search(self, query, limit=MAX_SUGGESTIONS):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        limit = min(limit, MAX_SUGGESTIONS)
+        with self._lock:
+            nodes = [self._find(term) for term in terms]
+            if any(node is None for node in nodes):
+                return []
+            if len(nodes) == 1:
+                node = nodes[0]
+                if node.top is None:
+                    node.top = self._rank(node.keys, MAX_SUGGESTIONS)
+                keys = node.top[:limit]
+            else:
+                nodes.sort(key=lambda n: len(n.keys))
+                candidates = nodes[0].keys.intersection(*(n.keys for n in nodes[1:]))
+                keys = self._rank(candidates, limit)
+            return [dict(self._entries[key], key=key) for key in keys]
+
+
+class AutocompleteIndex:
+    """Product and category suggestions ranked by units ordered."""
+
+    def __init__(self):
+        self._index = None
+        self._built_at = None
+        self._product_categories = {}
+        self._lock = threading.RLock()
+
+    @property
+    def is_built(self):
+        return self._index is not None
+
+    def _expired(self):
+        return self._index is None or time.monotonic() - self._built_at >= settings.AUTOCOMPLETE_INDEX_TTL
+
+    def ensure_built(self):
+        if self._expired():
+            with self._lock:
+                if self._expired():
+                    self.rebuild()
+        return self._index
+
+    def rebuild(self):
+        index = PrefixIndex()
+        volumes = dict(
+            OrderLine.objects.values_list('product_id').annotate(total=Sum('quantity')).order_by()
+        )
+        product_categories = {}
+        category_volumes = {}
+        for pk, name, category_id in Product.objects.values_list('id', 'name', 'category_id').iterator():
+            volume = volumes.get(pk, 0)
+            product_categories[pk] = category_id
+            category_volumes[category_id] = category_volumes.get(category_id, 0) + volume
+            index.add(('product', pk), name, volume, type='product', id=pk)
+        for pk, name in Category.objects.values_list('id', 'name'):
+            index.add(('category', pk), name, category_volumes.get(pk, 0), type='category', id=pk)
+        with self._lock:
+            self._product_categories = product_categories
+            self._index = index
+            self._built_at = time.monotonic()
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        return [
+            {'type': entry['type'], 'id': entry['id'], 'name': entry['label']}
+            for entry in self.ensure_built().search(query, limit)
+        ]
+
+    # Incremental updates, applied after commit; ignored until the index has been loaded
+
+    def product_saved(self, product):
+        pk, name, category_id = product.pk, product.name, product.category_id
+        transaction.on_commit(lambda: self._product_saved(pk, name, category_id))
+
+    def product_deleted(self, product):
+        pk = product.pk
+        transaction.on_commit(lambda: self._product_deleted(pk))
+
+    def category_saved(self, category):
+        pk, name = category.pk, category.name
+        transaction.on_commit(lambda: self._category_saved(pk, name))
+
+    def category_deleted(self, category):
+        pk = category.pk
+        transaction.on_commit(lambda: self._category_deleted(pk))
+
+    def product_ordered(self, product_id, quantity):
+        transaction.on_commit(lambda: self._product_ordered(product_id, quantity))
+
+    def _product_saved(self, pk, name, category_id):
+        with self._lock:
+            if self._index is None:
+                return
+            key = ('product', pk)
+            existing = self._index.get(key)
+            volume = existing['score'] if existing else 0
+            old_category = self._product_categories.get(pk)
+            if old_category != category_id:
+                self._index.add_score(('category', old_category), -volume)
+                self._index.add_score(('category', category_id), volume)
+            self._product_categories[pk] = category_id
+            self._index.add(key, name, volume, type='product', id=pk)
+
+    def _product_deleted(self, pk):
+        with self._lock:
+            if self._index is None:
+                return
+            key = ('product', pk)
+            existing = self._index.get(key)
+            if existing:
+                self._index.add_score(('category', self._product_categories.get(pk)), -existing['score'])
+            self._product_categories.pop(pk, None)
+            self._index.remove(key)
+
+    def _category_saved(self, pk, name):
+        with self._lock:
+            if self._index is None:
+                return
+            key = ('category', pk)
+            existing = self._index.get(key)
+            self._index.add(key, name, existing['score'] if existing else 0, type='category', id=pk)
+
+    def _category_deleted(self, pk):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove(('category', pk))
+
+    def _product_ordered(self, product_id, quantity):
+        with self._lock:
+            if self._index is None:
+                return
+            self._index.add_score(('product', product_id), quantity)
+            self._index.add_score(('category', self._product_categories.get(product_id)), quantity)
+
+
+autocomplete_index = AutocompleteIndex()
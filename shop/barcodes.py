@@ -0,0 +1,60 @@
+"""
+Barcode allocation.
+
+A barcode changes hands only through a conditional `UPDATE ... SET status='used' WHERE
+status='unused'`, so two admins (or two import batches) can never claim the same code:
+whichever update lands second matches no row. Allocation of the next free codes uses
+SELECT ... FOR UPDATE SKIP LOCKED where the backend supports it, so concurrent
+allocators take disjoint codes instead of queueing on the same rows.
+"""
+from django.db import connection, transaction
+from .models import Barcode
+
+ALLOCATION_ATTEMPTS = 5
+
+
+class BarcodeUnavailable(Exception):
+    pass
+
+
+class _Conflict(Exception):
+    pass
+
+
+def claim_barcode(barcode_id):
+    """Mark one unused barcode as used. Raises BarcodeUnavailable if it is taken or missing."""
+    if not Barcode.objects.filter(pk=barcode_id, status='unused').update(status='used'):
+        raise BarcodeUnavailable("Barcode does not exist or is already in use.")
+
+
+def claim_barcodes(barcode_ids):
+    """Claim several barcodes at once; all or none are claimed."""
+    barcode_ids = set(barcode_ids)
+    with transaction.atomic():
+        if Barcode.objects.filter(pk__in=barcode_ids, status='unused').update(status='used') != len(barcode_ids):
+            raise BarcodeUnavailable("A barcode was claimed concurrently; retry.")
+
+
+def release_barcodes(barcode_ids):
+    Barcode.objects.filter(pk__in=[pk for pk in barcode_ids if pk]).update(status='unused')
+
+
+def allocate_barcodes(count):
+    """Claim the next `count` unused barcodes in generation order. Returns their ids."""
+    for _ in range(ALLOCATION_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                free = Barcode.objects.filter(status='unused').order_by('id')
+                if connection.features.has_select_for_update_skip_locked:
+                    free = free.select_for_update(skip_locked=True)
+                ids = list(free.values_list('id', flat=True)[:count])
+                if len(ids) < count:
+                    raise BarcodeUnavailable(f"Only {len(ids)} unused barcodes are available.")
+                # Without row locks a concurrent allocator may have taken some of these;
+                # roll back and pick again rather than hand out a partial set
+                if Barcode.objects.filter(pk__in=ids, status='unused').update(status='used') != count:
+                    raise _Conflict
+                return ids
+        except _Conflict:
+            continue
+    raise BarcodeUnavailable("Could not allocate barcodes under concurrent load; retry.")
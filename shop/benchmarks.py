@@ -0,0 +1,206 @@
+"""
+Microbenchmarks for the hot endpoints.
+
+Each case drives one endpoint through the DRF test client against seeded data in a
+throwaway database and reports latency percentiles and the number of queries one request
+runs. Results can be saved as a JSON baseline and later runs compared against it: a case
+regresses when its p50 or p95 grows by more than the threshold, or when it runs more
+queries than before (query counts are deterministic, so any increase counts).
+"""
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from contextlib import ExitStack, contextmanager
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from users.models import CustomUser
+from .models import Cart, DeliveryCompany, Product
+from .seed import ADMIN_EMAIL, PASSWORD, seed
+
+PERCENTILES = (50, 95, 99)
+REGRESSION_METRICS = ('p50', 'p95')
+
+
+@contextmanager
+def throwaway_database(options=None):
+    """
+    Create, migrate and finally drop a test copy of the default database. SQLite copies
+    are files, never in-memory, so concurrent connections behave as in production.
+    `options` replaces the connection OPTIONS for the duration.
+    """
+    settings_dict = connection.settings_dict
+    saved_options, saved_test = settings_dict['OPTIONS'], dict(settings_dict['TEST'])
+    tmpdir = None
+    if connection.vendor == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='shop-bench-')
+        settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    if options is not None:
+        settings_dict['OPTIONS'] = options
+
+    setup_test_environment()
+    connection.close()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        settings_dict['OPTIONS'], settings_dict['TEST'] = saved_options, saved_test
+        teardown_test_environment()
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+@contextmanager
+def quiet_request_log():
+    """Silence the per-request log lines, which would drown a benchmark report."""
+    request_logger = logging.getLogger('isansoriginal.requests')
+    level = request_logger.level
+    request_logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        request_logger.setLevel(level)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Case(ABC):
+    """One endpoint. `prepare` runs untimed before every request and returns its kwargs."""
+    iterations = None
+
+    def __init__(self, client):
+        self.client = client
+
+    def prepare(self):
+        return {}
+
+    @abstractmethod
+    def request(self, **kwargs):
+        """Send one request and return the response."""
+
+
+class GetProductsCase(Case):
+    def request(self):
+        return self.client.get('/shop/get-products/')
+
+
+class CartCase(Case):
+    def __init__(self, client):
+        super().__init__(client)
+        customer = CustomUser.objects.filter(carts__isnull=False).order_by('email').first()
+        client.force_authenticate(customer)
+
+    def request(self):
+        return self.client.get('/shop/cart/')
+
+
+class CheckoutCase(Case):
+    def __init__(self, client):
+        super().__init__(client)
+        self.customer = CustomUser.objects.filter(is_staff=False).order_by('email').first()
+        self.products = list(Product.objects.filter(quantity__gte=100).order_by('pk')[:3])
+        Product.objects.filter(pk__in=[product.pk for product in self.products]).update(quantity=10 ** 9)
+        self.company = DeliveryCompany.objects.order_by('pk').first()
+        client.force_authenticate(self.customer)
+
+    def prepare(self):
+        Cart.objects.filter(user=self.customer).delete()
+        Cart.objects.bulk_create([Cart(user=self.customer, product=product, quantity=1) for product in self.products])
+        return {}
+
+    def request(self):
+        return self.client.post('/shop/orders/', {'delivery_company_id': self.company.pk}, format='json')
+
+
+class OrderStatisticsCase(Case):
+    def __init__(self, client):
+        super().__init__(client)
+        client.force_authenticate(CustomUser.objects.get(email=ADMIN_EMAIL))
+
+    def request(self):
+        return self.client.get('/shop/admin-orders/statistics/')
+
+
+class LoginCase(Case):
+    # Password hashing is deliberately slow; a few samples are enough
+    iterations = 10
+
+    def request(self):
+        return self.client.post('/users/login/', {'email': 'user0@seed.example', 'password': PASSWORD}, format='json')
+
+
+CASES = {
+    'get_products': GetProductsCase,
+    'cart': CartCase,
+    'checkout': CheckoutCase,
+    'order_statistics': OrderStatisticsCase,
+    'login': LoginCase,
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(case, iterations, warmup=3):
+    iterations = min(iterations, case.iterations or iterations)
+    for _ in range(warmup):
+        case.request(**case.prepare())
+
+    kwargs = case.prepare()
+    queries = QueryCounter()
+    # Every alias, as the request instrumentation counts them: replica reads included
+    with ExitStack() as stack:
+        for db in connections.all():
+            stack.enter_context(db.execute_wrapper(queries))
+        response = case.request(**kwargs)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{type(case).__name__} answered {response.status_code}: {response.content[:200]!r}")
+
+    samples = []
+    for _ in range(iterations):
+        kwargs = case.prepare()
+        start = time.perf_counter()
+        case.request(**kwargs)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    result = {f'p{pct}': round(percentile(samples, pct), 3) for pct in PERCENTILES}
+    result.update(mean=round(statistics.fmean(samples), 3), iterations=iterations, queries=queries.count)
+    return result
+
+
+def run(names=None, scale=1, seed_value=0, iterations=50):
+    """Seed a throwaway database and measure each case. Returns {case: result}."""
+    with quiet_request_log(), throwaway_database():
+        seed(scale=scale, seed=seed_value)
+        return {name: measure(CASES[name](APIClient()), iterations) for name in names or CASES}
+
+
+def compare(results, baseline, threshold):
+    """Regressions of `results` against `baseline`, as human-readable lines."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            if result[metric] > before[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {before[metric]:.2f}ms -> {result[metric]:.2f}ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+    return regressions
@@ -0,0 +1,297 @@
+"""
+Streaming product import/export in CSV or NDJSON.
+
+Imports are parsed row by row and written in batches: each batch resolves categories,
+barcodes and existing products with one query apiece and writes with bulk_create /
+bulk_update, so Product.save() and its full_clean() never run per row. Validation
+mirrors the model constraints and errors are reported per source row. A barcode of
+'auto' assigns the next free code; a batch's allocations are claimed together.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from .autocomplete import autocomplete_index
+from .barcodes import BarcodeUnavailable, allocate_barcodes, claim_barcodes, release_barcodes
+from .inventory import _integer
+from .models import Barcode, Category, Product, ProductSize
+from .scanner import barcode_index
+
+FORMATS = ('csv', 'ndjson')
+AUTO_BARCODE = 'auto'
+EXPORT_FIELDS = ['id', 'name', 'price', 'description', 'category', 'sizes', 'quantity', 'barcode']
+PRODUCT_FIELDS = ['name', 'price', 'description', 'category', 'quantity', 'is_in_stock', 'barcode']
+
+# One validated source row awaiting its batch write
+_Row = namedtuple('_Row', ['number', 'product', 'sizes', 'barcode_change', 'code', 'auto', 'created'])
+
+
+def detect_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    return {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}.get(extension, default)
+
+
+def iter_records(stream, file_format):
+    """Yield (row_number, record) from a binary stream without loading it into memory."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        # Row 1 is the header
+        for row_number, row in enumerate(csv.DictReader(text), start=2):
+            yield row_number, row
+    else:
+        for row_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield row_number, record if isinstance(record, dict) else None
+
+
+def _parse_sizes(value):
+    if value in (None, ''):
+        return [], []
+    if isinstance(value, str):
+        value = value.split(',')
+    sizes = list(dict.fromkeys(str(size).strip() for size in value if str(size).strip()))
+    return sizes, [size for size in sizes if size not in Product.SIZE_ORDER]
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self._claimed_codes = set()
+
+    @property
+    def report(self):
+        return {'created': self.created, 'updated': self.updated, 'errors': self.errors}
+
+    def run(self, records):
+        batch = []
+        for row_number, record in records:
+            if record is None:
+                self.errors.append({'row': row_number, 'errors': {'row': 'Could not parse row.'}})
+                continue
+            batch.append((row_number, record))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        return self.report
+
+    def _import_batch(self, batch):
+        category_names = {str(record.get('category') or '').strip() for _, record in batch}
+        categories = {}
+        for category in Category.objects.filter(name__in=category_names).order_by('-id'):
+            categories[category.name] = category
+
+        codes = {str(record.get('barcode') or '').strip() for _, record in batch} - {'', AUTO_BARCODE}
+        barcodes = {
+            code: (pk, status, product_id)
+            for pk, code, status, product_id in Barcode.objects.filter(code__in=codes).values_list(
+                'id', 'code', 'status', 'product'
+            )
+        }
+
+        ids = {int(record['id']) for _, record in batch if str(record.get('id') or '').isdigit()}
+        existing = Product.objects.in_bulk(ids)
+
+        # A rolled-back write gives back the codes its rows took in _build
+        claimed_codes = set(self._claimed_codes)
+        rows = []
+        for row_number, record in batch:
+            product, row_sizes, barcode_change, errors = self._build(record, categories, barcodes, existing)
+            if errors:
+                self.errors.append({'row': row_number, 'errors': errors})
+                continue
+            code = str(record.get('barcode') or '').strip()
+            auto = code == AUTO_BARCODE and not product.barcode_id
+            rows.append(_Row(
+                row_number, product, row_sizes, barcode_change, code if barcode_change else None, auto, not product.pk
+            ))
+
+        while rows:
+            try:
+                self._write(rows)
+                break
+            except BarcodeUnavailable as e:
+                # Only the rows whose barcode could not be had fail; the rest are written again
+                failed = self._barcode_failures(rows, str(e))
+                for row_number, message in failed.items():
+                    self.errors.append({'row': row_number, 'errors': {'barcode': message}})
+                rows = [row for row in rows if row.number not in failed]
+                self._claimed_codes = claimed_codes | {row.code for row in rows if row.code}
+        if not rows:
+            return
+
+        # bulk writes skip the post_save signals that keep the autocomplete and scan indexes current
+        for row in rows:
+            autocomplete_index.product_saved(row.product)
+        barcode_index.invalidate_products([row.product.pk for row in rows if not row.created])
+
+        self.created += sum(1 for row in rows if row.created)
+        self.updated += sum(1 for row in rows if not row.created)
+
+    def _write(self, rows):
+        claims = [row.barcode_change[0] for row in rows if row.barcode_change]
+        releases = [row.barcode_change[1] for row in rows if row.barcode_change and row.barcode_change[1]]
+        allocate = [row.product for row in rows if row.auto]
+        try:
+            with transaction.atomic():
+                if claims:
+                    claim_barcodes(claims)
+                if releases:
+                    release_barcodes(releases)
+                if allocate:
+                    for product, barcode_id in zip(allocate, allocate_barcodes(len(allocate))):
+                        product.barcode_id = barcode_id
+
+                created = Product.objects.bulk_create([row.product for row in rows if row.created])
+                updated = [row.product for row in rows if not row.created]
+                Product.objects.bulk_update(updated, PRODUCT_FIELDS)
+                self._write_sizes(created, updated, {id(row.product): row.sizes for row in rows})
+        except BarcodeUnavailable:
+            for product in allocate:
+                product.barcode_id = None
+            raise
+
+    def _barcode_failures(self, rows, message):
+        """Map the row numbers that made a rolled-back write fail to their error message."""
+        claims = {row.barcode_change[0]: row for row in rows if row.barcode_change}
+        taken = Barcode.objects.filter(pk__in=claims).exclude(status='unused').values_list('id', flat=True)
+        failed = {claims[pk].number: f"Barcode {claims[pk].code} is already in use." for pk in taken}
+        if not failed:
+            # Otherwise the free pool could not cover the 'auto' rows
+            failed = {row.number: message for row in rows if row.auto}
+        return failed or {row.number: message for row in rows}
+
+    def _build(self, record, categories, barcodes, existing):
+        errors = {}
+        product_id = record.get('id')
+        if product_id not in (None, ''):
+            product = existing.get(int(product_id)) if str(product_id).isdigit() else None
+            if product is None:
+                return None, None, None, {'id': f'Product {product_id} does not exist.'}
+        else:
+            product = Product()
+
+        name = str(record.get('name') or '').strip()
+        if not name or len(name) > 100:
+            errors['name'] = 'Name is required and must be at most 100 characters.'
+        product.name = name
+
+        try:
+            price = Decimal(str(record.get('price'))).quantize(Decimal('0.01'))
+            if price < 0 or len(price.as_tuple().digits) > 10:
+                raise InvalidOperation
+            product.price = price
+        except (InvalidOperation, ValueError):
+            errors['price'] = 'Price must be a non-negative number with at most 10 digits.'
+
+        description = str(record.get('description') or '').strip()
+        if not description:
+            errors['description'] = 'Description is required.'
+        product.description = description
+
+        category = categories.get(str(record.get('category') or '').strip())
+        if category is None:
+            errors['category'] = f"Category '{record.get('category')}' does not exist."
+        else:
+            product.category = category
+
+        try:
+            quantity = _integer(record.get('quantity') or 0)
+            if quantity < 0:
+                raise ValueError
+            product.quantity = quantity
+            product.is_in_stock = quantity > 0
+        except (TypeError, ValueError):
+            errors['quantity'] = 'Quantity must be a non-negative integer.'
+
+        # Updates leave sizes alone when the column is missing
+        sizes, invalid_sizes = _parse_sizes(record.get('sizes'))
+        if 'sizes' not in record and product.pk:
+            sizes = None
+        if invalid_sizes:
+            errors['sizes'] = f"The following sizes are invalid: {', '.join(invalid_sizes)}"
+
+        barcode_change = None
+        code = str(record.get('barcode') or '').strip()
+        if code and code != AUTO_BARCODE:
+            barcode = barcodes.get(code)
+            if barcode is None:
+                errors['barcode'] = f"Barcode {code} does not exist."
+            elif barcode[2] is not None and barcode[2] == product.pk:
+                pass  # Already assigned to this product
+            elif barcode[1] != 'unused' or code in self._claimed_codes:
+                errors['barcode'] = f"Barcode {code} is already in use."
+            elif not errors:
+                self._claimed_codes.add(code)
+                barcode_change = (barcode[0], product.barcode_id)
+                product.barcode_id = barcode[0]
+
+        return product, sizes, barcode_change, errors
+
+    def _write_sizes(self, created, updated, sizes):
+        updated = [product for product in updated if sizes[id(product)] is not None]
+        keep = {(product.pk, size) for product in created + updated for size in sizes[id(product)]}
+        if updated:
+            stale = [
+                pk for pk, product_id, size in ProductSize.objects.filter(
+                    product_id__in=[product.pk for product in updated]
+                ).values_list('id', 'product_id', 'size')
+                if (product_id, size) not in keep
+            ]
+            ProductSize.objects.filter(pk__in=stale).delete()
+        ProductSize.objects.bulk_create(
+            [ProductSize(product_id=product_id, size=size) for product_id, size in keep],
+            ignore_conflicts=True
+        )
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+    def write(self, value):
+        return value
+
+
+def export_lines(file_format, chunk_size=1000):
+    """Yield the whole catalog as CSV or NDJSON lines, one keyset-paginated chunk at a time."""
+    writer = csv.writer(_Echo())
+    if file_format == 'csv':
+        yield writer.writerow(EXPORT_FIELDS)
+
+    rows = Product.objects.order_by('id').values_list(
+        'id', 'name', 'price', 'description', 'category__name', 'quantity', 'barcode__code'
+    )
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        sizes = {}
+        for product_id, size in ProductSize.objects.filter(product_id__in=[row[0] for row in chunk]).values_list(
+            'product_id', 'size'
+        ):
+            sizes.setdefault(product_id, []).append(size)
+
+        for pk, name, price, description, category, quantity, barcode in chunk:
+            product_sizes = sorted(sizes.get(pk, []), key=Product.SIZE_ORDER.get)
+            if file_format == 'csv':
+                yield writer.writerow([
+                    pk, name, price, description, category, ','.join(product_sizes), quantity, barcode or ''
+                ])
+            else:
+                yield json.dumps({
+                    'id': pk, 'name': name, 'price': str(price), 'description': description,
+                    'category': category, 'sizes': product_sizes, 'quantity': quantity, 'barcode': barcode,
+                }) + '\n'
@@ -0,0 +1,150 @@
+"""
+Delivery company directory for checkout.
+
+Companies created by staff are the global directory every customer sees. That list is
+cached under a version number that the DeliveryCompany signal handlers bump whenever a
+staff-created company is saved or deleted, so stale entries are never read again and
+simply expire; customers adding their own companies leave the cached list alone. A customer's own and
+preferred companies are fetched together in one query and merged on top. Lookups by
+state or id use per-process maps built from the cached list and rebuilt whenever the
+version moves.
+
+The cache is Django's default cache. With a shared backend (REDIS_URL) a write in one
+worker invalidates every worker at once. With the per-process default, other workers
+only notice once their version and list expire after DELIVERY_CACHE_TIMEOUT seconds.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Exists, OuterRef, Q
+from users.models import UserPreferredDeliveryCompany
+from .models import DeliveryCompany
+
+FIELDS = ['id', 'name', 'contact_number', 'address', 'branch', 'state', 'website']
+VERSION_KEY = 'delivery-directory:version'
+GLOBAL_KEY = 'delivery-directory:global:{version}'
+
+_maps = {'version': None, 'states': {}, 'ids': {}}
+_maps_lock = threading.Lock()
+
+
+def _version():
+    # Versions start from the clock so an expired counter never revisits old entries;
+    # expiring moves every process that cannot see the bumps onto a fresh list
+    return cache.get_or_set(VERSION_KEY, time.time_ns, timeout=settings.DELIVERY_CACHE_TIMEOUT)
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=settings.DELIVERY_CACHE_TIMEOUT)
+
+
+def global_companies():
+    """Staff-managed companies as dicts, ordered by state and name."""
+    key = GLOBAL_KEY.format(version=_version())
+    companies = cache.get(key)
+    if companies is None:
+        companies = list(
+            DeliveryCompany.objects.filter(created_by__is_staff=True).order_by('state', 'name', 'id').values(*FIELDS)
+        )
+        cache.set(key, companies, settings.DELIVERY_CACHE_TIMEOUT)
+    return companies
+
+
+def _normalize(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+def _global_maps():
+    version = _version()
+    if _maps['version'] != version:
+        with _maps_lock:
+            if _maps['version'] != version:
+                companies = global_companies()
+                states = {}
+                for company in companies:
+                    states.setdefault(_normalize(company['state']), []).append(company)
+                _maps.update(version=version, states=states, ids={company['id']: company for company in companies})
+    return _maps
+
+
+def _user_companies(user, **filters):
+    preferred = UserPreferredDeliveryCompany.objects.filter(user=user, delivery_company=OuterRef('pk'))
+    return DeliveryCompany.objects.annotate(is_preferred=Exists(preferred)).filter(
+        Q(created_by=user) | Q(is_preferred=True), **filters
+    ).values(*FIELDS, 'is_preferred', 'created_by')
+
+
+def directory(user, global_list=None):
+    """
+    Every company `user` can ship with: preferred first, then the rest by state and name.
+    Each entry carries `source` ('global', 'own' or 'shared') and `is_preferred`.
+    """
+    if global_list is None:
+        global_list = global_companies()
+    companies = {company['id']: dict(company, source='global', is_preferred=False) for company in global_list}
+    for company in _user_companies(user):
+        entry = companies.get(company['id'])
+        if entry is None:
+            entry = companies[company['id']] = {field: company[field] for field in FIELDS}
+            entry['source'] = 'own' if company['created_by'] == user.pk else 'shared'
+        entry['is_preferred'] = company['is_preferred']
+    return sorted(
+        companies.values(),
+        key=lambda company: (not company['is_preferred'], company['state'], company['name'], company['id'])
+    )
+
+
+def find_companies(user, state=None, branch=None, name=None):
+    """
+    Directory entries matching a state and branch (case-insensitive) and a name prefix.
+    Without a state every company is considered.
+    """
+    if state:
+        candidates = _global_maps()['states'].get(_normalize(state), [])
+    else:
+        candidates = global_companies()
+    branch, name = _normalize(branch), _normalize(name)
+
+    def matches(company):
+        return (
+            (not state or _normalize(company['state']) == _normalize(state))
+            and (not branch or _normalize(company['branch']) == branch)
+            and (not name or _normalize(company['name']).startswith(name))
+        )
+
+    return [company for company in directory(user, candidates) if matches(company)]
+
+
+def get_company(user, company_id):
+    """
+    Return the DeliveryCompany `user` may check out with, or None. Global companies are
+    answered from the cache; the instance is built from cached values without a query.
+    """
+    try:
+        company_id = int(company_id)
+    except (TypeError, ValueError):
+        return None
+    company = _global_maps()['ids'].get(company_id)
+    if company is None:
+        company = _user_companies(user, pk=company_id).first()
+    if company is None:
+        return None
+    db = router.db_for_read(DeliveryCompany)
+    return DeliveryCompany.from_db(db, FIELDS, [company[field] for field in FIELDS])
+
+
+def add_preferred(user, company_id):
+    """Mark a company the user can see as preferred. Returns False if it is not in their directory."""
+    if get_company(user, company_id) is None:
+        return False
+    UserPreferredDeliveryCompany.objects.get_or_create(user=user, delivery_company_id=int(company_id))
+    return True
+
+
+def remove_preferred(user, company_id):
+    return bool(UserPreferredDeliveryCompany.objects.filter(user=user, delivery_company_id=company_id).delete()[0])
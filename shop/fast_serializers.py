@@ -0,0 +1,167 @@
+"""
+Read-only serializers for the large list endpoints.
+
+These follow DRF's read-only BaseSerializer pattern. Each one takes a queryset, reads only
+the columns it renders with `.values()` and builds plain dicts, with every per-field
+conversion resolved once at import instead of a field object walking each row. The JSON
+they render is byte-for-byte the same as the ModelSerializer each one replaces; the
+equivalence tests in shop/tests.py hold them to that.
+"""
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+from isansoriginal.instrumentation import TimedSerializerMixin
+from .images import variant_names
+from .models import OrderLine, Product, ProductSize
+
+
+def _nullable(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+# The conversions ModelSerializer would pick for these model fields
+price = _nullable(serializers.DecimalField(max_digits=10, decimal_places=2).to_representation)
+amount = _nullable(serializers.DecimalField(max_digits=12, decimal_places=2).to_representation)
+timestamp = _nullable(serializers.DateTimeField().to_representation)
+
+
+class ValuesSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    """
+    Renders a queryset as a list of dicts. `columns` lists (output key, values() lookup,
+    conversion or None) in output order; serializers with nested output set `lookups`
+    and build their rows in to_representation instead.
+    """
+    columns = ()
+    lookups = None
+
+    def rows(self, queryset):
+        lookups = self.lookups or [lookup for _, lookup, _ in self.columns]
+        # Instances are never built, so related-object loading has nothing to attach to
+        return queryset.select_related(None).prefetch_related(None).values(*lookups)
+
+    def to_representation(self, queryset):
+        columns = self.columns
+        return [
+            {key: row[lookup] if convert is None else convert(row[lookup]) for key, lookup, convert in columns}
+            for row in self.rows(queryset)
+        ]
+
+
+class FastBarcodeSerializer(ValuesSerializer):
+    """BarcodeSerializer(many=True)."""
+    columns = (
+        ('id', 'id', None),
+        ('code', 'code', None),
+        ('status', 'status', None),
+    )
+
+    def rows(self, queryset):
+        # Also accepts a page of rows the paginator already fetched with these columns
+        return queryset if isinstance(queryset, list) else super().rows(queryset)
+
+
+class FastProductSerializer(ValuesSerializer):
+    """ProductSerializer(many=True), read side."""
+    lookups = [
+        'id', 'name', 'image', 'image_variants_ready', 'price', 'description', 'category__name', 'barcode_id', 'quantity',
+        'rating_count', 'rating_sum', *Product.RATING_HISTOGRAM_FIELDS.values(),
+    ]
+
+    def url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def to_representation(self, queryset):
+        products = list(self.rows(queryset))
+
+        stock = {product['id']: [] for product in products}
+        entries = ProductSize.objects.filter(product_id__in=list(stock)).values_list('product_id', 'size', 'quantity')
+        for product_id, size, quantity in entries:
+            stock[product_id].append((Product.SIZE_ORDER[size], size, quantity))
+
+        data = []
+        for product in products:
+            sizes = sorted(stock[product['id']])
+            image = product['image']
+            rating_count = product['rating_count']
+            data.append({
+                'id': product['id'],
+                'name': product['name'],
+                'image': self.url(image) if image else None,
+                'image_variants': {
+                    variant: {fmt: self.url(name) for fmt, name in names.items()}
+                    for variant, names in variant_names(image).items()
+                } if image and product['image_variants_ready'] else None,
+                'price': price(product['price']),
+                'description': product['description'],
+                'category': product['category__name'],
+                'sizes': [size for _, size, _ in sizes],
+                'size_stock': {size: quantity for _, size, quantity in sizes},
+                'barcode': product['barcode_id'],
+                'quantity': product['quantity'],
+                'rating_count': rating_count,
+                'average_rating': float(round(product['rating_sum'] / rating_count, 2)) if rating_count else None,
+                'rating_histogram': {
+                    str(rating): product[field] for rating, field in Product.RATING_HISTOGRAM_FIELDS.items()
+                },
+            })
+        return data
+
+
+class FastOrderLineSerializer(ValuesSerializer):
+    """OrderLineSerializer(many=True), plus the order id for grouping."""
+    columns = (
+        ('order', 'order_id', None),
+        ('id', 'id', None),
+        ('product', 'product_id', None),
+        ('product_name', 'product_name', None),
+        ('quantity', 'quantity', None),
+        ('unit_price', 'unit_price', price),
+        ('line_total', 'line_total', amount),
+    )
+
+
+class FastAdminOrderHistorySerializer(ValuesSerializer):
+    """AdminOrderHistorySerializer(many=True)."""
+    lookups = [
+        'id', 'status', 'total_price', 'created_at', 'updated_at',
+        'user__id', 'user__email', 'user__first_name', 'user__phone_number', 'user__street_address',
+        'user__city', 'user__state', 'user__zip_code', 'user__country',
+        'delivery_company__id', 'delivery_company__name',
+    ]
+
+    def to_representation(self, queryset):
+        orders = list(self.rows(queryset))
+
+        lines = {order['id']: [] for order in orders}
+        for line in FastOrderLineSerializer(OrderLine.objects.filter(order_id__in=list(lines))).data:
+            lines[line.pop('order')].append(line)
+
+        data = []
+        for order in orders:
+            company_id = order['delivery_company__id']
+            data.append({
+                'id': order['id'],
+                'user_details': {
+                    'id': order['user__id'],
+                    'email': order['user__email'],
+                    'first_name': order['user__first_name'],
+                    'phone_number': order['user__phone_number'],
+                    'shipping_address': {
+                        'street': order['user__street_address'],
+                        'city': order['user__city'],
+                        'state': order['user__state'],
+                        'zip_code': order['user__zip_code'],
+                        'country': order['user__country'],
+                    },
+                },
+                'lines': lines[order['id']],
+                'delivery_company': {
+                    'id': company_id, 'name': order['delivery_company__name'],
+                } if company_id is not None else None,
+                'status': order['status'],
+                'total_price': amount(order['total_price']),
+                'created_at': timestamp(order['created_at']),
+                'updated_at': timestamp(order['updated_at']),
+            })
+        return data
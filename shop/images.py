@@ -0,0 +1,142 @@
+"""
+Resized product image variants.
+
+Every uploaded product image gets thumbnail/card/detail renditions, each in the
+original format (JPEG or PNG) and WebP, stored beside the original as
+`<name>.<variant>.<ext>`. Names are derived from the original's name, so serializers
+can build variant URLs without touching storage; they only do so once
+Product.image_variants_ready says the files exist. Generation runs in a small thread
+pool after the upload's transaction commits; Pillow releases the GIL while resizing
+and encoding. Variants of a replaced image are deleted the same way.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels; images are never upscaled
+VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'detail': 1200,
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2), thread_name_prefix='image-variants'
+)
+
+
+def _fallback_extension(name):
+    extension = os.path.splitext(name)[1].lower()
+    return extension if extension in ('.jpg', '.jpeg', '.png') else '.jpg'
+
+
+def variant_name(name, variant, webp=False):
+    root = os.path.splitext(name)[0]
+    return f"{root}.{variant}{'.webp' if webp else _fallback_extension(name)}"
+
+
+def variant_names(name):
+    return {
+        variant: {'default': variant_name(name, variant), 'webp': variant_name(name, variant, webp=True)}
+        for variant in VARIANTS
+    }
+
+
+def variant_urls(image, ready=True, storage=default_storage):
+    if not image or not ready:
+        return None
+    return {
+        variant: {fmt: storage.url(name) for fmt, name in names.items()}
+        for variant, names in variant_names(image.name).items()
+    }
+
+
+def has_variants(name, storage=default_storage):
+    return storage.exists(variant_name(name, 'thumbnail', webp=True))
+
+
+def generate_variants(name, storage=default_storage, force=False):
+    """Write every variant of the stored image `name`. Returns the number of files written."""
+    if not force and has_variants(name, storage):
+        return 0
+
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        # JPEG decoders can downscale while decoding, which is far cheaper than resizing later
+        image.draft('RGB', (max(VARIANTS.values()),) * 2)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    fallback_format = 'PNG' if _fallback_extension(name) == '.png' else 'JPEG'
+    if fallback_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA')
+
+    written = 0
+    for variant, edge in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=2.0)
+        encodings = [
+            (variant_name(name, variant), fallback_format, {'quality': 85, 'optimize': True, 'progressive': True}
+             if fallback_format == 'JPEG' else {'optimize': True}),
+            (variant_name(name, variant, webp=True), 'WEBP', {'quality': 80, 'method': 4}),
+        ]
+        for target, image_format, options in encodings:
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            # Variant names are deterministic, so replace rather than let storage rename
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written += 1
+    return written
+
+
+def delete_variants(name, storage=default_storage):
+    """Remove every variant of `name`. Returns the number of files deleted."""
+    deleted = 0
+    for names in variant_names(name).values():
+        for target in names.values():
+            if storage.exists(target):
+                storage.delete(target)
+                deleted += 1
+    return deleted
+
+
+def _generate_logged(name):
+    from .models import Product
+
+    try:
+        generate_variants(name)
+        # Only products still showing this image; a newer upload has its own job
+        Product.objects.filter(image=name).update(image_variants_ready=True)
+    except Exception:
+        logger.exception("Could not generate image variants for %s", name)
+    finally:
+        close_old_connections()
+
+
+def _delete_logged(name):
+    try:
+        delete_variants(name)
+    except Exception:
+        logger.exception("Could not delete image variants for %s", name)
+
+
+def schedule_variants(name):
+    """Generate variants in the worker pool once the current transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_generate_logged, name))
+
+
+def schedule_variant_deletion(name):
+    """Delete the variants of a replaced image once the current transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_delete_logged, name))
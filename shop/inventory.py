@@ -0,0 +1,283 @@
+"""
+Stock accounting with conditional UPDATE statements.
+
+Every decrement is `UPDATE ... SET quantity = quantity - n WHERE quantity >= n`, so two
+checkouts racing for the last unit can never both succeed and no row is read, modified
+in Python and written back. ProductSize.quantity holds per-size stock and
+Product.quantity the product total; reservations move both together. Cart lines carry
+no size, so a checkout without a reservation takes units from the total alone: the total
+is what sells, and it is never recomputed from the sizes.
+"""
+import uuid
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Product, ProductSize, StockReservation
+from .scanner import barcode_index
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+class ReservationUnavailable(Exception):
+    pass
+
+
+def _in_stock_after(quantity):
+    # Evaluated against the pre-update quantity inside the same UPDATE
+    return Case(When(quantity__gt=quantity, then=Value(True)), default=Value(False))
+
+
+def deduct_stock(product_id, quantity):
+    """Atomically take `quantity` units of a product. Returns False if not enough is left."""
+    if not Product.objects.filter(pk=product_id, quantity__gte=quantity).update(
+        quantity=F('quantity') - quantity,
+        is_in_stock=_in_stock_after(quantity),
+    ):
+        return False
+    barcode_index.invalidate_products([product_id])
+    return True
+
+
+def set_stock(product_id, quantity):
+    """Overwrite a product's stock level. Returns False if the product does not exist."""
+    if not Product.objects.filter(pk=product_id).update(quantity=quantity, is_in_stock=quantity > 0):
+        return False
+    barcode_index.invalidate_products([product_id])
+    return True
+
+
+def _integer(value):
+    # int() would quietly accept True and truncate 2.5
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    return int(value)
+
+
+def apply_stock_levels(records, batch_size=500):
+    """
+    Apply warehouse stock records in one transaction. Each record is a dict with
+    'product_id' or 'barcode' and either an absolute 'quantity' or a signed 'delta'
+    (results are clamped at zero). Each batch is a single UPDATE ... SET quantity = CASE,
+    with is_in_stock recomputed in the same statement.
+    Returns (updated_count, not_found_identifiers, errors).
+    """
+    errors = []
+    parsed = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict) or ('product_id' in record) == ('barcode' in record):
+            errors.append({'index': index, 'error': "Provide exactly one of 'product_id' or 'barcode'."})
+            continue
+        if ('quantity' in record) == ('delta' in record):
+            errors.append({'index': index, 'error': "Provide exactly one of 'quantity' or 'delta'."})
+            continue
+        try:
+            amount = _integer(record['quantity'] if 'quantity' in record else record['delta'])
+            key = ('id', _integer(record['product_id'])) if 'product_id' in record else ('code', str(record['barcode']))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'Identifiers and amounts must be integers.'})
+            continue
+        if 'quantity' in record and amount < 0:
+            errors.append({'index': index, 'error': 'Quantity must be non-negative.'})
+            continue
+        parsed.append((key, 'set' if 'quantity' in record else 'add', amount))
+
+    ids = {value for kind, value in (key for key, _, _ in parsed) if kind == 'id'}
+    codes = {value for kind, value in (key for key, _, _ in parsed) if kind == 'code'}
+    known_ids = set(Product.objects.filter(pk__in=ids).values_list('id', flat=True))
+    products_by_code = dict(Product.objects.filter(barcode__code__in=codes).values_list('barcode__code', 'id'))
+
+    # Fold repeated records for one product in order: a later absolute level wins,
+    # deltas accumulate on top of whatever came before
+    changes = {}
+    not_found = []
+    for (kind, value), operation, amount in parsed:
+        product_id = value if kind == 'id' and value in known_ids else products_by_code.get(value) if kind == 'code' else None
+        if product_id is None:
+            not_found.append(value)
+            continue
+        previous = changes.get(product_id)
+        if operation == 'add' and previous is not None and previous[0] == 'set':
+            changes[product_id] = ('set', max(0, previous[1] + amount))
+        elif operation == 'add' and previous is not None:
+            changes[product_id] = ('add', previous[1] + amount)
+        else:
+            changes[product_id] = (operation, amount)
+
+    items = list(changes.items())
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            quantity_cases, stock_cases = [], []
+            for product_id, (operation, amount) in batch:
+                if operation == 'set':
+                    quantity_cases.append(When(pk=product_id, then=Value(amount)))
+                    stock_cases.append(When(pk=product_id, then=Value(amount > 0)))
+                else:
+                    quantity_cases.append(When(pk=product_id, then=Greatest(F('quantity') + Value(amount), Value(0), output_field=PositiveIntegerField())))
+                    stock_cases.append(When(pk=product_id, quantity__gt=-amount, then=Value(True)))
+                    stock_cases.append(When(pk=product_id, then=Value(False)))
+            Product.objects.filter(pk__in=[product_id for product_id, _ in batch]).update(
+                quantity=Case(*quantity_cases, default=F('quantity'), output_field=PositiveIntegerField()),
+                is_in_stock=Case(*stock_cases, default=F('is_in_stock')),
+            )
+        barcode_index.invalidate_products(changes)
+    return len(items), not_found, errors
+
+
+def size_stock(product_id):
+    """The sum of a product's per-size stock."""
+    return ProductSize.objects.filter(product_id=product_id).aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def reserve_stock(user, items, ttl=None):
+    """
+    Hold stock for `items` ((product_id, size, quantity) tuples) until the reservation is
+    committed or expires. All lines succeed or none do. Returns (reference, expires_at).
+    """
+    requested = defaultdict(int)
+    for product_id, size, quantity in items:
+        requested[(int(product_id), size)] += quantity
+
+    product_ids = {product_id for product_id, _ in requested}
+    sizes = {
+        (entry.product_id, entry.size): entry
+        for entry in ProductSize.objects.filter(
+            product_id__in=product_ids, size__in={size for _, size in requested}
+        ).select_related('product')
+    }
+    missing = [key for key in requested if key not in sizes]
+    if missing:
+        raise InsufficientStock(
+            "Size not available: " + ", ".join(f"product {pk} size {size}" for pk, size in missing)
+        )
+
+    per_product = defaultdict(int)
+    for (product_id, _), quantity in requested.items():
+        per_product[product_id] += quantity
+
+    reference = uuid.uuid4()
+    expires_at = timezone.now() + (ttl or settings.STOCK_RESERVATION_TTL)
+    with transaction.atomic():
+        # Sorted so concurrent reservations take row locks in the same order
+        for key in sorted(requested):
+            entry, quantity = sizes[key], requested[key]
+            if not ProductSize.objects.filter(pk=entry.pk, quantity__gte=quantity).update(
+                quantity=F('quantity') - quantity
+            ):
+                raise InsufficientStock(f"Insufficient stock for {entry.product.name} ({entry.size}).")
+        for product_id in sorted(per_product):
+            if not deduct_stock(product_id, per_product[product_id]):
+                raise InsufficientStock(f"Insufficient stock for product {product_id}.")
+
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                reference=reference, user=user, product_size=sizes[key], quantity=quantity, expires_at=expires_at
+            )
+            for key, quantity in requested.items()
+        ])
+    return reference, expires_at
+
+
+def commit_reservation(user, reference):
+    """Turn a live hold into a sale. Returns the number of reservation lines committed."""
+    return StockReservation.objects.filter(
+        reference=reference, user=user, status='held', expires_at__gt=timezone.now()
+    ).update(status='committed')
+
+
+def release_reservation(user, reference):
+    return _release(StockReservation.objects.filter(reference=reference, user=user))
+
+
+def release_expired_reservations(batch_size=500):
+    """
+    Return the stock of up to `batch_size` held reservations past their deadline.
+    Returns the number released; the sweeper calls it until nothing is left.
+    """
+    return _release(StockReservation.objects.filter(expires_at__lte=timezone.now()), limit=batch_size)
+
+
+def _release(reservations, limit=None):
+    with transaction.atomic():
+        held = reservations.filter(status='held').order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Rows locked by a concurrent commit are left for the next sweep
+            held = held.select_for_update(skip_locked=True, of=('self',))
+        rows = list(held.values_list('id', 'product_size_id', 'product_size__product_id', 'quantity')[:limit])
+        if not rows:
+            return 0
+
+        StockReservation.objects.filter(id__in=[row[0] for row in rows]).update(status='released')
+
+        per_size = defaultdict(int)
+        per_product = defaultdict(int)
+        for _, size_id, product_id, quantity in rows:
+            per_size[size_id] += quantity
+            per_product[product_id] += quantity
+        _restock(per_size, per_product)
+    return len(rows)
+
+
+def _restock(per_size, per_product):
+    if not per_size:
+        return
+    # One CASE update per table, however many reservations are returned
+    ProductSize.objects.filter(pk__in=per_size).update(quantity=F('quantity') + Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in per_size.items()], default=Value(0)
+    ))
+    Product.objects.filter(pk__in=per_product).update(
+        quantity=F('quantity') + Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in per_product.items()], default=Value(0)
+        ),
+        is_in_stock=True,
+    )
+    barcode_index.invalidate_products(per_product)
+
+
+def consume_reservation(user, reference, order, wanted):
+    """
+    Attach every line of a reservation to `order`, committing those still held. Lines
+    must be live holds or committed by payment and not yet used by an order; anything
+    else (expired, released, already consumed) raises ReservationUnavailable.
+    `wanted` maps product ids to the units the order takes. Reserved units beyond that,
+    including whole lines for products the order does not contain, go back to stock.
+    Returns the units per product the reservation covers. Call inside the checkout's
+    transaction so a failed checkout leaves the reservation untouched.
+    """
+    lines = StockReservation.objects.filter(reference=reference, user=user)
+    usable = Q(order__isnull=True) & (Q(status='committed') | Q(status='held', expires_at__gt=timezone.now()))
+    held = lines.filter(usable).order_by('id')
+    if connection.features.has_select_for_update_of:
+        # Keeps the sweeper, which skips locked rows, from releasing them under us
+        held = held.select_for_update(of=('self',))
+    rows = list(held.values_list('id', 'product_size_id', 'product_size__product_id', 'quantity'))
+    if not rows or len(rows) != lines.count():
+        raise ReservationUnavailable("The stock reservation has expired or was already used.")
+
+    # Conditional on the same state, for backends without row locks
+    if StockReservation.objects.filter(usable, id__in=[row[0] for row in rows]).update(
+        status='committed', order=order
+    ) != len(rows):
+        raise ReservationUnavailable("The stock reservation has expired or was already used.")
+
+    covered = defaultdict(int)
+    per_size = defaultdict(int)
+    per_product = defaultdict(int)
+    for line_id, size_id, product_id, quantity in rows:
+        used = min(quantity, wanted.get(product_id, 0) - covered[product_id])
+        covered[product_id] += used
+        if used < quantity:
+            # The line keeps only the units the order took
+            if used:
+                StockReservation.objects.filter(id=line_id).update(quantity=used)
+            else:
+                StockReservation.objects.filter(id=line_id).update(status='released')
+            per_size[size_id] += quantity - used
+            per_product[product_id] += quantity - used
+    _restock(per_size, per_product)
+    return covered
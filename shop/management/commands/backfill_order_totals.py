@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from shop.models import Order, OrderLine
+
+
+class Command(BaseCommand):
+    help = "Recompute stored order line totals and order totals, a batch of orders at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        orders_fixed = lines_fixed = 0
+
+        while True:
+            ids = list(Order.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            # Each batch commits on its own so a long backfill never holds one huge transaction
+            with transaction.atomic():
+                lines_fixed += OrderLine.objects.filter(order_id__in=ids).exclude(
+                    line_total=F('unit_price') * F('quantity')
+                ).update(line_total=F('unit_price') * F('quantity'))
+
+                totals = dict(
+                    OrderLine.objects.filter(order_id__in=ids).values_list('order_id')
+                    .annotate(total=Sum('line_total')).order_by()
+                )
+                orders = [
+                    order for order in Order.objects.filter(pk__in=ids).only('pk', 'total_price')
+                    if order.total_price != totals.get(order.pk, 0)
+                ]
+                for order in orders:
+                    order.total_price = totals.get(order.pk, 0)
+                Order.objects.bulk_update(orders, ['total_price'])
+                orders_fixed += len(orders)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {orders_fixed} order totals and {lines_fixed} line totals."
+        ))
@@ -0,0 +1,119 @@
+import statistics
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.test import APIClient
+from isansoriginal.db import sqlite_options
+from shop.benchmarks import quiet_request_log, throwaway_database
+from shop.models import Cart, Category, DeliveryCompany, Order, Product
+from users.models import CustomUser
+
+SQLITE_MODES = {'sqlite-stock': False, 'sqlite-tuned': True}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure checkout throughput with concurrent writers against a throwaway copy of the "
+        "configured database. On SQLite the stock and tuned (WAL) settings are compared."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Concurrent customers checking out.")
+        parser.add_argument('--checkouts', type=int, default=50, help="Checkouts per writer.")
+        parser.add_argument('--items', type=int, default=3, help="Cart lines per checkout.")
+        parser.add_argument(
+            '--mode', action='append', choices=['configured', *SQLITE_MODES],
+            help="Repeatable. Defaults to both SQLite modes on SQLite, otherwise the configured database.",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        modes = options['mode'] or (list(SQLITE_MODES) if connection.vendor == 'sqlite' else ['configured'])
+        if connection.vendor != 'sqlite' and set(modes) & set(SQLITE_MODES):
+            raise CommandError("SQLite modes need DB_ENGINE=sqlite.")
+
+        for mode in modes:
+            result = self.run_mode(mode, options)
+            self.stdout.write(
+                f"{mode:<14} {result['ok']:>5} checkouts in {result['elapsed']:.2f}s "
+                f"= {result['ok'] / result['elapsed']:>7.1f}/s  "
+                f"p50 {result['p50']:.1f}ms  p95 {result['p95']:.1f}ms  errors {result['errors']}"
+            )
+
+    def run_mode(self, mode, options):
+        # On SQLite every mode gets its own file; the configured mode keeps the configured options
+        sqlite = SQLITE_MODES.get(mode)
+        with quiet_request_log(), throwaway_database(None if sqlite is None else sqlite_options(sqlite)):
+            customers, products, company = self.seed(options['writers'], options['items'])
+            return self.race(customers, products, company, options)
+
+    def seed(self, writers, items):
+        admin = CustomUser.objects.create_superuser(email='bench-admin@example.com', password='password')
+        company = DeliveryCompany.objects.create(
+            name='Bench Logistics', address='Address', branch='Ikeja', state='Lagos', created_by=admin
+        )
+        category = Category.objects.create(name='Bench')
+        products = [
+            Product.objects.create(
+                name=f'Bench product {i}', price=Decimal('10.00') + i, description='Benchmark',
+                category=category, quantity=10 ** 9,
+            )
+            for i in range(max(items, 10))
+        ]
+        customers = [
+            CustomUser.objects.create_user(email=f'bench-{i}@example.com', password='password')
+            for i in range(writers)
+        ]
+        return customers, products, company
+
+    def race(self, customers, products, company, options):
+        start = threading.Barrier(len(customers) + 1)
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def writer(index, customer):
+            client = APIClient()
+            client.force_authenticate(customer)
+            own_latencies, own_errors = [], 0
+            try:
+                start.wait()
+                for n in range(options['checkouts']):
+                    began = time.perf_counter()
+                    try:
+                        Cart.objects.bulk_create([
+                            Cart(user=customer, product=products[(index + n + i) % len(products)], quantity=1)
+                            for i in range(options['items'])
+                        ])
+                        response = client.post('/shop/orders/', {'delivery_company_id': company.pk}, format='json')
+                        if response.status_code != 201:
+                            raise RuntimeError(response.status_code)
+                    except Exception:
+                        own_errors += 1
+                        Cart.objects.filter(user=customer).delete()
+                        continue
+                    own_latencies.append((time.perf_counter() - began) * 1000)
+            finally:
+                connections.close_all()
+                with lock:
+                    latencies.extend(own_latencies)
+                    errors.append(own_errors)
+
+        threads = [threading.Thread(target=writer, args=(i, customer)) for i, customer in enumerate(customers)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        began = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        placed = Order.objects.count()
+        if placed != len(latencies):
+            raise CommandError(f"{len(latencies)} checkouts succeeded but {placed} orders exist.")
+        quantiles = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else [0] * 19
+        return {
+            'ok': len(latencies), 'errors': sum(errors), 'elapsed': elapsed,
+            'p50': statistics.median(latencies) if latencies else 0, 'p95': quantiles[18],
+        }
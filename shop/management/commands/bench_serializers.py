@@ -0,0 +1,58 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.benchmarks import quiet_request_log, throwaway_database
+from shop.fast_serializers import FastAdminOrderHistorySerializer, FastBarcodeSerializer, FastProductSerializer
+from shop.models import Barcode, Order, Product
+from shop.seed import seed
+from shop.serializers import AdminOrderHistorySerializer, BarcodeSerializer, ProductSerializer
+
+
+def cases():
+    products = Product.objects.select_related('category').prefetch_related('product_sizes')
+    orders = Order.objects.select_related('user', 'delivery_company').prefetch_related('lines').order_by('-created_at')
+    barcodes = Barcode.objects.order_by('id')
+    return {
+        'products': (
+            lambda: ProductSerializer(products.all(), many=True).data,
+            lambda: FastProductSerializer(products.all()).data,
+        ),
+        'admin_orders': (
+            lambda: AdminOrderHistorySerializer(orders.all(), many=True).data,
+            lambda: FastAdminOrderHistorySerializer(orders.all()).data,
+        ),
+        'barcodes': (
+            lambda: BarcodeSerializer(barcodes.all(), many=True).data,
+            lambda: FastBarcodeSerializer(barcodes.all()).data,
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/sec of the fast list serializers with the ModelSerializers they replace, "
+        "queries included, on seeded data in a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per serializer; the best one counts.")
+
+    def handle(self, *args, **options):
+        with quiet_request_log(), throwaway_database():
+            seed(scale=options['scale'])
+            self.stdout.write(f"{'list':<14}{'rows':>7}{'serializer':>16}{'fast':>16}{'speedup':>9}")
+            for name, (slow, fast) in cases().items():
+                rows, slow_time = self.best(slow, options['repeat'])
+                _, fast_time = self.best(fast, options['repeat'])
+                self.stdout.write(
+                    f"{name:<14}{rows:>7}{rows / slow_time:>12.0f}/s  {rows / fast_time:>12.0f}/s  "
+                    f"{slow_time / fast_time:>6.1f}x"
+                )
+
+    def best(self, build, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(build())
+            timings.append(time.perf_counter() - start)
+        return rows, min(timings)
@@ -0,0 +1,20 @@
+import sys
+from django.core.management.base import BaseCommand
+from shop.catalog_io import FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help="File to write; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in export_lines(options['format']):
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from shop.images import generate_variants
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Generate resized and WebP variants for existing product images in parallel and mark them ready."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that already exist.")
+
+    def handle(self, *args, **options):
+        names = Product.objects.exclude(image__isnull=True).exclude(image='').values_list('image', flat=True)
+
+        def process(name):
+            try:
+                return name, generate_variants(name, force=options['force']), None
+            except Exception as e:
+                return name, 0, e
+
+        generated = failed = 0
+        ready = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for name, written, error in executor.map(process, names.iterator()):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                ready.append(name)
+                if written:
+                    generated += 1
+
+        # Also marks images whose variants already existed, e.g. from before the flag
+        for start in range(0, len(ready), 500):
+            Product.objects.filter(image__in=ready[start:start + 500]).update(image_variants_ready=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {generated} images, {failed} failed."))
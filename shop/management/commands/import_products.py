@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from shop.catalog_io import FORMATS, CatalogImporter, detect_format, iter_records
+
+
+class Command(BaseCommand):
+    help = "Bulk create/update products from a CSV or NDJSON file, streaming it in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        try:
+            stream = open(options['path'], 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with stream:
+            report = CatalogImporter(batch_size=options['batch_size']).run(iter_records(stream, file_format))
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']}, updated {report['updated']}, rejected {len(report['errors'])} rows."
+        ))
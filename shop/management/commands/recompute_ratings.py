@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from shop.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized review aggregates on every product from the Review table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        histogram = {
+            field: Count('id', filter=Q(rating=rating))
+            for rating, field in Product.RATING_HISTOGRAM_FIELDS.items()
+        }
+        # One grouped aggregate over the whole Review table
+        rows = Review.objects.values('product_id').annotate(
+            rating_count=Count('id'),
+            rating_sum=Sum('rating'),
+            **histogram
+        ).order_by()
+        aggregates = {row.pop('product_id'): row for row in rows}
+
+        fields = ['rating_count', 'rating_sum', *Product.RATING_HISTOGRAM_FIELDS.values()]
+        empty = {field: 0 for field in fields}
+
+        with transaction.atomic():
+            # Products without reviews are reset in bulk, the rest are rewritten in batches
+            Product.objects.exclude(pk__in=list(aggregates)).update(**empty)
+
+            products = []
+            for product in Product.objects.filter(pk__in=list(aggregates)).only('pk', *fields):
+                for field, value in aggregates[product.pk].items():
+                    setattr(product, field, value)
+                products.append(product)
+            Product.objects.bulk_update(products, fields, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed ratings for {len(products)} reviewed products."
+        ))
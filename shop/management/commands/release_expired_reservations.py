@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from shop.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Release held stock reservations whose TTL has passed. Run it every minute from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = release_expired_reservations(batch_size=options['batch_size'])
+            total += released
+            if released < options['batch_size']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Released {total} expired reservations."))
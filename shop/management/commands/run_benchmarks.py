@@ -0,0 +1,58 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from shop import benchmarks
+
+# Recorded from the default seeded run (scale 1, seed 0); refresh it with --save-baseline
+DEFAULT_BASELINE = Path(benchmarks.__file__).with_name('benchmark_baseline.json')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the hot endpoints on seeded data in a throwaway database. "
+        "Compare against a saved baseline with --baseline (default: the committed shop/benchmark_baseline.json); "
+        "regressions fail the command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('cases', nargs='*', metavar='case',
+                            help=f"Cases to run (default all): {', '.join(benchmarks.CASES)}.")
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--baseline', type=Path, nargs='?', const=DEFAULT_BASELINE,
+                            help="Baseline JSON to compare against (default: the committed baseline).")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Allowed latency growth over the baseline, as a fraction (default 0.2).")
+        parser.add_argument('--save-baseline', type=Path, nargs='?', const=DEFAULT_BASELINE,
+                            help="Write these results as the new baseline (default: the committed baseline).")
+
+    def handle(self, *args, **options):
+        unknown = set(options['cases']) - set(benchmarks.CASES)
+        if unknown:
+            raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}.")
+        results = benchmarks.run(
+            options['cases'], scale=options['scale'], seed_value=options['seed'], iterations=options['iterations']
+        )
+
+        self.stdout.write(f"{'case':<18}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}{'queries':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<18}" + ''.join(f"{result[metric]:>8.2f}ms" for metric in ('p50', 'p95', 'p99', 'mean'))
+                + f"{result['queries']:>9}"
+            )
+
+        if options['save_baseline']:
+            options['save_baseline'].write_text(json.dumps(
+                {'scale': options['scale'], 'seed': options['seed'], 'cases': results}, indent=2, sort_keys=True
+            ) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['save_baseline']}."))
+
+        if options['baseline']:
+            baseline = json.loads(options['baseline'].read_text())
+            if (baseline['scale'], baseline['seed']) != (options['scale'], options['seed']):
+                raise CommandError("The baseline was recorded with a different --scale or --seed.")
+            regressions = benchmarks.compare(results, baseline['cases'], options['threshold'])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from shop.seed import ADMIN_EMAIL, PASSWORD, seed
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with deterministic shop data. Every seeded account uses the same password."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1, help="Multiplies every row count (1 = 200 products).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default=PASSWORD)
+
+    def handle(self, *args, **options):
+        if CustomUser.objects.filter(email=ADMIN_EMAIL).exists():
+            raise CommandError("This database has already been seeded.")
+        counts = seed(scale=options['scale'], seed=options['seed'], password=options['password'])
+        summary = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary}. Admin login: {ADMIN_EMAIL}"))
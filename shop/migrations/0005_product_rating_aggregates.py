@@ -0,0 +1,73 @@
+# Generated by Django 5.1.3 on 2026-10-19 05:59
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+RATING_HISTOGRAM_FIELDS = {i: f'rating_{i}_count' for i in range(1, 6)}
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Review = apps.get_model('shop', 'Review')
+
+    totals = Review.objects.values('product_id').annotate(
+        count=Count('id'),
+        total=Sum('rating'),
+        **{field: Count('id', filter=Q(rating=rating)) for rating, field in RATING_HISTOGRAM_FIELDS.items()},
+    ).order_by()
+    products = [
+        Product(
+            pk=row['product_id'], rating_count=row['count'], rating_sum=row['total'],
+            **{field: row[field] for field in RATING_HISTOGRAM_FIELDS.values()},
+        )
+        for row in totals
+    ]
+    Product.objects.bulk_update(
+        products, ['rating_count', 'rating_sum', *RATING_HISTOGRAM_FIELDS.values()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_alter_product_sizes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations
+
+# A frozen copy of the DDL in shop/search.py as of this migration; later changes to the
+# live module must not change what this migration does
+SQLITE_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5(
+        name, description,
+        content='shop_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_insert AFTER INSERT ON shop_product BEGIN
+        INSERT INTO shop_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_delete AFTER DELETE ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_update AFTER UPDATE OF name, description ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO shop_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO shop_product_fts(shop_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS shop_product_fts_insert",
+    "DROP TRIGGER IF EXISTS shop_product_fts_delete",
+    "DROP TRIGGER IF EXISTS shop_product_fts_update",
+    "DROP TABLE IF EXISTS shop_product_fts",
+]
+
+POSTGRESQL_INDEX_SQL = [
+    """
+    ALTER TABLE shop_product ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS shop_product_search_idx ON shop_product USING GIN (search_vector)",
+]
+
+POSTGRESQL_DROP_SQL = [
+    "DROP INDEX IF EXISTS shop_product_search_idx",
+    "ALTER TABLE shop_product DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run(statements):
+    def forwards(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return forwards
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_review_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_INDEX_SQL, 'postgresql': POSTGRESQL_INDEX_SQL}),
+            run({'sqlite': SQLITE_DROP_SQL, 'postgresql': POSTGRESQL_DROP_SQL}),
+        ),
+    ]
@@ -0,0 +1,56 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+SIZE_CHOICES = [('XS', 'Extra Small'), ('S', 'Small'), ('M', 'Medium'), ('FS', 'Free Size'), ('L', 'Large'), ('XL', 'Extra Large')]
+
+
+def split_sizes(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductSize = apps.get_model('shop', 'ProductSize')
+    valid_sizes = {code for code, _ in SIZE_CHOICES}
+
+    rows = []
+    for product_id, sizes in Product.objects.exclude(sizes='').values_list('id', 'sizes').iterator():
+        for size in {size.strip() for size in sizes.split(',')} & valid_sizes:
+            rows.append(ProductSize(product_id=product_id, size=size))
+    ProductSize.objects.bulk_create(rows, batch_size=1000)
+
+
+def join_sizes(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductSize = apps.get_model('shop', 'ProductSize')
+
+    sizes = {}
+    for product_id, size in ProductSize.objects.values_list('product_id', 'size').iterator():
+        sizes.setdefault(product_id, []).append(size)
+    products = list(Product.objects.filter(pk__in=sizes).only('pk'))
+    for product in products:
+        product.sizes = ','.join(sorted(sizes[product.pk]))
+    Product.objects.bulk_update(products, ['sizes'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSize',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(choices=SIZE_CHOICES, max_length=2)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_sizes', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['size', 'product'], name='productsize_size_product_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'size'), name='unique_product_size')],
+            },
+        ),
+        migrations.RunPython(split_sizes, join_sizes),
+        migrations.RemoveField(
+            model_name='product',
+            name='sizes',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-19 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='barcode',
+            index=models.Index(condition=models.Q(('status', 'unused')), fields=['id'], name='barcode_unused_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-19 06:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_barcode_unused_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliverycompany',
+            index=models.Index(fields=['state', 'branch'], name='deliverycompany_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliverycompany',
+            index=models.Index(fields=['name'], name='deliverycompany_name_idx'),
+        ),
+    ]
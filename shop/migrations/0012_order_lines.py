@@ -0,0 +1,99 @@
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def group_orders(apps, schema_editor):
+    """
+    Fold the one-product orders a single checkout created into one order with lines.
+    A checkout wrote its orders back to back, so orders sharing user, delivery company
+    and status within the same second become one header. Unit prices are taken from
+    the current product price, the only price on record.
+    """
+    Order = apps.get_model('shop', 'Order')
+    OrderLine = apps.get_model('shop', 'OrderLine')
+
+    headers = {}
+    totals = defaultdict(Decimal)
+    lines = []
+    merged = []
+    orders = Order.objects.select_related('product').order_by('created_at', 'id')
+    for order in orders.iterator(chunk_size=2000):
+        key = (order.user_id, order.delivery_company_id, order.status, order.created_at.replace(microsecond=0))
+        header = headers.setdefault(key, order)
+        if header is not order:
+            merged.append(order.pk)
+
+        unit_price = order.product.price
+        line_total = unit_price * order.quantity
+        totals[header.pk] += line_total
+        lines.append(OrderLine(
+            order_id=header.pk, product_id=order.product_id, product_name=order.product.name,
+            quantity=order.quantity, unit_price=unit_price, line_total=line_total,
+        ))
+
+    OrderLine.objects.bulk_create(lines, batch_size=1000)
+    for header in headers.values():
+        header.total_price = totals[header.pk]
+    Order.objects.bulk_update(list(headers.values()), ['total_price'], batch_size=1000)
+    for start in range(0, len(merged), 1000):
+        Order.objects.filter(pk__in=merged[start:start + 1000]).delete()
+
+
+def split_orders(apps, schema_editor):
+    # Lines whose product has since been deleted cannot be represented and are dropped
+    Order = apps.get_model('shop', 'Order')
+
+    for order in Order.objects.prefetch_related('lines').order_by('id').iterator(chunk_size=500):
+        lines = [line for line in order.lines.all() if line.product_id]
+        if not lines:
+            order.delete()
+            continue
+        order.product_id, order.quantity = lines[0].product_id, lines[0].quantity
+        order.save(update_fields=['product', 'quantity'])
+        if len(lines) > 1:
+            extra = Order.objects.bulk_create([
+                Order(
+                    user_id=order.user_id, delivery_company_id=order.delivery_company_id, status=order.status,
+                    product_id=line.product_id, quantity=line.quantity,
+                )
+                for line in lines[1:]
+            ])
+            Order.objects.filter(pk__in=[extra_order.pk for extra_order in extra]).update(created_at=order.created_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_delivery_company_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_name', models.CharField(max_length=100)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('line_total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shop.order')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_lines', to='shop.product')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        # Nullable while the data moves, so the reverse migration can re-add the column
+        migrations.AlterField(
+            model_name='order',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='shop.product'),
+        ),
+        # The old columns are dropped in 0012_remove_order_product_quantity: PostgreSQL
+        # cannot alter shop_order in the transaction that just wrote its rows
+        migrations.RunPython(group_orders, split_orders),
+    ]
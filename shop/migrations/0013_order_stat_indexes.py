@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-19 06:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_remove_order_product_quantity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'status', 'total_price'], name='order_created_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderline',
+            index=models.Index(fields=['product', 'quantity', 'line_total'], name='orderline_product_totals_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-19 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_stock_reservation_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-19 06:44
+
+import shop.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_product_image_variants_ready'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=shop.models.product_image_path),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-19 07:01
+
+import shop.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_product_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=shop.models.ContentHashedImageField(blank=True, null=True, upload_to=shop.models.product_image_path),
+        ),
+    ]
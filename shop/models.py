@@ -1,7 +1,32 @@
 from django.db import models
+from django.db.models.fields.files import ImageFieldFile
+from django.db.models import F
 from django.conf import settings
-from django.core.exceptions import ValidationError
+import hashlib
 import os
+import uuid
+
+
+def product_image_path(instance, filename):
+    return f'products/{filename}'
+
+
+class ContentHashedImageFieldFile(ImageFieldFile):
+    """
+    Saves uploads as <name>.<content hash><ext>: a new image always gets a new name, so
+    media serving can mark it and its variants immutable.
+    """
+    def save(self, name, content, save=True):
+        # Hash the incoming content, not whatever file the field currently holds
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        stem, extension = os.path.splitext(os.path.basename(name))
+        super().save(f'{stem}.{digest.hexdigest()[:12]}{extension.lower()}', content, save)
+
+
+class ContentHashedImageField(models.ImageField):
+    attr_class = ContentHashedImageFieldFile
 
 
 class Category(models.Model):
@@ -16,45 +41,130 @@ class Product(models.Model):
         ('L', 'Large'),
         ('XL', 'Extra Large'),
     ]
+    SIZE_ORDER = {code: position for position, (code, _) in enumerate(SIZE_CHOICES)}
 
     name = models.CharField(max_length=100)
-    image = models.ImageField(upload_to='products/', null=True, blank=True)
+    image = ContentHashedImageField(upload_to=product_image_path, null=True, blank=True)
+    # Set once the resized renditions of the current image are stored (shop/images.py)
+    image_variants_ready = models.BooleanField(default=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField()
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
-    sizes = models.CharField(max_length=100, null=False, blank=True, default='', help_text="Comma-separated sizes (XS,S,M,L,XL)")
     barcode = models.OneToOneField(
         'Barcode', on_delete=models.SET_NULL, null=True, blank=True, related_name="product"
     )
     quantity = models.PositiveIntegerField(default=0)
     is_in_stock = models.BooleanField(default=True)
 
-    def clean(self):
-        if self.sizes:
-            size_list = [size.strip() for size in self.sizes.split(',')]
-            valid_sizes = [choice[0] for choice in self.SIZE_CHOICES]
-            invalid_sizes = set(size_list) - set(valid_sizes)
+    # Denormalized review aggregates, maintained by the Review signals in shop/signals.py
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    RATING_HISTOGRAM_FIELDS = {i: f'rating_{i}_count' for i in range(1, 6)}
+
+    class Meta:
+        indexes = [
+            # Category listings filtered to what is in stock
+            models.Index(fields=['category', 'is_in_stock'], name='product_category_stock_idx'),
+        ]
 
-            if invalid_sizes:
-                raise ValidationError({'sizes': f'Invalid sizes: {invalid_sizes}'})
+    @property
+    def sizes(self):
+        return self.get_sizes_list()
 
     def get_sizes_list(self):
-        return [size.strip() for size in self.sizes.split(',')] if self.sizes else []
+        # Uses the prefetched product_sizes when available
+        return sorted((entry.size for entry in self.product_sizes.all()), key=self.SIZE_ORDER.get)
 
     def set_sizes(self, sizes_list):
-        valid_sizes = [choice[0] for choice in self.SIZE_CHOICES]
-        invalid_sizes = set(sizes_list) - set(valid_sizes)
+        invalid_sizes = set(sizes_list) - set(self.SIZE_ORDER)
 
         if invalid_sizes:
             raise ValueError(f"Invalid sizes: {invalid_sizes}")
 
-        self.sizes = ','.join(sorted(set(sizes_list)))
+        sizes = set(sizes_list)
+        self.product_sizes.exclude(size__in=sizes).delete()
+        ProductSize.objects.bulk_create(
+            [ProductSize(product=self, size=size) for size in sizes],
+            ignore_conflicts=True
+        )
+        getattr(self, '_prefetched_objects_cache', {}).pop('product_sizes', None)
 
     def save(self, *args, **kwargs):
         self.full_clean()
         self.is_in_stock = self.quantity > 0
         super().save(*args, **kwargs)
 
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    def get_rating_histogram(self):
+        return {str(i): getattr(self, field) for i, field in self.RATING_HISTOGRAM_FIELDS.items()}
+
+    @classmethod
+    def apply_review_rating(cls, product_id, rating, delta=1):
+        """
+        Add (delta=1) or remove (delta=-1) a review rating from the product aggregates
+        with a single UPDATE, so concurrent reviews never lose increments.
+        """
+        histogram_field = cls.RATING_HISTOGRAM_FIELDS[rating]
+        cls.objects.filter(pk=product_id).update(
+            rating_count=F('rating_count') + delta,
+            rating_sum=F('rating_sum') + delta * rating,
+            **{histogram_field: F(histogram_field) + delta},
+        )
+
+
+class ProductSize(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_sizes')
+    size = models.CharField(max_length=2, choices=Product.SIZE_CHOICES)
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'size'], name='unique_product_size'),
+        ]
+        indexes = [
+            # "All products available in size M" is an index range scan
+            models.Index(fields=['size', 'product'], name='productsize_size_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.size}"
+
+
+class StockReservation(models.Model):
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    ]
+    reference = models.UUIDField(default=uuid.uuid4, db_index=True)
+    user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='stock_reservations')
+    product_size = models.ForeignKey(ProductSize, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when checkout consumes the reservation, so it cannot cover a second order
+    order = models.ForeignKey('Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='reservations')
+
+    class Meta:
+        indexes = [
+            # The expiry sweeper only looks at held reservations past their deadline
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_size} ({self.status})"
 
 
 class Barcode(models.Model):
@@ -64,7 +174,12 @@ class Barcode(models.Model):
     ]
     code = models.CharField(max_length=13, unique=True)  # EAN-13 codes are 13 digits
     status = models.CharField(max_length=6, choices=STATUS_CHOICES, default='unused')
-    
+
+    class Meta:
+        indexes = [
+            # Only the free pool is ever scanned by status; used codes stay out of the index
+            models.Index(fields=['id'], condition=models.Q(status='unused'), name='barcode_unused_idx'),
+        ]
 
     def __str__(self):
         return self.code
@@ -79,13 +194,17 @@ class DeliveryCompany(models.Model):
     website = models.URLField(blank=True, null=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="delivery_companies")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'branch'], name='deliverycompany_state_idx'),
+            models.Index(fields=['name'], name='deliverycompany_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 class Order(models.Model):
     user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='orders')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='orders')
-    quantity = models.PositiveIntegerField(default=1)
     delivery_company = models.ForeignKey(DeliveryCompany, on_delete=models.SET_NULL, null=True, blank=True)
     status = models.CharField(max_length=50, choices=[
         ('pending', 'Pending'),
@@ -96,20 +215,52 @@ class Order(models.Model):
     ], default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Sum of the line totals, stored when the order is placed
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # Covers revenue and order counts by date range and status without reading the table
+            models.Index(fields=['created_at', 'status', 'total_price'], name='order_created_status_idx'),
+            # A customer's order history, newest first
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            # Admin screens filtering by status
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} by {self.user.email} - Status: {self.status}"
-    
-    def total_price(self):
-        if self.product and self.product.price:
-            return self.quantity * self.product.price
-        return 0
+
+
+class OrderLine(models.Model):
+    """One product on an order, with its name and price as they were at checkout."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='order_lines')
+    product_name = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            # Covers the top-product aggregation
+            models.Index(fields=['product', 'quantity', 'line_total'], name='orderline_product_totals_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name} (order #{self.order_id})"
+
 
 class Cart(models.Model):
     user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='carts')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='carts')
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'product'], name='cart_user_product_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.first_name}'s cart - {self.product.name}"
 
@@ -117,6 +268,11 @@ class Wishlist(models.Model):
     user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='wishlists')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='wishlists')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'product'], name='wishlist_user_product_idx'),
+        ]
+
 class Review(models.Model):
     user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='reviews')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
@@ -124,5 +280,11 @@ class Review(models.Model):
     rating = models.PositiveIntegerField(choices=[(i, i) for i in range(1, 6)])  # 1 to 5 stars
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='review_product_created_idx'),
+            models.Index(fields=['product', 'rating', 'created_at'], name='review_product_rating_idx'),
+        ]
+
     def __str__(self):
         return f"Review for {self.product} by {self.user}"
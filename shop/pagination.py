@@ -0,0 +1,99 @@
+import base64
+import datetime
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """
+    Forward-only cursor pagination over a fixed ordering.
+
+    The cursor stores the ordering values of the last row on the page, and the next page
+    is fetched with a lexicographic "row after" filter, so every page costs the same
+    index range scan no matter how deep the client scrolls.
+    The ordering must end with a unique field (usually 'id').
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+
+    def __init__(self, ordering, page_size=None):
+        self.ordering = list(ordering)
+        if page_size:
+            self.page_size = page_size
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, values):
+        # Full-precision isoformat: DjangoJSONEncoder truncates datetimes to milliseconds,
+        # which would make the cursor skip or repeat rows
+        data = json.dumps(values, default=_cursor_value, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor.")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound("Invalid cursor.")
+        return values
+
+    def filter_after(self, values):
+        """Build (a > x) OR (a = x AND b > y) OR ... respecting each field's direction."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                # Lookups convert each value to its field's type as the filter is built
+                queryset = queryset.filter(self.filter_after(self.decode_cursor(cursor)))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound("Invalid cursor.")
+
+        # Fetch one extra row to know whether there is a next page without a COUNT query
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [self._get_value(last, field.lstrip('-')) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def _get_value(self, row, name):
+        if isinstance(row, dict):
+            return row[name]
+        for attr in name.split('__'):
+            row = getattr(row, attr)
+        return row
+
+
+def _cursor_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
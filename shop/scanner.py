@@ -0,0 +1,146 @@
+"""
+Process-local barcode index for point-of-sale scanning.
+
+Maps a scanned code to the product it is assigned to, with price and stock, so a burst
+of scans is answered from memory. The index is loaded with one query when the WSGI/ASGI
+application starts (see warm()), or on the first scan if that failed, and kept current by the Barcode/Product signal handlers in shop/signals.py. Stock
+changed by bulk UPDATEs (shop/inventory.py) drops the affected entries once the
+transaction commits. Each worker process holds its own copy, so entries also expire
+after SCAN_INDEX_TTL seconds to pick up writes made by other processes; a missing or
+expired code is read back through the unique index on Barcode.code.
+"""
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('barcode_id', 'barcode__code', 'id', 'name', 'price', 'quantity', 'is_in_stock')
+
+
+def _entry(barcode_id, code, product_id, name, price, quantity, is_in_stock):
+    return {
+        'barcode_id': barcode_id, 'code': code, 'product_id': product_id, 'name': name,
+        'price': price, 'quantity': quantity, 'is_in_stock': is_in_stock, 'loaded_at': time.monotonic(),
+    }
+
+
+class BarcodeIndex:
+    def __init__(self):
+        self._by_code = None
+        self._code_by_product = {}
+        self._code_by_barcode = {}
+        self._lock = threading.RLock()
+
+    @property
+    def is_built(self):
+        return self._by_code is not None
+
+    def ensure_built(self):
+        if self._by_code is None:
+            with self._lock:
+                if self._by_code is None:
+                    self.rebuild()
+
+    def warm(self):
+        """
+        Load the index at process start so the first scan is not the one paying for it.
+        Never raises: with the database unreachable or not yet migrated, the first scan
+        loads it instead. Connections are closed afterwards so a server that forks
+        workers from a preloaded application does not share them.
+        """
+        try:
+            self.ensure_built()
+        except DatabaseError:
+            logger.warning("Could not warm the barcode index; it will load on the first scan", exc_info=True)
+        finally:
+            for db_connection in connections.all(initialized_only=True):
+                if not db_connection.in_atomic_block:
+                    db_connection.close()
+
+    def rebuild(self):
+        rows = Product.objects.filter(barcode__isnull=False).values_list(*FIELDS).iterator()
+        by_code = {}
+        for row in rows:
+            by_code[row[1]] = _entry(*row)
+        with self._lock:
+            self._by_code = by_code
+            self._code_by_product = {entry['product_id']: code for code, entry in by_code.items()}
+            self._code_by_barcode = {entry['barcode_id']: code for code, entry in by_code.items()}
+
+    def _store(self, entry):
+        self._drop_product(entry['product_id'])
+        self._by_code[entry['code']] = entry
+        self._code_by_product[entry['product_id']] = entry['code']
+        self._code_by_barcode[entry['barcode_id']] = entry['code']
+
+    def _drop_product(self, product_id):
+        code = self._code_by_product.pop(product_id, None)
+        entry = self._by_code.pop(code, None)
+        if entry is not None:
+            self._code_by_barcode.pop(entry['barcode_id'], None)
+
+    def lookup(self, code):
+        """Return the product entry for `code`, or None if it is not assigned to a product."""
+        self.ensure_built()
+        entry = self._by_code.get(code)
+        if entry is not None and time.monotonic() - entry['loaded_at'] < settings.SCAN_INDEX_TTL:
+            return entry
+
+        row = Product.objects.filter(barcode__code=code).values_list(*FIELDS).first()
+        with self._lock:
+            if entry is not None and self._by_code.get(code) is entry:
+                self._drop_product(entry['product_id'])
+            if row is None:
+                return None
+            entry = _entry(*row)
+            self._store(entry)
+        return entry
+
+    # Incremental updates; ignored until the index has been loaded
+
+    def product_saved(self, product):
+        with self._lock:
+            if self._by_code is None:
+                return
+            code = self._code_by_product.get(product.pk)
+            current = self._by_code.get(code)
+            if current is not None and current['barcode_id'] == product.barcode_id:
+                self._store(_entry(
+                    product.barcode_id, code, product.pk, product.name, product.price,
+                    product.quantity, product.is_in_stock,
+                ))
+            else:
+                # Newly assigned or changed barcode: the next scan reads it from the database
+                self._drop_product(product.pk)
+
+    def product_deleted(self, product):
+        with self._lock:
+            if self._by_code is not None:
+                self._drop_product(product.pk)
+
+    def barcode_changed(self, barcode):
+        with self._lock:
+            if self._by_code is None:
+                return
+            entry = self._by_code.get(self._code_by_barcode.get(barcode.pk))
+            if entry is not None:
+                self._drop_product(entry['product_id'])
+
+    def invalidate_products(self, product_ids):
+        """Drop entries for products whose stock was changed without save(), after commit."""
+        product_ids = list(product_ids)
+
+        def drop():
+            with self._lock:
+                if self._by_code is not None:
+                    for product_id in product_ids:
+                        self._drop_product(product_id)
+
+        transaction.on_commit(drop)
+
+
+barcode_index = BarcodeIndex()
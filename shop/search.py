@@ -0,0 +1,154 @@
+"""
+Full-text product search over a prebuilt inverted index.
+
+SQLite uses an FTS5 external-content table kept in sync by triggers on shop_product;
+PostgreSQL uses a generated tsvector column with a GIN index. Other backends fall back
+to icontains filters.
+"""
+import re
+from collections import namedtuple
+from django.db import connection
+from django.db.models import Count, Q
+from .models import Product
+
+SearchResult = namedtuple('SearchResult', ['ids', 'total', 'facets'])
+
+SQLITE_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5(
+        name, description,
+        content='shop_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_insert AFTER INSERT ON shop_product BEGIN
+        INSERT INTO shop_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_delete AFTER DELETE ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_update AFTER UPDATE OF name, description ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO shop_product_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS shop_product_fts_insert",
+    "DROP TRIGGER IF EXISTS shop_product_fts_delete",
+    "DROP TRIGGER IF EXISTS shop_product_fts_update",
+    "DROP TABLE IF EXISTS shop_product_fts",
+]
+
+POSTGRESQL_INDEX_SQL = [
+    """
+    ALTER TABLE shop_product ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS shop_product_search_idx ON shop_product USING GIN (search_vector)",
+]
+
+POSTGRESQL_DROP_SQL = [
+    "DROP INDEX IF EXISTS shop_product_search_idx",
+    "ALTER TABLE shop_product DROP COLUMN IF EXISTS search_vector",
+]
+
+# Name matches weigh ten times more than description matches
+SQLITE_RANK = "bm25(shop_product_fts, 10.0, 1.0)"
+
+
+def install_search_index(db_connection, rebuild=False):
+    """
+    Create the search index if it is missing. Safe to run repeatedly: SQLite drops
+    triggers whenever a migration remakes shop_product, so this also runs on post_migrate.
+    """
+    with db_connection.cursor() as cursor:
+        if db_connection.vendor == 'sqlite':
+            for sql in SQLITE_INDEX_SQL:
+                cursor.execute(sql)
+            if rebuild:
+                cursor.execute("INSERT INTO shop_product_fts(shop_product_fts) VALUES ('rebuild')")
+        elif db_connection.vendor == 'postgresql':
+            for sql in POSTGRESQL_INDEX_SQL:
+                cursor.execute(sql)
+
+
+def drop_search_index(db_connection):
+    statements = {'sqlite': SQLITE_DROP_SQL, 'postgresql': POSTGRESQL_DROP_SQL}.get(db_connection.vendor, [])
+    with db_connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def search_products(query, category_id=None, limit=20, offset=0):
+    """
+    Return ranked product ids for `query`, the total match count and per-category facet
+    counts. The last term is matched as a prefix so the endpoint also serves typeahead.
+    Facets ignore the category filter so the client can show counts for every category.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return SearchResult([], 0, {})
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        source = (
+            "FROM shop_product_fts JOIN shop_product p ON p.id = shop_product_fts.rowid "
+            "WHERE shop_product_fts MATCH %s"
+        )
+        rank = SQLITE_RANK
+        params = [match]
+    elif connection.vendor == 'postgresql':
+        tsquery = ' & '.join(terms) + ':*'
+        source = "FROM shop_product p WHERE p.search_vector @@ to_tsquery('english', %s)"
+        rank = "-ts_rank(p.search_vector, to_tsquery('english', %s))"
+        params = [tsquery]
+    else:
+        return _search_fallback(terms, category_id, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT p.category_id, COUNT(*) {source} GROUP BY p.category_id", params)
+        facets = dict(cursor.fetchall())
+
+        category_sql = ''
+        category_params = []
+        if category_id is not None:
+            category_sql = ' AND p.category_id = %s'
+            category_params = [category_id]
+
+        rank_params = params if connection.vendor == 'postgresql' else []
+        cursor.execute(
+            f"SELECT p.id {source}{category_sql} ORDER BY {rank}, p.id LIMIT %s OFFSET %s",
+            params + category_params + rank_params + [limit, offset],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    total = facets.get(category_id, 0) if category_id is not None else sum(facets.values())
+    return SearchResult(ids, total, facets)
+
+
+def _search_fallback(terms, category_id, limit, offset):
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(description__icontains=term)
+    matches = Product.objects.filter(condition)
+    facets = dict(matches.values_list('category_id').annotate(total=Count('id')).order_by())
+    if category_id is not None:
+        matches = matches.filter(category_id=category_id)
+    ids = list(matches.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+    total = facets.get(category_id, 0) if category_id is not None else sum(facets.values())
+    return SearchResult(ids, total, facets)
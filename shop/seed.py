@@ -0,0 +1,151 @@
+"""
+Deterministic shop data for demos, benchmarks and tests.
+
+seed(scale, seed) adds a reproducible shop to the database: the same scale and seed
+always produce the same users, products, carts, orders and reviews, ids included where
+they are not auto-increment. Rows are bulk-inserted, so the values the signal handlers
+would otherwise maintain (review aggregates, barcode status, the delivery cache) are
+written here directly.
+"""
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import RANDOM_STRING_CHARS
+from users.models import CustomUser
+from . import delivery
+from .autocomplete import autocomplete_index
+from .models import Barcode, Cart, Category, DeliveryCompany, Order, OrderLine, Product, ProductSize, Review
+
+PASSWORD = 'password'
+ADMIN_EMAIL = 'admin@seed.example'
+
+# Rows per unit of scale
+USERS = 50
+CATEGORIES = 5
+PRODUCTS = 200
+ORDERS = 200
+REVIEWS = 500
+DELIVERY_COMPANIES = 6
+
+STATES = ['Lagos', 'Abuja', 'Rivers', 'Oyo', 'Kano', 'Enugu']
+WORDS = ['Ankara', 'Kaftan', 'Agbada', 'Silk', 'Linen', 'Denim', 'Classic', 'Royal', 'Bubu', 'Wrap', 'Maxi', 'Tunic']
+STATUSES = ['pending', 'packaged', 'sent_out', 'delivered', 'canceled']
+
+
+def seed(scale=1, seed=0, password=PASSWORD):
+    """Create `scale` units of shop data. Returns the number of rows created per model."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    # One hash for everyone: hashing thousands of passwords would dominate seeding
+    password_hash = make_password(password, salt=''.join(rng.choices(RANDOM_STRING_CHARS, k=22)))
+
+    with transaction.atomic():
+        admin = CustomUser.objects.create(
+            id=uuid.UUID(int=rng.getrandbits(128)), email=ADMIN_EMAIL, first_name='Seed', last_name='Admin',
+            password=password_hash, is_staff=True, is_superuser=True,
+        )
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                id=uuid.UUID(int=rng.getrandbits(128)), email=f'user{i}@seed.example',
+                first_name=f'User{i}', last_name='Seed', password=password_hash,
+                state=rng.choice(STATES), location=rng.choice(STATES),
+            )
+            for i in range(USERS * scale)
+        ])
+
+        categories = Category.objects.bulk_create([
+            Category(name=f'{WORDS[i % len(WORDS)]} {i}') for i in range(CATEGORIES * scale)
+        ])
+        product_count = PRODUCTS * scale
+        # Every product gets a code and a fifth of the pool stays free for allocation
+        barcodes = Barcode.objects.bulk_create([
+            Barcode(code=f'iSANS{1000 + i}', status='used' if i < product_count else 'unused')
+            for i in range(product_count + product_count // 5)
+        ])
+
+        # Reviews are drawn first so the products are inserted with their aggregates
+        reviews = {}
+        for _ in range(REVIEWS * scale):
+            key = (rng.randrange(len(users)), rng.randrange(product_count))
+            reviews.setdefault(key, rng.choices(range(1, 6), weights=[1, 1, 3, 5, 4])[0])
+        ratings = [[] for _ in range(product_count)]
+        for (_, product_index), rating in reviews.items():
+            ratings[product_index].append(rating)
+
+        products = []
+        for i in range(product_count):
+            quantity = rng.choice([0, 3, 10, 25, 100])
+            product = Product(
+                name=f'{rng.choice(WORDS)} {rng.choice(WORDS)} {i}',
+                price=Decimal(rng.randrange(1500, 60000, 50)) / 100,
+                description=f'Seeded product {i}', category=categories[i % len(categories)],
+                barcode=barcodes[i], quantity=quantity, is_in_stock=quantity > 0,
+                rating_count=len(ratings[i]), rating_sum=sum(ratings[i]),
+            )
+            for value in ratings[i]:
+                field = Product.RATING_HISTOGRAM_FIELDS[value]
+                setattr(product, field, getattr(product, field) + 1)
+            products.append(product)
+        products = Product.objects.bulk_create(products)
+
+        ProductSize.objects.bulk_create([
+            ProductSize(product=product, size=size, quantity=rng.randrange(0, 20))
+            for product in products
+            for size in rng.sample(list(Product.SIZE_ORDER), rng.randrange(1, 4))
+        ])
+        Review.objects.bulk_create([
+            Review(user=users[user_index], product=products[product_index], rating=rating, comment='Seeded review')
+            for (user_index, product_index), rating in reviews.items()
+        ])
+
+        companies = DeliveryCompany.objects.bulk_create([
+            DeliveryCompany(
+                name=f'{WORDS[i % len(WORDS)]} Logistics', address=f'{i} Seed Street', branch=f'Branch {i % 3}',
+                state=STATES[i % len(STATES)], created_by=admin,
+            )
+            for i in range(DELIVERY_COMPANIES)
+        ])
+
+        Cart.objects.bulk_create([
+            Cart(user=user, product=product, quantity=rng.randrange(1, 4))
+            for user in users
+            for product in rng.sample(products, rng.randrange(0, 4))
+        ])
+
+        orders, order_items = [], []
+        for _ in range(ORDERS * scale):
+            order = Order(
+                user=rng.choice(users), delivery_company=rng.choice(companies),
+                status=rng.choices(STATUSES, weights=[3, 2, 2, 6, 1])[0],
+            )
+            items = [(product, rng.randrange(1, 4)) for product in rng.sample(products, rng.randrange(1, 5))]
+            order.total_price = sum(product.price * quantity for product, quantity in items)
+            orders.append(order)
+            order_items.append(items)
+        orders = Order.objects.bulk_create(orders)
+        # auto_now_add stamps every order with the current time; spread them over 90 days
+        for order in orders:
+            order.created_at = now - timedelta(minutes=rng.randrange(90 * 24 * 60))
+        Order.objects.bulk_update(orders, ['created_at'], batch_size=500)
+        lines = OrderLine.objects.bulk_create([
+            OrderLine(
+                order=order, product=product, product_name=product.name, quantity=quantity,
+                unit_price=product.price, line_total=product.price * quantity,
+            )
+            for order, items in zip(orders, order_items)
+            for product, quantity in items
+        ], batch_size=500)
+
+    delivery.bump_version()
+    if autocomplete_index.is_built:
+        autocomplete_index.rebuild()
+
+    return {
+        'users': len(users) + 1, 'categories': len(categories), 'barcodes': len(barcodes),
+        'products': len(products), 'reviews': len(reviews), 'delivery_companies': len(companies),
+        'orders': len(orders), 'order_lines': len(lines),
+    }
@@ -1,8 +1,16 @@
+from django.db import transaction
 from rest_framework import serializers
-from rest_framework.serializers import ModelSerializer, CharField
-from .models import  Barcode, Cart, Category, DeliveryCompany, Order, Product, Review, Wishlist
+from rest_framework.utils import html
+from rest_framework.serializers import CharField
+from isansoriginal.instrumentation import TimedSerializerMixin
+from .barcodes import BarcodeUnavailable, allocate_barcodes, claim_barcode, release_barcodes
+from .images import variant_urls
+from .models import  Barcode, Cart, Category, DeliveryCompany, Order, OrderLine, Product, Review, Wishlist
 from users.models import CustomUser  # Assuming the custom user model
 
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """A ModelSerializer whose rendering time is reported by the request instrumentation."""
+
 class CategorySerializer(ModelSerializer):
     class Meta:
         model = Category
@@ -13,6 +21,37 @@ class BarcodeSerializer(ModelSerializer):
         model = Barcode
         fields = ['id', 'code', 'status']
 
+class SizesField(serializers.Field):
+    """
+    Accepts a list of sizes or a comma-separated string and returns a list of unique,
+    validated size codes. Renders the product's size list as-is.
+    """
+    def get_value(self, dictionary):
+        if html.is_html_input(dictionary) and self.field_name in dictionary:
+            values = dictionary.getlist(self.field_name)
+            return values if len(values) > 1 else values[0]
+        return super().get_value(dictionary)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.split(",")
+        elif not isinstance(data, (list, tuple)):
+            raise serializers.ValidationError("Sizes must be a list or a comma-separated string.")
+
+        sizes = list(dict.fromkeys(str(size).strip() for size in data if str(size).strip()))
+        invalid_sizes = [size for size in sizes if size not in Product.SIZE_ORDER]
+
+        if invalid_sizes:
+            raise serializers.ValidationError(
+                f"The following sizes are invalid: {', '.join(invalid_sizes)}"
+            )
+
+        return sizes
+
+    def to_representation(self, value):
+        return value
+
+
 class ProductSerializer(ModelSerializer):
     category = serializers.SlugRelatedField(
         slug_field='name',
@@ -23,104 +62,78 @@ class ProductSerializer(ModelSerializer):
         required=False,
         allow_null=True
     )
-    sizes = serializers.CharField(required=False, allow_blank=True)
+    # Assign the next free barcode when none is given
+    allocate_barcode = serializers.BooleanField(write_only=True, required=False)
+    sizes = SizesField(required=False)
+    size_stock = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    average_rating = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.DictField(source='get_rating_histogram', read_only=True)
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'image', 'price', 'description', 'category', 'sizes', 'barcode', 'quantity']
-
-    def validate_sizes(self, value):
-        """
-        Validate and parse the sizes field.
-        It should be a comma-separated string of valid size choices.
-        """
-        if not value:
-            return ""  # Allow empty sizes
-
-        sizes = [size.strip() for size in value.split(",") if size.strip()]
-        valid_sizes = [choice[0] for choice in Product.SIZE_CHOICES]
-        invalid_sizes = set(sizes) - set(valid_sizes)
-
-        if invalid_sizes:
-            raise serializers.ValidationError(
-                f"The following sizes are invalid: {', '.join(invalid_sizes)}"
-            )
-
-        return ",".join(sizes)  # Return a clean comma-separated string
+        fields = ['id', 'name', 'image', 'image_variants', 'price', 'description', 'category', 'sizes', 'size_stock', 'barcode',
+                  'allocate_barcode', 'quantity', 'rating_count', 'average_rating', 'rating_histogram']
+        read_only_fields = ['rating_count']
+
+    def get_image_variants(self, obj):
+        urls = variant_urls(obj.image, obj.image_variants_ready)
+        request = self.context.get('request')
+        if urls and request is not None:
+            urls = {
+                variant: {fmt: request.build_absolute_uri(url) for fmt, url in formats.items()}
+                for variant, formats in urls.items()
+            }
+        return urls
 
-    def to_representation(self, instance):
-        """
-        Convert stored sizes (comma-separated string) to a list for the response.
-        """
-        ret = super().to_representation(instance)
-        ret['sizes'] = instance.get_sizes_list()  # Convert to list
-        return ret
-
-    def to_internal_value(self, data):
-        """
-        Convert sizes field from list or comma-separated string to consistent format.
-        """
-        sizes = data.get('sizes', '')
-        if isinstance(sizes, list):  # If frontend sends as a list
-            sizes = ",".join(sizes)
-        data['sizes'] = sizes.strip()
-        return super().to_internal_value(data)
+    def get_size_stock(self, obj):
+        # Uses the prefetched product_sizes when available
+        entries = sorted(obj.product_sizes.all(), key=lambda entry: Product.SIZE_ORDER[entry.size])
+        return {entry.size: entry.quantity for entry in entries}
 
     def create(self, validated_data):
-        sizes = validated_data.pop('sizes', '')
-        barcode_data = validated_data.pop('barcode', None)
-
-        # Create the product
-        product = Product.objects.create(**validated_data)
-        product.set_sizes(sizes.split(',') if sizes else [])
-
-        # Handle barcode
-        if barcode_data:
-            try:
-                barcode = Barcode.objects.get(pk=barcode_data.id, status='unused')
-                barcode.status = 'used'
-                barcode.save()
-                product.barcode = barcode
-                product.save()
-            except Barcode.DoesNotExist:
-                product.delete()
-                raise serializers.ValidationError(
-                    {"barcode": ["Barcode does not exist or is already in use."]}
-                )
+        sizes = validated_data.pop('sizes', [])
+        barcode = validated_data.pop('barcode', None)
+        allocate = validated_data.pop('allocate_barcode', False)
+
+        try:
+            with transaction.atomic():
+                # The claim is a conditional update, so a concurrent request cannot take the same code
+                if barcode:
+                    claim_barcode(barcode.pk)
+                    validated_data['barcode'] = barcode
+                elif allocate:
+                    validated_data['barcode_id'] = allocate_barcodes(1)[0]
+
+                product = Product.objects.create(**validated_data)
+                product.set_sizes(sizes)
+        except BarcodeUnavailable as e:
+            raise serializers.ValidationError({"barcode": [str(e)]})
         return product
 
     def update(self, instance, validated_data):
         sizes = validated_data.pop('sizes', None)
-        barcode_data = validated_data.pop('barcode', None)
+        barcode = validated_data.pop('barcode', None)
+        allocate = validated_data.pop('allocate_barcode', False)
 
         # Update fields
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        if sizes is not None:
-            instance.set_sizes(sizes.split(',') if sizes else [])
-
-        # Handle barcode update
-        if barcode_data:
-            try:
-                new_barcode = Barcode.objects.get(pk=barcode_data.id, status='unused')
-
-                # If an old barcode exists, mark it as unused
-                if instance.barcode:
-                    old_barcode = instance.barcode
-                    old_barcode.status = 'unused'
-                    old_barcode.save()
-
-                # Assign new barcode
-                new_barcode.status = 'used'
-                new_barcode.save()
-                instance.barcode = new_barcode
-            except Barcode.DoesNotExist:
-                raise serializers.ValidationError(
-                    {"barcode": ["Barcode does not exist or is already in use."]}
-                )
-
-        instance.save()
+        try:
+            with transaction.atomic():
+                if barcode:
+                    claim_barcode(barcode.pk)
+                    release_barcodes([instance.barcode_id])
+                    instance.barcode = barcode
+                elif allocate and not instance.barcode_id:
+                    instance.barcode_id = allocate_barcodes(1)[0]
+
+                if sizes is not None:
+                    instance.set_sizes(sizes)
+                instance.save()
+        except BarcodeUnavailable as e:
+            raise serializers.ValidationError({"barcode": [str(e)]})
         return instance
 
 class ProductInfoSerializer(ModelSerializer):
@@ -135,16 +148,22 @@ class DeliveryCompanySerializer(ModelSerializer):
         fields = ['id', 'name', 'contact_number', 'address', 'branch', 'state', 'website']
         read_only_fields = ['created_by']
 
+class OrderLineSerializer(ModelSerializer):
+    class Meta:
+        model = OrderLine
+        fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'line_total']
+
+
 class OrderSerializer(ModelSerializer):
     user = serializers.StringRelatedField()  # Representing user as their email
     delivery_company = DeliveryCompanySerializer(read_only=True)
     delivery_company_id = serializers.PrimaryKeyRelatedField(queryset=DeliveryCompany.objects.all(), write_only=True, source='delivery_company')
-    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-    product = ProductInfoSerializer(read_only=True)
+    lines = OrderLineSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ['id', 'user', 'delivery_company', 'delivery_company_id', 'product', 'status', 'quantity','created_at', 'updated_at', 'total_price']
+        fields = ['id', 'user', 'delivery_company', 'delivery_company_id', 'lines', 'status', 'created_at', 'updated_at', 'total_price']
+        read_only_fields = ['total_price']
 
     def get_user(self, obj):
         """Return the user's email and shipping details."""
@@ -161,6 +180,16 @@ class OrderSerializer(ModelSerializer):
         }
 
 
+class OrderListSerializer(ModelSerializer):
+    """Compact order history row; the lines are only loaded for the detail view."""
+    delivery_company = serializers.CharField(source='delivery_company.name', default=None, read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'status', 'total_price', 'item_count', 'delivery_company', 'created_at']
+
+
 class CartSerializer(ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product')
@@ -207,7 +236,7 @@ class ReviewSerializer(ModelSerializer):
 
 class AdminOrderHistorySerializer(ModelSerializer):
     user_details = serializers.SerializerMethodField()
-    product_details = serializers.SerializerMethodField()
+    lines = OrderLineSerializer(many=True, read_only=True)
     delivery_company = serializers.SerializerMethodField()
     
     class Meta:
@@ -215,10 +244,9 @@ class AdminOrderHistorySerializer(ModelSerializer):
         fields = [
             'id', 
             'user_details', 
-            'product_details', 
+            'lines', 
             'delivery_company', 
             'status', 
-            'quantity', 
             'total_price',
             'created_at', 
             'updated_at'
@@ -239,13 +267,6 @@ class AdminOrderHistorySerializer(ModelSerializer):
             }
         }
 
-    def get_product_details(self, obj):
-        return {
-            'id': obj.product.id,
-            'name': obj.product.name,
-            'price': obj.product.price
-        }
-    
     def get_delivery_company(self, obj):
         if obj.delivery_company:
             return {
@@ -0,0 +1,113 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .autocomplete import autocomplete_index
+from .images import schedule_variant_deletion, schedule_variants
+from .delivery import bump_version as bump_delivery_directory
+from .models import Barcode, Category, DeliveryCompany, Product, Review
+from .scanner import barcode_index
+from .search import install_search_index
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # An edited review moves its old rating out of the aggregates and the new one in
+    instance._saved_rating = None
+    if instance.pk is not None:
+        instance._saved_rating = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def add_review_rating(sender, instance, created, **kwargs):
+    saved = getattr(instance, '_saved_rating', None)
+    if saved == (instance.product_id, instance.rating):
+        return
+    if saved is not None:
+        Product.apply_review_rating(*saved, delta=-1)
+    Product.apply_review_rating(instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    Product.apply_review_rating(instance.product_id, instance.rating, delta=-1)
+
+
+
+@receiver(post_save, sender=Product)
+def index_product_name(sender, instance, **kwargs):
+    autocomplete_index.product_saved(instance)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_image(sender, instance, **kwargs):
+    instance._saved_image = None
+    if instance.pk is not None:
+        instance._saved_image = Product.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+    if (instance._saved_image or '') != (instance.image.name or ''):
+        # The renditions of the old image no longer match
+        instance.image_variants_ready = False
+
+
+@receiver(post_save, sender=Product)
+def generate_image_variants(sender, instance, **kwargs):
+    previous = instance._saved_image or ''
+    if previous and previous != instance.image.name:
+        schedule_variant_deletion(previous)
+    if instance.image and not instance.image_variants_ready:
+        schedule_variants(instance.image.name)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_name(sender, instance, **kwargs):
+    autocomplete_index.product_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+def index_product_barcode(sender, instance, **kwargs):
+    barcode_index.product_saved(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_barcode(sender, instance, **kwargs):
+    barcode_index.product_deleted(instance)
+
+
+@receiver(post_save, sender=Barcode)
+def reindex_barcode(sender, instance, created, **kwargs):
+    # A new barcode cannot be assigned to a product yet
+    if not created:
+        barcode_index.barcode_changed(instance)
+
+
+@receiver(post_delete, sender=Barcode)
+def unindex_barcode(sender, instance, **kwargs):
+    barcode_index.barcode_changed(instance)
+
+
+@receiver(post_save, sender=Category)
+def index_category_name(sender, instance, **kwargs):
+    autocomplete_index.category_saved(instance)
+
+
+@receiver(post_delete, sender=Category)
+def unindex_category_name(sender, instance, **kwargs):
+    autocomplete_index.category_deleted(instance)
+
+
+@receiver(post_save, sender=DeliveryCompany)
+@receiver(post_delete, sender=DeliveryCompany)
+def invalidate_delivery_directory(sender, instance, **kwargs):
+    # Only staff-created companies are in the cached directory; a customer's own are not
+    try:
+        is_directory_company = instance.created_by.is_staff
+    except ObjectDoesNotExist:
+        # The creator was deleted along with the company; assume it was listed
+        is_directory_company = True
+    if is_directory_company:
+        bump_delivery_directory()
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # SQLite drops the FTS triggers whenever a migration remakes shop_product
+    install_search_index(connections[using])
@@ -1,3 +1,1262 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ModelSerializer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from isansoriginal import instrumentation, media, profiling, routing
+from users.models import CustomUser, Notification, UserPreferredDeliveryCompany
+from .seed import ADMIN_EMAIL, seed
+from .autocomplete import autocomplete_index
+from .scanner import barcode_index
+from .serializers import AdminOrderHistorySerializer, BarcodeSerializer, ProductSerializer
+from .fast_serializers import FastAdminOrderHistorySerializer, FastBarcodeSerializer, FastProductSerializer
+from . import delivery, images
+from .catalog_io import CatalogImporter
+from .inventory import commit_reservation, deduct_stock
+from .models import (
+    Barcode, Cart, Category, DeliveryCompany, Order, OrderLine, Product, ProductSize, Review, StockReservation, Wishlist,
+)
 
-# Create your tests here.
+# SQLite reports a table read without any index as a bare "SCAN <table>"
+FULL_SCAN = re.compile(r'\bSCAN (\w+)$')
+
+
+@skipUnless(connection.vendor == 'sqlite', "Plans are read from SQLite's EXPLAIN QUERY PLAN output")
+class HotQueryPlanTests(TestCase):
+    """The queries behind the busiest endpoints must be answered from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password='password', state='Lagos')
+        other = CustomUser.objects.create_user(email='other@example.com', password='password')
+
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+        barcodes = Barcode.objects.bulk_create([Barcode(code=f'iSANS{1000 + i}') for i in range(60)])
+        products = []
+        for i in range(30):
+            products.append(Product.objects.create(
+                name=f'Product {i}', price=Decimal('10.00') + i, description='Description',
+                category=categories[i % 3], quantity=i % 4, barcode=barcodes[i] if i % 2 else None,
+            ))
+            ProductSize.objects.create(product=products[-1], size='M', quantity=i % 4)
+        Barcode.objects.filter(pk__in=[barcode.pk for barcode in barcodes[1:30:2]]).update(status='used')
+
+        company = DeliveryCompany.objects.create(
+            name='GIG', address='Address', branch='Ikeja', state='Lagos', created_by=cls.admin
+        )
+        for user in (cls.customer, other):
+            for i in range(5):
+                order = Order.objects.create(user=user, delivery_company=company, total_price=Decimal('20.00'))
+                OrderLine.objects.create(
+                    order=order, product=products[i], product_name=products[i].name, quantity=2,
+                    unit_price=Decimal('10.00'), line_total=Decimal('20.00'),
+                )
+            Cart.objects.create(user=user, product=products[0], quantity=1)
+            Wishlist.objects.create(user=user, product=products[1])
+            Review.objects.create(user=user, product=products[0], rating=4, comment='Good')
+            Notification.objects.create(user=user, message='Your order shipped')
+
+        cls.product = products[0]
+        cls.category = categories[0]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def full_scans(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            details = [row[-1] for row in cursor.fetchall()]
+        return [detail for detail in details if FULL_SCAN.search(detail)]
+
+    def assertEndpointUsesIndexes(self, path, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects, f"{path} ran no queries")
+        for sql in selects:
+            self.assertEqual(self.full_scans(sql), [], f"{path} scans a whole table:\n{sql}")
+
+    def test_order_history(self):
+        self.assertEndpointUsesIndexes('/shop/order-history/', self.customer)
+
+    def test_cart(self):
+        self.assertEndpointUsesIndexes('/shop/cart/', self.customer)
+
+    def test_wishlist(self):
+        self.assertEndpointUsesIndexes('/shop/wishlist/', self.customer)
+
+    def test_reviews(self):
+        self.assertEndpointUsesIndexes(f'/shop/see-reviews/{self.product.pk}/?sort=highest', self.customer)
+
+    def test_unused_barcodes(self):
+        self.assertEndpointUsesIndexes('/shop/barcode/?status=unused', self.admin)
+
+    def test_products_in_category(self):
+        self.assertEndpointUsesIndexes(f'/shop/get-products/?category={self.category.pk}&in_stock=1', self.customer)
+
+    def test_order_statistics(self):
+        self.assertEndpointUsesIndexes('/shop/admin-orders/statistics/', self.admin)
+
+    def test_unread_notifications(self):
+        queryset = Notification.objects.filter(user=self.customer, is_read=False)
+        sql, params = queryset.query.sql_with_params()
+        self.assertEqual(self.full_scans(sql, params), [])
+
+    def test_detects_full_scan(self):
+        # Guard against the check passing vacuously: an unindexed filter must be reported
+        queryset = Order.objects.filter(updated_at__gte=timezone.now() - timedelta(days=1))
+        sql, params = queryset.query.sql_with_params()
+        self.assertEqual(self.full_scans(sql, params), ['SCAN shop_order'])
+
+
+class HotViewQueryCountTests(TestCase):
+    """Query counts of the hot endpoints on seeded data; a new query per row shows up here first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        cls.admin = CustomUser.objects.get(email=ADMIN_EMAIL)
+        cls.customer = CustomUser.objects.filter(carts__isnull=False).order_by('email').first()
+
+    def setUp(self):
+        self.client = APIClient()
+        # Checkout reads the delivery directory from the cache; start every test warm
+        delivery.global_companies()
+
+    def assertQueries(self, count, method, path, user=None, **kwargs):
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(count):
+            response = getattr(self.client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 300, response.content)
+        return response
+
+    def test_get_products(self):
+        response = self.assertQueries(2, 'get', '/shop/get-products/')
+        self.assertEqual(len(response.data), Product.objects.count())
+
+    def test_cart(self):
+        self.assertQueries(3, 'get', '/shop/cart/', self.customer)
+
+    def test_checkout(self):
+        products = Product.objects.order_by('pk')[:2]
+        Product.objects.filter(pk__in=[product.pk for product in products]).update(quantity=1000, is_in_stock=True)
+        Cart.objects.filter(user=self.customer).delete()
+        Cart.objects.bulk_create([Cart(user=self.customer, product=product, quantity=2) for product in products])
+        company = DeliveryCompany.objects.order_by('pk').first()
+
+        # The cart, then inside a savepoint: the order, one stock update per line, the lines,
+        # the total and emptying the cart
+        self.assertQueries(9, 'post', '/shop/orders/', self.customer, data={'delivery_company_id': company.pk}, format='json')
+
+    def test_order_statistics(self):
+        self.assertQueries(3, 'get', '/shop/admin-orders/statistics/', self.admin)
+
+    def test_top_products_skip_deleted_products(self):
+        # Far ahead of any real product, but the products no longer exist
+        OrderLine.objects.filter(order__in=Order.objects.order_by('pk')[:50]).update(product=None, quantity=1000)
+        top = OrderLine.objects.filter(product__isnull=False).values('product_id').annotate(
+            total=Sum('quantity')
+        ).order_by('-total').first()
+
+        response = self.assertQueries(3, 'get', '/shop/admin-orders/statistics/', self.admin)
+        self.assertEqual(response.data['top_products'][0]['total_quantity'], top['total'])
+        self.assertNotIn(None, [entry['product_id'] for entry in response.data['top_products']])
+        first = response.data['top_products'][0]
+        self.assertEqual(first['product__name'], Product.objects.get(pk=first['product_id']).name)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/shop/metrics/')
+        self.assertEqual(response.data['top_products'][0]['total_quantity'], top['total'])
+
+    def test_order_history(self):
+        self.assertQueries(1, 'get', '/shop/order-history/', self.customer)
+
+
+class FastSerializerEquivalenceTests(TestCase):
+    """The fast list serializers must render exactly the bytes of the serializers they replace."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+        # Cover the optional values the seed never produces
+        Product.objects.filter(pk=1).update(image='products/dress.jpg', image_variants_ready=True)
+        Product.objects.filter(pk=4).update(image='products/gown.jpg')
+        Product.objects.filter(pk=2).update(barcode=None)
+        ProductSize.objects.filter(product_id=3).delete()
+        Order.objects.filter(pk=1).update(delivery_company=None)
+        OrderLine.objects.filter(order_id=2).update(product=None)
+
+    def assertSameJSON(self, slow, fast):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def test_products(self):
+        products = Product.objects.select_related('category').prefetch_related('product_sizes')
+        self.assertSameJSON(ProductSerializer(products, many=True).data, FastProductSerializer(products).data)
+
+    def test_products_with_request(self):
+        context = {'request': APIRequestFactory().get('/shop/get-products/')}
+        products = Product.objects.filter(pk=1).prefetch_related('product_sizes')
+        self.assertSameJSON(
+            ProductSerializer(products, many=True, context=context).data,
+            FastProductSerializer(products, context=context).data,
+        )
+
+    def test_admin_order_history(self):
+        orders = Order.objects.select_related('user', 'delivery_company').prefetch_related('lines').order_by('-created_at', 'id')
+        self.assertSameJSON(
+            AdminOrderHistorySerializer(orders, many=True).data, FastAdminOrderHistorySerializer(orders).data
+        )
+
+    def test_barcodes(self):
+        barcodes = Barcode.objects.order_by('id')
+        self.assertSameJSON(
+            BarcodeSerializer(barcodes, many=True).data,
+            FastBarcodeSerializer(list(barcodes.values('id', 'code', 'status'))).data,
+        )
+        self.assertSameJSON(BarcodeSerializer(barcodes, many=True).data, FastBarcodeSerializer(barcodes).data)
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password='password')
+        cls.other = CustomUser.objects.create_user(email='other@example.com', password='password')
+        category = Category.objects.create(name='Dresses')
+        cls.product = Product.objects.create(name='Dress', price=Decimal('10.00'), description='Dress', category=category)
+        cls.second = Product.objects.create(name='Gown', price=Decimal('12.00'), description='Gown', category=category)
+
+    def assertAggregates(self, product, count, total, histogram):
+        product.refresh_from_db()
+        self.assertEqual((product.rating_count, product.rating_sum), (count, total))
+        self.assertEqual(product.get_rating_histogram(), {str(i): histogram.get(i, 0) for i in range(1, 6)})
+
+    def test_create_edit_delete(self):
+        review = Review.objects.create(user=self.customer, product=self.product, rating=2, comment='Meh')
+        Review.objects.create(user=self.other, product=self.product, rating=5, comment='Great')
+        self.assertAggregates(self.product, 2, 7, {2: 1, 5: 1})
+
+        review.rating = 4
+        review.save()
+        self.assertAggregates(self.product, 2, 9, {4: 1, 5: 1})
+
+        review.comment = 'Better than I thought'
+        review.save()
+        self.assertAggregates(self.product, 2, 9, {4: 1, 5: 1})
+
+        review.product = self.second
+        review.save()
+        self.assertAggregates(self.product, 1, 5, {5: 1})
+        self.assertAggregates(self.second, 1, 4, {4: 1})
+
+        review.delete()
+        self.assertAggregates(self.second, 0, 0, {})
+
+    def test_migration_backfill(self):
+        Review.objects.bulk_create([
+            Review(user=self.customer, product=self.product, rating=3, comment='Fine'),
+            Review(user=self.other, product=self.product, rating=5, comment='Great'),
+        ])
+        migration = importlib.import_module('shop.migrations.0005_product_rating_aggregates')
+        migration.backfill_rating_aggregates(apps, None)
+        self.assertAggregates(self.product, 2, 8, {3: 1, 5: 1})
+        self.assertAggregates(self.second, 0, 0, {})
+
+
+class ReviewFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dresses')
+        cls.product = Product.objects.create(name='Dress', price=Decimal('10.00'), description='Dress', category=category)
+        for i, rating in enumerate([5, 3, 5]):
+            user = CustomUser.objects.create_user(email=f'reviewer{i}@example.com', password='password')
+            Review.objects.create(user=user, product=cls.product, rating=rating, comment=f'Review {i}')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_reviews(self):
+        response = self.client.get(f'/shop/see-reviews/{self.product.pk}/?sort=highest&page_size=2')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['total_reviews'], 3)
+        self.assertEqual([review['rating'] for review in response.data['reviews']], [5, 5])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([review['rating'] for review in response.data['reviews']], [3])
+        self.assertIsNone(response.data['next'])
+
+    def test_rating_filter(self):
+        response = self.client.get(f'/shop/see-reviews/{self.product.pk}/?rating=5')
+        self.assertEqual(response.data['total_reviews'], 2)
+        self.assertEqual(len(response.data['reviews']), 2)
+
+    def test_tampered_cursor(self):
+        for values in (['x', '1'], [None, {}], ['2026-01-01T00:00:00', 'id']):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            response = self.client.get(f'/shop/see-reviews/{self.product.pk}/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_no_reviews(self):
+        Review.objects.all().delete()
+        response = self.client.get(f'/shop/see-reviews/{self.product.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class AutocompleteIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Dresses')
+        cls.product = Product.objects.create(name='Ankara gown', price=Decimal('10.00'), description='Gown', category=cls.category)
+
+    def setUp(self):
+        autocomplete_index.rebuild()
+        self.addCleanup(setattr, autocomplete_index, '_index', None)
+
+    def names(self, query):
+        return [suggestion['name'] for suggestion in autocomplete_index.suggest(query)]
+
+    def test_updates_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Kaftan gown'
+            self.product.save()
+            self.assertEqual(self.names('kaf'), [])
+        self.assertEqual(self.names('kaf'), ['Kaftan gown'])
+
+    def test_rolled_back_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.product.name = 'Kaftan gown'
+                self.product.save()
+                raise RuntimeError
+        self.assertEqual(self.names('kaf'), [])
+        self.assertEqual(self.names('ank'), ['Ankara gown'])
+
+    def test_reloads_after_ttl(self):
+        # Writes that never reach this process's signal handlers
+        Product.objects.filter(pk=self.product.pk).update(name='Linen gown')
+        self.assertEqual(self.names('lin'), [])
+        with override_settings(AUTOCOMPLETE_INDEX_TTL=0):
+            self.assertEqual(self.names('lin'), ['Linen gown'])
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dresses = Category.objects.create(name='Dresses')
+        cls.shoes = Category.objects.create(name='Shoes')
+        cls.described = Product.objects.create(
+            name='Summer dress', price=Decimal('10.00'), description='Ankara print', category=cls.dresses
+        )
+        cls.named = Product.objects.create(
+            name='Ankara gown', price=Decimal('10.00'), description='Long gown', category=cls.dresses
+        )
+        cls.sandals = Product.objects.create(
+            name='Ankara sandals', price=Decimal('10.00'), description='Leather', category=cls.shoes
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, query, **params):
+        response = self.client.get('/shop/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def names(self, query, **params):
+        return [product['name'] for product in self.search(query, **params)['results']]
+
+    def test_name_matches_rank_first(self):
+        names = self.names('ankara')
+        self.assertEqual(names[-1], 'Summer dress')
+        self.assertEqual(sorted(names[:2]), ['Ankara gown', 'Ankara sandals'])
+
+    def test_last_term_matches_as_prefix(self):
+        self.assertEqual(self.names('sand'), ['Ankara sandals'])
+        self.assertEqual(self.names('ankara go'), ['Ankara gown'])
+        self.assertEqual(self.names('sandals leath'), ['Ankara sandals'])
+        # Only the last term is a prefix
+        self.assertEqual(self.names('sand leather'), [])
+
+    def test_facets_ignore_category_filter(self):
+        data = self.search('ankara', category='Shoes')
+        self.assertEqual(data['total'], 1)
+        self.assertEqual([product['name'] for product in data['results']], ['Ankara sandals'])
+        self.assertEqual(data['facets'], [{'category': 'Dresses', 'count': 2}, {'category': 'Shoes', 'count': 1}])
+
+    def test_index_follows_writes(self):
+        product = Product.objects.create(name='Kaftan', price=Decimal('10.00'), description='Silk', category=self.dresses)
+        self.assertEqual(self.names('kaftan'), ['Kaftan'])
+
+        product.name = 'Boubou'
+        product.save()
+        self.assertEqual(self.names('kaftan'), [])
+        self.assertEqual(self.names('boubou'), ['Boubou'])
+
+        product.delete()
+        self.assertEqual(self.names('boubou'), [])
+
+    def test_rejects_missing_query(self):
+        self.assertEqual(self.client.get('/shop/search/').status_code, 400)
+        self.assertEqual(self.client.get('/shop/search/', {'q': 'ankara', 'category': 'Hats'}).status_code, 404)
+
+
+class ProductSizesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        cls.category = Category.objects.create(name='Dresses')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create(self, sizes, format=None):
+        data = {'name': 'Dress', 'price': '10.00', 'description': 'Dress', 'category': 'Dresses', 'sizes': sizes}
+        return self.client.post('/shop/products/', data, format=format)
+
+    def test_multipart_sizes(self):
+        for sizes in (['L', 'M'], 'L,M', 'L, M, M'):
+            response = self.create(sizes)
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(response.data['sizes'], ['M', 'L'])
+            self.assertEqual(response.data['size_stock'], {'M': 0, 'L': 0})
+
+    def test_json_sizes(self):
+        for sizes in (['XL', 'S'], 'XL,S'):
+            response = self.create(sizes, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(response.data['sizes'], ['S', 'XL'])
+
+    def test_update_replaces_sizes(self):
+        product_id = self.create(['S', 'M'], format='json').data['id']
+        response = self.client.put(f'/shop/products/{product_id}/', {'sizes': ['M', 'L']}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['sizes'], ['M', 'L'])
+        self.assertEqual(sorted(ProductSize.objects.filter(product_id=product_id).values_list('size', flat=True)), ['L', 'M'])
+
+    def test_invalid_sizes(self):
+        for sizes, format in ((['M', 'XXL'], 'json'), ('M,huge', None), (7, 'json')):
+            response = self.create(sizes, format=format)
+            self.assertEqual(response.status_code, 400, sizes)
+            self.assertIn('sizes', response.data)
+        self.assertFalse(Product.objects.exists())
+
+    def test_filter_by_size(self):
+        small = Product.objects.create(name='Small', price=Decimal('10.00'), description='Dress', category=self.category)
+        medium = Product.objects.create(name='Medium', price=Decimal('10.00'), description='Dress', category=self.category)
+        small.set_sizes(['S'])
+        medium.set_sizes(['S', 'M'])
+
+        response = self.client.get('/shop/get-products/', {'size': 'M'})
+        self.assertEqual([product['name'] for product in response.data], ['Medium'])
+        response = self.client.get('/shop/get-products/', {'size': 'S,M'})
+        self.assertEqual(sorted(product['name'] for product in response.data), ['Medium', 'Small'])
+        self.assertEqual(self.client.get('/shop/get-products/', {'size': 'XXL'}).status_code, 400)
+
+
+class ProductBarcodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        Category.objects.create(name='Dresses')
+        cls.barcode = Barcode.objects.create(code='1000000001', status='unused')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def data(self, **fields):
+        return {'name': 'Dress', 'price': '10.00', 'description': 'Dress', 'category': 'Dresses', **fields}
+
+    def assertBarcodeStatus(self, status):
+        self.barcode.refresh_from_db()
+        self.assertEqual(self.barcode.status, status)
+
+    def test_allocates_next_free_barcode(self):
+        response = self.client.post('/shop/products/', self.data(allocate_barcode=True), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['barcode'], self.barcode.pk)
+        self.assertBarcodeStatus('used')
+
+    def test_allocate_from_empty_pool(self):
+        Barcode.objects.update(status='used')
+        response = self.client.post('/shop/products/', self.data(allocate_barcode=True), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('barcode', response.data)
+        self.assertFalse(Product.objects.exists())
+
+    def test_claim_of_used_barcode(self):
+        serializer = ProductSerializer(data=self.data(barcode=self.barcode.pk))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        # Taken by another request after validation
+        Barcode.objects.filter(pk=self.barcode.pk).update(status='used')
+        with self.assertRaises(ValidationError) as raised:
+            serializer.save()
+        self.assertIn('barcode', raised.exception.detail)
+        self.assertFalse(Product.objects.exists())
+
+        response = self.client.post('/shop/products/', self.data(barcode={'code': self.barcode.code}), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+    def test_failed_save_releases_barcode(self):
+        for fields in ({'barcode': self.barcode.pk}, {'allocate_barcode': True}):
+            serializer = ProductSerializer(data=self.data(sizes=['M'], **fields))
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            with mock.patch.object(Product, 'set_sizes', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+                serializer.save()
+            self.assertBarcodeStatus('unused')
+        self.assertFalse(Product.objects.exists())
+
+    def test_delete_releases_barcode(self):
+        product_id = self.client.post('/shop/products/', self.data(allocate_barcode=True), format='json').data['id']
+        self.assertEqual(self.client.delete(f'/shop/products/{product_id}/').status_code, 200)
+        self.assertBarcodeStatus('unused')
+
+
+class BarcodeListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        for code in ('12', '120', '1200', '1209', '1210', '1299', '1300', '11999', '2120'):
+            Barcode.objects.create(code=code, status='used' if code.endswith('9') else 'unused')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def codes(self, **params):
+        response = self.client.get('/shop/barcode/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(barcode['code'] for barcode in response.data['barcodes'])
+
+    def test_prefix_is_a_code_range(self):
+        self.assertEqual(self.codes(prefix='12'), ['12', '120', '1200', '1209', '1210', '1299'])
+        self.assertEqual(self.codes(prefix='120'), ['120', '1200', '1209'])
+        self.assertEqual(self.codes(prefix='12', status='used'), ['1209', '1299'])
+        self.assertEqual(self.codes(code_from='1209', code_to='13'), ['1209', '1210', '1299'])
+        self.assertEqual(self.codes(prefix='9'), [])
+        self.assertEqual(self.client.get('/shop/barcode/', {'status': 'lost'}).status_code, 400)
+
+    def test_keyset_pages(self):
+        seen = []
+        url = '/shop/barcode/?page_size=2&status=unused'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['barcodes']), 2)
+            seen.extend(barcode['id'] for barcode in response.data['barcodes'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Barcode.objects.filter(status='unused').order_by('id').values_list('id', flat=True)))
+
+    def test_summary(self):
+        response = self.client.get('/shop/barcode/', {'summary': '1'})
+        self.assertEqual(response.data, {'used': 3, 'unused': 6, 'total': 9})
+
+
+class CatalogImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        cls.category = Category.objects.create(name='Dresses')
+        cls.free = Barcode.objects.create(code='1000000001', status='unused')
+        cls.used = Barcode.objects.create(code='1000000002', status='used')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, name, content):
+        response = self.client.post(
+            '/shop/products/import/', {'file': SimpleUploadedFile(name, content.encode())}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def ndjson(self, *records):
+        return CatalogImporter().run(enumerate(records, start=1))
+
+    def record(self, name, **fields):
+        return {'name': name, 'price': '10.00', 'description': 'Dress', 'category': 'Dresses', **fields}
+
+    def test_errors_are_reported_per_row(self):
+        report = self.upload('products.csv', (
+            "name,price,description,category,sizes,quantity\n"
+            "Gown,10.00,Gown,Dresses,M,2\n"
+            "Skirt,-1,Skirt,Dresses,,1\n"
+            "Blouse,10.00,Blouse,Hats,,1\n"
+            "Kaftan,10.00,Kaftan,Dresses,XXL,2.5\n"
+        ))
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 5])
+        self.assertEqual(set(report['errors'][2]['errors']), {'sizes', 'quantity'})
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Gown'])
+
+    def test_quantity_must_be_integral(self):
+        report = self.ndjson(
+            self.record('Gown', quantity=2.0), self.record('Skirt', quantity=2.5), self.record('Wrap', quantity=True)
+        )
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertEqual(Product.objects.get().quantity, 2)
+
+    def test_barcode_conflicts(self):
+        report = self.ndjson(
+            self.record('Gown', barcode=self.free.code),
+            self.record('Skirt', barcode=self.free.code),
+            self.record('Wrap', barcode=self.used.code),
+            self.record('Blouse', barcode='9999999999'),
+        )
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4])
+        self.assertEqual(Product.objects.get().barcode, self.free)
+
+    def test_concurrent_claim_fails_only_its_row(self):
+        importer = CatalogImporter()
+        write = importer._write
+
+        def taken_first(rows):
+            # Another admin claims the code between validation and the write
+            Barcode.objects.filter(pk=self.free.pk).update(status='used')
+            return write(rows)
+
+        with mock.patch.object(importer, '_write', side_effect=taken_first):
+            report = importer.run([(1, self.record('Gown', barcode=self.free.code)), (2, self.record('Skirt'))])
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['errors'], [
+            {'row': 1, 'errors': {'barcode': f"Barcode {self.free.code} is already in use."}}
+        ])
+        self.assertEqual(Product.objects.get().name, 'Skirt')
+
+        # The rolled-back claim no longer blocks the code for later rows
+        Barcode.objects.filter(pk=self.free.pk).update(status='unused')
+        report = importer.run([(3, self.record('Gown', barcode=self.free.code))])
+        self.assertEqual(report['created'], 2, report['errors'])
+        self.assertEqual(Product.objects.get(name='Gown').barcode, self.free)
+
+    def test_exhausted_pool_fails_only_auto_rows(self):
+        Barcode.objects.filter(pk=self.free.pk).update(status='used')
+        report = self.ndjson(self.record('Gown', barcode='auto'), self.record('Skirt'))
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [1])
+        self.assertEqual(Product.objects.get().name, 'Skirt')
+
+    def test_export_round_trip(self):
+        product = Product.objects.create(
+            name='Gown, long', price=Decimal('12.50'), description='Line one\nline two', category=self.category,
+            quantity=3, barcode=self.used,
+        )
+        product.set_sizes(['L', 'S'])
+        Product.objects.create(name='Skirt', price=Decimal('8.00'), description='Skirt', category=self.category)
+        before = list(Product.objects.order_by('id').values('name', 'price', 'description', 'quantity', 'barcode'))
+
+        for file_format in ('csv', 'ndjson'):
+            response = self.client.get('/shop/products/export/', {'file_format': file_format})
+            self.assertEqual(response.status_code, 200)
+            content = b''.join(response.streaming_content).decode()
+
+            report = self.upload(f'products.{file_format}', content)
+            self.assertEqual((report['created'], report['updated'], report['errors']), (0, 2, []), file_format)
+            after = Product.objects.order_by('id').values('name', 'price', 'description', 'quantity', 'barcode')
+            self.assertEqual(list(after), before)
+            self.assertEqual(Product.objects.get(pk=product.pk).sizes, ['S', 'L'])
+
+
+class CheckoutReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password='password')
+        cls.company = DeliveryCompany.objects.create(
+            name='GIG', address='Address', branch='Ikeja', state='Lagos', created_by=admin
+        )
+        category = Category.objects.create(name='Dresses')
+        cls.product = Product.objects.create(
+            name='Dress', price=Decimal('10.00'), description='Dress', category=category, quantity=5
+        )
+        ProductSize.objects.create(product=cls.product, size='M', quantity=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def reserve(self, quantity=2):
+        response = self.client.post(
+            '/shop/reservations/', {'items': [{'product_id': self.product.pk, 'size': 'M', 'quantity': quantity}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data['reservation']
+
+    def checkout(self, reservation, quantity=2):
+        Cart.objects.create(user=self.customer, product=self.product, quantity=quantity)
+        return self.client.post(
+            '/shop/orders/', {'delivery_company_id': self.company.pk, 'reservation': reservation}, format='json'
+        )
+
+    def assertStock(self, total, size):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, total)
+        self.assertEqual(ProductSize.objects.get(product=self.product, size='M').quantity, size)
+
+    def test_reserved_checkout(self):
+        reservation = self.reserve()
+        response = self.checkout(reservation)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertStock(3, 3)
+        self.assertEqual(
+            list(StockReservation.objects.values_list('status', 'order_id')), [('committed', response.data['id'])]
+        )
+
+    def test_reference_reuse(self):
+        reservation = self.reserve()
+        self.assertEqual(self.checkout(reservation).status_code, 201)
+        Cart.objects.filter(user=self.customer).delete()
+
+        response = self.checkout(reservation)
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertStock(3, 3)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertTrue(Cart.objects.filter(user=self.customer).exists())
+
+    def test_expired_hold(self):
+        reservation = self.reserve()
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.checkout(reservation)
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertStock(3, 3)
+        self.assertFalse(Order.objects.exists())
+
+    def test_committed_by_payment(self):
+        reservation = self.reserve()
+        self.assertEqual(commit_reservation(self.customer, reservation), 1)
+        self.assertEqual(self.checkout(reservation).status_code, 201)
+        self.assertStock(3, 3)
+
+    def test_uncovered_units_return_to_stock(self):
+        reservation = self.reserve(3)
+        self.assertStock(2, 2)
+        response = self.checkout(reservation, quantity=1)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertStock(4, 4)
+        self.assertEqual(
+            list(StockReservation.objects.values_list('status', 'quantity', 'order_id')),
+            [('committed', 1, response.data['id'])],
+        )
+
+    def test_reservation_for_product_not_in_cart(self):
+        other = Product.objects.create(
+            name='Scarf', price=Decimal('5.00'), description='Scarf', category=self.product.category, quantity=4
+        )
+        ProductSize.objects.create(product=other, size='FS', quantity=4)
+        response = self.client.post('/shop/reservations/', {'items': [
+            {'product_id': self.product.pk, 'size': 'M', 'quantity': 2},
+            {'product_id': other.pk, 'size': 'FS', 'quantity': 3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        self.assertEqual(self.checkout(response.data['reservation']).status_code, 201)
+        self.assertStock(3, 3)
+        other.refresh_from_db()
+        self.assertEqual(other.quantity, 4)
+        self.assertEqual(ProductSize.objects.get(product=other).quantity, 4)
+        self.assertEqual(StockReservation.objects.get(product_size__product=other).status, 'released')
+
+    def test_admin_size_edit_keeps_unreserved_sales(self):
+        # Sold without a reservation: only the product total moves
+        self.assertEqual(self.checkout(None).status_code, 201)
+        self.assertStock(3, 5)
+
+        size = ProductSize.objects.get(product=self.product)
+        self.client.force_login(CustomUser.objects.get(email='admin@example.com'))
+        response = self.client.post(f'/admin/shop/product/{self.product.pk}/change/', {
+            'name': 'Dress', 'price': '10.00', 'description': 'Dress', 'category': self.product.category_id,
+            'product_sizes-TOTAL_FORMS': '1', 'product_sizes-INITIAL_FORMS': '1',
+            'product_sizes-MIN_NUM_FORMS': '0', 'product_sizes-MAX_NUM_FORMS': '1000',
+            'product_sizes-0-id': size.pk, 'product_sizes-0-product': self.product.pk,
+            'product_sizes-0-size': 'M', 'product_sizes-0-quantity': '8',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertStock(6, 8)
+
+
+class StockSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        category = Category.objects.create(name='Dresses')
+        cls.product = Product.objects.create(
+            name='Dress', price=Decimal('10.00'), description='Dress', category=category, quantity=5
+        )
+
+    def sync(self, *records):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/shop/stock-sync/', {'records': list(records)}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.product.refresh_from_db()
+        return response.data
+
+    def test_delta_after_level_is_clamped(self):
+        self.sync({'product_id': self.product.pk, 'quantity': 2}, {'product_id': self.product.pk, 'delta': -5})
+        self.assertEqual((self.product.quantity, self.product.is_in_stock), (0, False))
+
+    def test_deltas_accumulate(self):
+        self.sync({'product_id': self.product.pk, 'delta': -2}, {'product_id': self.product.pk, 'delta': -1})
+        self.assertEqual(self.product.quantity, 2)
+
+    def test_rejects_bools_and_fractions(self):
+        data = self.sync(
+            {'product_id': self.product.pk, 'quantity': True},
+            {'product_id': self.product.pk, 'delta': 2.5},
+            {'product_id': True, 'quantity': 1},
+            {'product_id': self.product.pk, 'quantity': 3.0},
+        )
+        self.assertEqual([error['index'] for error in data['errors']], [0, 1, 2])
+        self.assertEqual(self.product.quantity, 3)
+
+
+
+class ScannerIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Dresses')
+        cls.barcode = Barcode.objects.create(code='1000000001', status='used')
+        cls.product = Product.objects.create(
+            name='Dress', price=Decimal('10.00'), description='Dress', category=category, quantity=5, barcode=cls.barcode
+        )
+
+    def setUp(self):
+        self.addCleanup(barcode_index.__init__)
+        barcode_index.__init__()
+
+    def test_warm_loads_index(self):
+        barcode_index.warm()
+        self.assertTrue(barcode_index.is_built)
+        with self.assertNumQueries(0):
+            self.assertEqual(barcode_index.lookup(self.barcode.code)['product_id'], self.product.pk)
+
+    def test_warm_never_raises(self):
+        with mock.patch.object(barcode_index, 'rebuild', side_effect=DatabaseError), self.assertLogs('shop.scanner', 'WARNING'):
+            barcode_index.warm()
+        self.assertFalse(barcode_index.is_built)
+
+    def test_reloads_after_ttl(self):
+        barcode_index.warm()
+        # Writes that never reach this process's signal handlers
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('12.00'))
+        self.assertEqual(barcode_index.lookup(self.barcode.code)['price'], Decimal('10.00'))
+        with override_settings(SCAN_INDEX_TTL=0):
+            self.assertEqual(barcode_index.lookup(self.barcode.code)['price'], Decimal('12.00'))
+
+    def test_bulk_stock_change_drops_entry_after_commit(self):
+        barcode_index.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(deduct_stock(self.product.pk, 2))
+            self.assertEqual(barcode_index.lookup(self.barcode.code)['quantity'], 5)
+        self.assertEqual(barcode_index.lookup(self.barcode.code)['quantity'], 3)
+
+    def test_rolled_back_stock_change_keeps_entry(self):
+        barcode_index.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                deduct_stock(self.product.pk, 2)
+                raise RuntimeError
+        with self.assertNumQueries(0):
+            self.assertEqual(barcode_index.lookup(self.barcode.code)['quantity'], 5)
+
+
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class ImageVariantTests(TransactionTestCase):
+    """Variants are generated after commit, advertised once stored and removed when replaced."""
+
+    def setUp(self):
+        # Run the worker pool's jobs inline
+        patcher = mock.patch.object(images, '_executor', SimpleNamespace(submit=lambda fn, *args: fn(*args)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.category = Category.objects.create(name='Dresses')
+
+    def upload(self, name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_replaced_image(self):
+        product = Product(name='Dress', price=Decimal('10.00'), description='Dress', category=self.category)
+        # Generation not finished: no variants are advertised
+        with mock.patch.object(images, 'schedule_variants'):
+            product.image = self.upload('dress.jpg')
+            product.save()
+        self.assertIsNone(ProductSerializer(product).data['image_variants'])
+
+        product.save()
+        product.refresh_from_db()
+        first = product.image.name
+        self.assertRegex(first, r'^products/dress\.[0-9a-f]{12}\.jpg$')
+        self.assertEqual(media.cache_control_for(first), media.IMMUTABLE)
+        thumbnail = images.variant_name(first, 'thumbnail', webp=True)
+        self.assertTrue(product.image_variants_ready)
+        self.assertTrue(default_storage.exists(thumbnail))
+        self.assertEqual(ProductSerializer(product).data['image_variants']['thumbnail']['webp'], default_storage.url(thumbnail))
+
+        product.image = self.upload('gown.jpg')
+        product.save()
+        product.refresh_from_db()
+        self.assertTrue(product.image_variants_ready)
+        self.assertFalse(default_storage.exists(thumbnail))
+        self.assertTrue(default_storage.exists(images.variant_name(product.image.name, 'thumbnail', webp=True)))
+
+    def test_direct_save_hashes_new_content(self):
+        product = Product.objects.create(name='Dress', price=Decimal('10.00'), description='Dress', category=self.category)
+        for name, color in (('dress.JPG', 'red'), ('dress.JPG', 'blue')):
+            buffer = io.BytesIO()
+            Image.new('RGB', (80, 60), color).save(buffer, 'JPEG')
+            product.image.save(name, ContentFile(buffer.getvalue()))
+            digest = hashlib.sha256(buffer.getvalue()).hexdigest()[:12]
+            self.assertEqual(product.image.name, f'products/dress.{digest}.jpg')
+            self.assertEqual(Product.objects.get(pk=product.pk).image.name, product.image.name)
+
+
+
+@override_settings(SENDFILE_BACKEND='')
+class MediaServeTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        with open(f'{self.root}/file.txt', 'wb') as handle:
+            handle.write(b'0123456789')
+
+    def get(self, range_header=None):
+        headers = {'HTTP_RANGE': range_header} if range_header else {}
+        response = media.serve(RequestFactory().get('/media/file.txt', **headers), 'file.txt', self.root)
+        return response.status_code, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_ranges(self):
+        self.assertEqual(self.get('bytes=2-4'), (206, b'234'))
+        self.assertEqual(self.get('bytes=-3'), (206, b'789'))
+        self.assertEqual(self.get('bytes=8-'), (206, b'89'))
+        self.assertEqual(self.get('bytes=10-')[0], 416)
+
+    def test_malformed_range_is_ignored(self):
+        for header in ('bytes=abc', 'items=0-1', 'bytes=0-1,4-5', 'bytes=5-2'):
+            self.assertEqual(self.get(header), (200, b'0123456789'), header)
+
+    def test_cache_control(self):
+        self.assertEqual(media.cache_control_for('css/base.5af6a0c7b1e2.css'), media.IMMUTABLE)
+        self.assertEqual(media.cache_control_for('products/dress.5af6a0c7b1e2.thumbnail.webp'), media.IMMUTABLE)
+        self.assertNotEqual(media.cache_control_for('products/dress.jpg'), media.IMMUTABLE)
+        self.assertNotEqual(media.cache_control_for('products/dress.thumbnail.webp'), media.IMMUTABLE)
+
+
+
+class DeliveryDirectoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password='password')
+        cls.company = DeliveryCompany.objects.create(
+            name='GIG', address='Address', branch='Ikeja', state='Lagos', created_by=cls.admin
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get_company_from_cache(self):
+        delivery.global_companies()
+        with self.assertNumQueries(0):
+            company = delivery.get_company(self.customer, self.company.pk)
+        self.assertEqual((company.pk, company.name, company._state.db), (self.company.pk, 'GIG', 'default'))
+
+    def test_unsignalled_write_seen_after_expiry(self):
+        delivery.get_company(self.customer, self.company.pk)
+        # A write another worker made: this process's cache never hears of it
+        other, = DeliveryCompany.objects.bulk_create([DeliveryCompany(
+            name='DHL', address='Address', branch='Wuse', state='Abuja', created_by=self.admin
+        )])
+        self.assertIsNone(delivery.get_company(self.customer, other.pk))
+
+        cache.delete(delivery.VERSION_KEY)
+        self.assertEqual(delivery.get_company(self.customer, other.pk).name, 'DHL')
+
+    def test_only_directory_writes_bump_version(self):
+        version = delivery._version()
+        own = DeliveryCompany.objects.create(
+            name='Courier', address='Address', branch='Yaba', state='Lagos', created_by=self.customer
+        )
+        own.name = 'My courier'
+        own.save()
+        own.delete()
+        self.assertEqual(delivery._version(), version)
+
+        self.company.name = 'GIG Logistics'
+        self.company.save()
+        self.assertEqual(delivery._version(), version + 1)
+        DeliveryCompany.objects.get(pk=self.company.pk).delete()
+        self.assertEqual(delivery._version(), version + 2)
+
+    def test_deleting_staff_creator_bumps_version(self):
+        version = delivery._version()
+        self.admin.delete()
+        self.assertGreater(delivery._version(), version)
+        self.assertEqual(delivery.global_companies(), [])
+
+
+
+class DeliverySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        cls.customer = CustomUser.objects.create_user(email='customer@example.com', password='password', state='Lagos')
+        other = CustomUser.objects.create_user(email='other@example.com', password='password')
+        for name, state, branch, creator in (
+            ('GIG', 'Lagos', 'Ikeja', admin),
+            ('DHL', 'Lagos', 'Yaba', admin),
+            ('Gokada', 'LAGOS', ' ikeja ', admin),
+            ('ABC', 'Abuja', 'Wuse', admin),
+            ('Max', 'Lagos', 'Ikeja', cls.customer),
+            ('Kwik', 'Lagos', 'Ikeja', other),
+        ):
+            DeliveryCompany.objects.create(name=name, address='Address', branch=branch, state=state, created_by=creator)
+        UserPreferredDeliveryCompany.objects.create(
+            user=cls.customer, delivery_company=DeliveryCompany.objects.get(name='DHL')
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def names(self, **params):
+        response = self.client.get('/shop/delivery-directory/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [company['name'] for company in response.data['companies']]
+
+    def test_defaults_to_users_state(self):
+        response = self.client.get('/shop/delivery-directory/search/')
+        self.assertEqual(response.data['state'], 'Lagos')
+        # Preferred first, then by state and name; other customers' companies are never listed
+        self.assertEqual([company['name'] for company in response.data['companies']], ['DHL', 'Gokada', 'GIG', 'Max'])
+
+    def test_filters(self):
+        self.assertEqual(self.names(state=' abuja'), ['ABC'])
+        self.assertEqual(self.names(branch='IKEJA'), ['Gokada', 'GIG', 'Max'])
+        self.assertEqual(self.names(name='g'), ['Gokada', 'GIG'])
+        self.assertEqual(self.names(name='gi', branch='ikeja'), ['GIG'])
+        self.assertEqual(self.names(state='Kano'), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica', 'replica2'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions only; no database connection is opened."""
+
+    class ReadView:
+        replica_reads = True
+
+    # Test transactions keep reads on the primary, so these run outside one
+    customer = CustomUser(id=uuid.UUID(int=1), email='customer@example.com')
+    other = CustomUser(id=uuid.UUID(int=2), email='other@example.com')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def route(self, request, user=None):
+        def view(request):
+            middleware.process_view(request, view_func, (), {})
+            if user is not None:
+                # What DRF does once it has authenticated the request
+                request.user = user
+            return HttpResponse(','.join(str(routing.replica_for_read()) for _ in range(20)), status=201)
+
+        view_func = SimpleNamespace(view_class=self.ReadView)
+        middleware = routing.ReplicaRoutingMiddleware(view)
+        aliases = set(middleware(request).content.decode().split(','))
+        self.assertEqual(len(aliases), 1, "one replica per request")
+        return aliases.pop()
+
+    def get(self, user):
+        return self.factory.get('/shop/get-products/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def test_reads_use_one_replica(self):
+        self.assertIn(self.route(self.get(self.customer)), ['replica', 'replica2'])
+        self.assertIn(self.route(self.factory.get('/shop/get-products/')), ['replica', 'replica2'])
+
+    def test_writer_pinned_to_primary(self):
+        self.assertEqual(self.route(self.factory.post('/shop/cart/'), user=self.customer), 'None')
+        self.assertEqual(self.route(self.get(self.customer)), 'None')
+        self.assertIn(self.route(self.get(self.other)), ['replica', 'replica2'])
+
+    def test_invalid_token(self):
+        request = self.factory.get('/shop/get-products/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertIn(self.route(request), ['replica', 'replica2'])
+
+
+
+class InstrumentationTests(TestCase):
+    def test_histogram(self):
+        histogram = instrumentation.Histogram('test_seconds', 'Test.', (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('View', 'GET'), value)
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="View",method="GET",le="0.1"} 2',
+            'test_seconds_bucket{view="View",method="GET",le="1"} 3',
+            'test_seconds_bucket{view="View",method="GET",le="+Inf"} 4',
+            'test_seconds_sum{view="View",method="GET"} 3.65',
+            'test_seconds_count{view="View",method="GET"} 4',
+        ])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.client.get('/shop/getcategory/')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_requests_total{view="GetCategory",method="GET",status="200"}', response.content.decode())
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_without_token_needs_staff(self):
+        customer = CustomUser.objects.create_user(email='customer@example.com', password='password')
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='password')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        bearer = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(customer)}'}
+        self.assertEqual(self.client.get('/metrics', **bearer).status_code, 403)
+        bearer = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(admin)}'}
+        self.assertEqual(self.client.get('/metrics', **bearer).status_code, 200)
+
+    @override_settings(QUERY_REPEAT_THRESHOLD=3)
+    def test_repeated_queries(self):
+        def view(request):
+            # The same shape with different values and IN-list lengths
+            for i in range(1, 5):
+                list(Product.objects.filter(pk__in=range(i)))
+            return HttpResponse()
+
+        middleware = instrumentation.InstrumentationMiddleware(view)
+        labels = ('unresolved', 'GET')
+        before = instrumentation.REPEATED_QUERIES.series[labels]
+        with self.assertLogs('isansoriginal.requests', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertEqual(instrumentation.REPEATED_QUERIES.series[labels], before + 1)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('"count": 4', logs.output[0])
+
+    def test_serializer_time(self):
+        category = Category.objects.create(name='Dresses')
+        Product.objects.create(name='Dress', price=Decimal('10.00'), description='Dress', category=category)
+
+        class PlainCategorySerializer(ModelSerializer):
+            class Meta:
+                model = Category
+                fields = ['id', 'name']
+
+        def serializer_time(serializer):
+            def view(request):
+                serializer.data
+                return HttpResponse()
+
+            recorded = []
+            with mock.patch.object(instrumentation.InstrumentationMiddleware, 'record', lambda *args: recorded.append(args[4])):
+                instrumentation.InstrumentationMiddleware(view)(RequestFactory().get('/'))
+            return recorded[0].serializer_time
+
+        self.assertGreater(serializer_time(ProductSerializer(Product.objects.all(), many=True)), 0)
+        self.assertGreater(serializer_time(ProductSerializer(Product.objects.get())), 0)
+        self.assertGreater(serializer_time(FastProductSerializer(Product.objects.all())), 0)
+        # Serializers without the mixin are not timed: DRF itself is not patched
+        self.assertEqual(serializer_time(PlainCategorySerializer(category)), 0)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    @override_settings(PROFILE_TOKEN='', PROFILE_SAMPLE_RATE=0, SLOW_QUERY_MS=0)
+    def test_disabled_hooks_are_dropped(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(HttpResponse)
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.SlowQueryMiddleware(HttpResponse)
+
+    def test_token_gated_profile(self):
+        with self.settings(PROFILE_TOKEN='secret', PROFILE_SAMPLE_RATE=0, PROFILE_DIR=self.directory, PROFILE_MAX_FILES=2):
+            middleware = profiling.ProfilingMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+
+        self.assertNotIn('X-Profile-Id', middleware(factory.get('/')))
+        self.assertNotIn('X-Profile-Id', middleware(factory.get('/', HTTP_X_PROFILE='wrong')))
+        self.assertEqual(os.listdir(self.directory), [])
+
+        names = []
+        with self.assertLogs('isansoriginal.profiling', 'INFO'):
+            for _ in range(3):
+                names.append(middleware(factory.get('/', HTTP_X_PROFILE='secret'))['X-Profile-Id'])
+                # Distinct modification times for the retention order
+                time.sleep(0.01)
+        self.assertTrue(all(name.endswith('.prof') for name in names))
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(names[1:]))
+
+    @override_settings(SLOW_QUERY_MS=0.000001)
+    def test_slow_query_log(self):
+        def view(request):
+            # Where the handler would call it
+            middleware.process_view(request, view, (), {})
+            list(Product.objects.filter(name='secret@example.com'))
+            return HttpResponse()
+
+        middleware = profiling.SlowQueryMiddleware(view)
+        with self.assertLogs('isansoriginal.profiling', 'WARNING') as logs:
+            middleware(RequestFactory().get('/shop/get-products/'))
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(
+            (entry['event'], entry['database'], entry['view'], entry['path']),
+            ('slow_query', 'default', 'view', '/shop/get-products/'),
+        )
+        self.assertIn('FROM "shop_product"', entry['sql'])
+        self.assertNotIn('secret@example.com', logs.output[0])
+        self.assertTrue(entry['stack'])
+        self.assertTrue(entry['stack'][-1].startswith(os.path.join('shop', 'tests.py')), entry['stack'])
+        for frame in entry['stack']:
+            self.assertFalse(frame.startswith('isansoriginal') or 'site-packages' in frame, frame)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import AdminDeliveryCompany, AdminOrderHistory, AdminOrderStatistics, BarcodeView, CartView, CategoryView, GenerateBarcode, GetCategory, GetReview, GetProducts, ProductView, Metrics, OrderView, OrderHistory, OrderStatus, PaymentInit, PaymentVerify, ReviewView, UpdateProductQuantity, UserDeliveryCompany, WishlistView
+from .views import AdminDeliveryCompany, AdminOrderHistory, AdminOrderStatistics, Autocomplete, BarcodeView, CartView, CategoryView, DeliveryDirectory, DeliverySearch, GenerateBarcode, GetCategory, GetReview, GetProducts, ProductView, ProductExport, ProductImport, ProductSearch, Metrics, OrderView, OrderHistory, OrderStatus, PaymentInit, PaymentVerify, ReviewView, ScanBarcode, StockReservationView, StockSync, UpdateProductQuantity, UserDeliveryCompany, WishlistView
 
 
 
@@ -7,6 +7,7 @@ urlpatterns = [
     path('delivery/', AdminDeliveryCompany.as_view(), name='admin_delivery'),
     path('delivery/<int:pk>/', AdminDeliveryCompany.as_view(), name='admin_delivery'),
     path('barcode/', BarcodeView.as_view(), name='barcode'),
+    path('scan/<str:code>/', ScanBarcode.as_view(), name='scan-barcode'),
     path('generate/', GenerateBarcode.as_view(), name='generate'),
     path('cart/', CartView.as_view(), name='cart'),
     path('cart/<int:pk>/', CartView.as_view(), name='update-cart'),
@@ -16,18 +17,29 @@ urlpatterns = [
     path('get-products/', GetProducts.as_view(), name='get_products'),
     path('products/', ProductView.as_view(), name='products'),
     path('products/<int:pk>/', ProductView.as_view(), name='update-products'),
+    path('products/import/', ProductImport.as_view(), name='import-products'),
+    path('products/export/', ProductExport.as_view(), name='export-products'),
+    path('search/', ProductSearch.as_view(), name='product-search'),
+    path('autocomplete/', Autocomplete.as_view(), name='autocomplete'),
     path('init-payment/', PaymentInit.as_view(), name='initialize_payment'),
     path('verify-payment/', PaymentVerify.as_view(), name='verify_payment'),
     path('orders/', OrderView.as_view(), name='orders'),
+    path('reservations/', StockReservationView.as_view(), name='stock-reservations'),
+    path('reservations/<uuid:reference>/', StockReservationView.as_view(), name='release-reservation'),
     path('order-history/', OrderHistory.as_view(), name='order-history'),
+    path('order-history/<int:pk>/', OrderHistory.as_view(), name='order-detail'),
     path('admin-orders/', AdminOrderHistory.as_view(), name='admin-order-history'),
     path('admin-orders/statistics/', AdminOrderStatistics.as_view(), name='admin-order-statistics'),
     path('orderstatus/<int:pk>/', OrderStatus.as_view(), name='order_status'),
     path('see-reviews/<int:product_id>/', GetReview.as_view(), name='product-reviews'),
     path('add-reviews/<int:product_id>/', ReviewView.as_view(), name='add-review'),
+    path('delivery-directory/', DeliveryDirectory.as_view(), name='delivery-directory'),
+    path('delivery-directory/search/', DeliverySearch.as_view(), name='delivery-search'),
+    path('delivery-directory/<int:pk>/', DeliveryDirectory.as_view(), name='remove-preferred-delivery'),
     path('userdelivery/', UserDeliveryCompany.as_view(), name='user_delivery'),
     path('userdelivery/<int:pk>/', UserDeliveryCompany.as_view(), name='user_delivery'),
     path('update-quantity/<int:product_id>/', UpdateProductQuantity.as_view(), name='update-product-quantity'),
+    path('stock-sync/', StockSync.as_view(), name='stock-sync'),
     path('wishlist/', WishlistView.as_view(), name='wishlist'),
     path('wishlist/<int:pk>/', WishlistView.as_view(), name='remove-wishlist'),
 ]
@@ -1,9 +1,12 @@
 from barcode import Code128
 from barcode.writer import ImageWriter
+from collections import defaultdict
 from datetime import timedelta
-from django.db.models import Count, Sum, F, ExpressionWrapper, DecimalField
+from django.db.models import Count, Max, Q, Sum
 from django.core.files import File
 from django.core.mail import send_mail
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -12,11 +15,21 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, AllowAny, IsAuthenticated
 from rest_framework import status
 from users.models import CustomUser
+from .autocomplete import autocomplete_index
 from .barcodegen import generate_barcode_images
-from .models import Barcode, Cart, Category, DeliveryCompany, Order, Product, Review, Wishlist
-from .serializers import BarcodeSerializer, CartSerializer, CategorySerializer, DeliveryCompanySerializer, OrderSerializer, AdminOrderHistorySerializer, ProductSerializer, ReviewSerializer, WishlistSerializer
+from .barcodes import release_barcodes
+from . import delivery
+from .catalog_io import FORMATS, CatalogImporter, detect_format, export_lines, iter_records
+from .inventory import InsufficientStock, ReservationUnavailable, apply_stock_levels, commit_reservation, consume_reservation, deduct_stock, release_reservation, reserve_stock, set_stock
+from .models import Barcode, Cart, Category, DeliveryCompany, Order, OrderLine, Product, ProductSize, Review, Wishlist
+from .fast_serializers import FastAdminOrderHistorySerializer, FastBarcodeSerializer, FastProductSerializer
+from .pagination import KeysetPagination
+from .scanner import barcode_index
+from .search import search_products
+from .serializers import BarcodeSerializer, CartSerializer, CategorySerializer, DeliveryCompanySerializer, OrderListSerializer, OrderSerializer, ProductSerializer, ReviewSerializer, WishlistSerializer
 import os
-import requests 
+import requests
+import uuid 
 
 class CategoryView(APIView):
     permission_classes = [IsAdminUser]
@@ -56,7 +69,7 @@ class ProductView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        products = Product.objects.all()
+        products = Product.objects.select_related('category').prefetch_related('product_sizes')
         serializer = ProductSerializer(products, many=True)
         return Response(serializer.data)
 
@@ -64,14 +77,6 @@ class ProductView(APIView):
         # Prepare data
         data = request.data.copy()
 
-        if 'sizes' in data:
-            if isinstance(data['sizes'], str):
-                data['sizes'] = [
-                    size.strip()
-                    for size in data['sizes'].split(',') 
-                    if size.strip()
-                ]
-        
         # Handle barcode
         if 'barcode' in data and isinstance(data['barcode'], dict):
             barcode_code = data['barcode'].get('code')
@@ -171,13 +176,10 @@ class ProductView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Delete associated barcode if exists
-            if hasattr(product, 'barcode') and product.barcode:
-                product.barcode.status = 'unused'
-                product.barcode.save()
-
-            # Delete the product
-            product.delete()
+            # Return the barcode to the free pool along with the delete
+            with transaction.atomic():
+                release_barcodes([product.barcode_id])
+                product.delete()
             return Response(
                 {
                     "message": "Product deleted successfully",
@@ -199,13 +201,131 @@ class ProductView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class ProductImport(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        """Bulk create/update products from an uploaded CSV or NDJSON file."""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "A CSV or NDJSON file is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.data.get('file_format') or detect_format(upload.name)
+        if file_format not in FORMATS:
+            return Response({"detail": f"Format must be one of: {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = CatalogImporter()
+        report = importer.run(iter_records(upload.file, file_format))
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ProductExport(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Stream the whole catalog without building it in memory."""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in FORMATS:
+            return Response({"detail": f"Format must be one of: {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(export_lines(file_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+
 class GetProducts(APIView):
     permission_classes = [AllowAny]
+    replica_reads = True
 
     def get(self, request):
         products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+
+        # ?size=M or ?size=M,L uses the (size, product) index instead of scanning products
+        sizes = [size.strip() for size in request.query_params.get('size', '').split(',') if size.strip()]
+        if sizes:
+            invalid_sizes = [size for size in sizes if size not in Product.SIZE_ORDER]
+            if invalid_sizes:
+                return Response(
+                    {"detail": f"Invalid sizes: {', '.join(invalid_sizes)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            products = products.filter(
+                id__in=ProductSize.objects.filter(size__in=sizes).values('product_id')
+            )
+
+        # ?category=<id> and ?in_stock=1 use the (category, is_in_stock) index
+        category = request.query_params.get('category')
+        if category:
+            if not category.isdigit():
+                return Response({"detail": "Category must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+            products = products.filter(category_id=int(category))
+        if request.query_params.get('in_stock') in ('1', 'true'):
+            products = products.filter(is_in_stock=True)
+
+        # Rendered from .values() rows; same JSON as ProductSerializer(products, many=True)
+        return Response(FastProductSerializer(products).data)
+
+
+class ProductSearch(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            return Response({"detail": "Limit and offset must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0 or offset < 0:
+            return Response({"detail": "Limit must be positive and offset non-negative."}, status=status.HTTP_400_BAD_REQUEST)
+
+        category_id = None
+        category_name = request.query_params.get('category')
+        if category_name:
+            category_id = Category.objects.filter(name=category_name).values_list('id', flat=True).first()
+            if category_id is None:
+                return Response({"detail": "Category not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        result = search_products(query, category_id=category_id, limit=limit, offset=offset)
+
+        # Preserve the ranking order from the index
+        products = Product.objects.select_related('category').prefetch_related('product_sizes').in_bulk(result.ids)
+        serializer = ProductSerializer([products[pk] for pk in result.ids if pk in products], many=True)
+
+        category_names = dict(Category.objects.filter(id__in=result.facets).values_list('id', 'name'))
+        facets = sorted(
+            ({"category": category_names.get(pk), "count": count} for pk, count in result.facets.items()),
+            key=lambda facet: -facet["count"]
+        )
+
+        return Response({
+            "query": query,
+            "total": result.total,
+            "results": serializer.data,
+            "facets": facets,
+        })
+
+
+class Autocomplete(APIView):
+    permission_classes = [AllowAny]
+    # Suggestions are public; skipping JWT authentication keeps the request off the database
+    authentication_classes = []
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', 8))
+        except ValueError:
+            return Response({"detail": "Limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "query": query,
+            "suggestions": autocomplete_index.suggest(query, max(limit, 1)),
+        })
 
 
 class GenerateBarcode(APIView):
@@ -229,9 +349,38 @@ class BarcodeView(APIView):
     permission_classes = [IsAdminUser ]
 
     def get(self, request):
-        barcodes = Barcode.objects.all()  # Retrieve all barcodes
-        serializer = BarcodeSerializer(barcodes, many=True)  # Serialize the queryset
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        """
+        List barcodes a page at a time, optionally filtered by ?status=, ?prefix= or a
+        ?code_from=/?code_to= range. ?summary=1 returns used/unused counts instead.
+        """
+        if request.query_params.get('summary') in ('1', 'true'):
+            counts = dict(Barcode.objects.values_list('status').annotate(count=Count('id')).order_by())
+            summary = {code: counts.get(code, 0) for code, _ in Barcode.STATUS_CHOICES}
+            return Response(dict(summary, total=sum(summary.values())), status=status.HTTP_200_OK)
+
+        barcodes = Barcode.objects.all()
+        barcode_status = request.query_params.get('status')
+        if barcode_status is not None:
+            if barcode_status not in dict(Barcode.STATUS_CHOICES):
+                return Response({"detail": "Status must be 'used' or 'unused'."}, status=status.HTTP_400_BAD_REQUEST)
+            barcodes = barcodes.filter(status=barcode_status)
+
+        # Prefixes are expressed as a code range so the unique index on code is used
+        # regardless of the backend's LIKE collation
+        prefix = request.query_params.get('prefix')
+        if prefix:
+            barcodes = barcodes.filter(code__gte=prefix, code__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        if request.query_params.get('code_from'):
+            barcodes = barcodes.filter(code__gte=request.query_params['code_from'])
+        if request.query_params.get('code_to'):
+            barcodes = barcodes.filter(code__lte=request.query_params['code_to'])
+
+        paginator = KeysetPagination(['id'], page_size=50)
+        page = paginator.paginate_queryset(barcodes.values('id', 'code', 'status'), request)
+        return Response({
+            'next': paginator.get_next_link(),
+            'barcodes': FastBarcodeSerializer(page).data,
+        }, status=status.HTTP_200_OK)
     
     def post(self, request):
         try:
@@ -250,12 +399,33 @@ class BarcodeView(APIView):
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class ScanBarcode(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, code):
+        """Resolve a scanned barcode to its product, price and stock."""
+        entry = barcode_index.lookup(code.strip())
+        if entry is None:
+            return Response({"detail": "No product has this barcode."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "code": entry['code'],
+            "product_id": entry['product_id'],
+            "name": entry['name'],
+            "price": str(entry['price']),
+            "quantity": entry['quantity'],
+            "is_in_stock": entry['is_in_stock'],
+        })
+
+
 class AdminDeliveryCompany(APIView):
     permission_classes = [IsAdminUser]  # Admin-only access
 
     def get(self, request):
-        # Admin can view all delivery companies
-        companies = DeliveryCompany.objects.all()
+        # Admin can view all delivery companies, optionally narrowed by state, branch or name prefix
+        companies = DeliveryCompany.objects.order_by('state', 'branch', 'name')
+        for param, lookup in (('state', 'state'), ('branch', 'branch'), ('name', 'name__startswith')):
+            if request.query_params.get(param):
+                companies = companies.filter(**{lookup: request.query_params[param]})
         serializer = DeliveryCompanySerializer(companies, many=True)
         return Response(serializer.data)
 
@@ -286,14 +456,8 @@ class UserDeliveryCompany(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Get delivery companies that were created by admins
-        admin_companies = DeliveryCompany.objects.filter(created_by__isnull=True)  # Admin-created companies
-        user_companies = DeliveryCompany.objects.filter(created_by=request.user)  # User-created companies
-        all_companies = admin_companies | user_companies  # Combine both sets
-
-        # Serialize the companies and return them
-        serializer = DeliveryCompanySerializer(all_companies, many=True)
-        return Response(serializer.data)
+        # Admin-created companies plus the user's own
+        return Response(delivery.directory(request.user))
 
     def post(self, request):
         # Create a new delivery company for the user
@@ -317,6 +481,41 @@ class UserDeliveryCompany(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class DeliveryDirectory(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Every delivery company available at checkout, preferred ones first."""
+        return Response({"companies": delivery.directory(request.user)})
+
+    def post(self, request):
+        """Mark a company as preferred."""
+        if not delivery.add_preferred(request.user, request.data.get('delivery_company_id')):
+            return Response({"detail": "Invalid delivery company"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"detail": "Delivery company added to preferred."}, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, pk):
+        if not delivery.remove_preferred(request.user, pk):
+            return Response({"detail": "Company is not in your preferred list."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "Delivery company removed from preferred."})
+
+
+class DeliverySearch(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Companies serving ?state= (default: the user's state), optionally narrowed by
+        ?branch= and a ?name= prefix.
+        """
+        state = request.query_params.get('state', request.user.state)
+        companies = delivery.find_companies(
+            request.user, state=state,
+            branch=request.query_params.get('branch'), name=request.query_params.get('name'),
+        )
+        return Response({"state": state, "companies": companies})
+
+
 class OrderStatus(APIView):
     permission_classes = [IsAdminUser]
 
@@ -347,7 +546,9 @@ class CartView(APIView):
     def get(self, request):
         """Retrieve all cart items for the user."""
         try:
-            cart_items = Cart.objects.filter(user=request.user)
+            cart_items = Cart.objects.filter(user=request.user).select_related(
+                'product__category'
+            ).prefetch_related('product__product_sizes')
             if not cart_items.exists():
                 return Response({
                     'message': 'Your cart is empty',
@@ -469,45 +670,120 @@ class OrderView(APIView):
     def post(self, request):
         """Place orders from the cart."""
 
-        delivery_company_id = request.data.get('delivery_company_id')
-
-        try:
-            # Fetch the delivery company instance first
-            delivery_company = DeliveryCompany.objects.get(id=delivery_company_id)
-        except DeliveryCompany.DoesNotExist:
+        # Global companies resolve from the directory cache without a query
+        delivery_company = delivery.get_company(request.user, request.data.get('delivery_company_id'))
+        if delivery_company is None:
             return Response({"detail": "Invalid delivery company"}, status=status.HTTP_400_BAD_REQUEST)
         
-        cart_items = Cart.objects.filter(user=request.user)
-        if not cart_items.exists():
+        cart_items = list(Cart.objects.filter(user=request.user).select_related('product'))
+        if not cart_items:
             return Response({"detail": "Cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
 
-        orders = []
-        for cart_item in cart_items:
-            product = cart_item.product
+        reservation = request.data.get('reservation')
+        if reservation:
+            try:
+                reservation = uuid.UUID(str(reservation))
+            except ValueError:
+                return Response({"detail": "Invalid reservation reference."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                # One order per checkout; its lines snapshot each product's current price
+                order = Order.objects.create(user=request.user, delivery_company=delivery_company)
+
+                # Units already taken from stock by a checkout reservation are not deducted
+                # twice; the reservation is tied to this order so it cannot cover another
+                reserved = {}
+                if reservation:
+                    wanted = defaultdict(int)
+                    for cart_item in cart_items:
+                        wanted[cart_item.product_id] += cart_item.quantity
+                    reserved = consume_reservation(request.user, reservation, order, wanted)
+
+                lines = []
+                for cart_item in cart_items:
+                    product = cart_item.product
+                    covered = min(reserved.get(product.id, 0), cart_item.quantity)
+                    reserved[product.id] = reserved.get(product.id, 0) - covered
+
+                    # Conditional UPDATE: concurrent checkouts cannot oversell the last units
+                    needed = cart_item.quantity - covered
+                    if needed and not deduct_stock(product.id, needed):
+                        product.refresh_from_db(fields=['quantity'])
+                        raise InsufficientStock(
+                            f"Insufficient stock for {product.name}. Available: {product.quantity}"
+                        )
+
+                    lines.append(OrderLine(
+                        order=order,
+                        product=product,
+                        product_name=product.name,
+                        quantity=cart_item.quantity,
+                        unit_price=product.price,
+                        line_total=product.price * cart_item.quantity,
+                    ))
+
+                OrderLine.objects.bulk_create(lines)
+                order.total_price = sum(line.line_total for line in lines)
+                order.save(update_fields=['total_price'])
+
+                # Remove the items from the cart after placing the orders
+                Cart.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        except ReservationUnavailable as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+        except InsufficientStock as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # bulk_create skips the signals that rank ordered products for autocomplete
+        for line in lines:
+            autocomplete_index.product_ordered(line.product_id, line.quantity)
+
+        order._prefetched_objects_cache = {'lines': lines}
+        serializer = OrderSerializer(order)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 
-            if product.quantity < cart_item.quantity:
+class StockReservationView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Hold per-size stock for the duration of checkout."""
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response({"detail": "Items must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines = []
+        for item in items:
+            try:
+                product_id = int(item['product_id'])
+                size = str(item['size'])
+                quantity = int(item.get('quantity', 1))
+            except (KeyError, TypeError, ValueError):
                 return Response(
-                    {"detail": f"Insufficient stock for {product.name}. Available: {product.quantity}"},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"detail": "Each item needs a product_id, a size and an integer quantity."},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+            if quantity <= 0:
+                return Response({"detail": "Quantity must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+            lines.append((product_id, size, quantity))
 
-            # Deduct the product quantity
-            product.quantity -= cart_item.quantity
-            product.save()
-
-            # Create the order
-            order = Order.objects.create(
-                user=request.user,
-                product=product,
-                quantity=cart_item.quantity,
-                delivery_company=delivery_company
-            )
-            orders.append(order)
-            cart_item.delete()  # Remove item from cart after placing the order.
+        try:
+            reference, expires_at = reserve_stock(request.user, lines)
+        except InsufficientStock as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
 
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response({
+            "reservation": str(reference),
+            "expires_at": expires_at,
+        }, status=status.HTTP_201_CREATED)
 
+    def delete(self, request, reference):
+        """Give the held stock back, e.g. when the customer abandons checkout."""
+        released = release_reservation(request.user, reference)
+        if not released:
+            return Response({"detail": "No held reservation found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "Reservation released.", "released_items": released})
 
 
 class WishlistView(APIView):
@@ -518,7 +794,9 @@ class WishlistView(APIView):
         Retrieve all wishlist items for the authenticated user
         """
         try:
-            wishlist = Wishlist.objects.filter(user=request.user)
+            wishlist = Wishlist.objects.filter(user=request.user).select_related(
+                'product__category'
+            ).prefetch_related('product__product_sizes')
             
             # Check if wishlist is empty
             if not wishlist.exists():
@@ -653,29 +931,51 @@ class WishlistView(APIView):
 
 class GetReview(APIView):
     permission_classes = [AllowAny]
+    replica_reads = True
+
+    SORT_ORDERINGS = {
+        'newest': ['-created_at', '-id'],
+        'highest': ['-rating', '-created_at', '-id'],
+        'lowest': ['rating', '-created_at', '-id'],
+    }
 
     def get(self, request, product_id):
-        try:
-            reviews = Review.objects.filter(product_id=product_id)
-            
-            if not reviews.exists():
-                return Response({
-                    'message': 'No reviews found for this product',
-                    'product_id': product_id
-                }, status=status.HTTP_404_NOT_FOUND)
+        product = Product.objects.filter(pk=product_id).only(
+            'id', 'rating_count', *Product.RATING_HISTOGRAM_FIELDS.values()
+        ).first()
 
-            serializer = ReviewSerializer(reviews, many=True)
+        # The denormalized rating_count replaces the exists() + count() queries
+        if product is None or not product.rating_count:
             return Response({
-                'product_id': product_id,
-                'total_reviews': reviews.count(),
-                'reviews': serializer.data
-            }, status=status.HTTP_200_OK)
+                'message': 'No reviews found for this product',
+                'product_id': product_id
+            }, status=status.HTTP_404_NOT_FOUND)
 
-        except Exception as e:
+        sort = request.query_params.get('sort', 'newest')
+        if sort not in self.SORT_ORDERINGS:
             return Response({
-                'error': 'An unexpected error occurred',
-                'details': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                'error': f"Invalid sort. Choose from: {', '.join(self.SORT_ORDERINGS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        reviews = Review.objects.filter(product_id=product_id).select_related('user')
+        total_reviews = product.rating_count
+
+        rating = request.query_params.get('rating')
+        if rating is not None:
+            if rating not in {str(i) for i in Product.RATING_HISTOGRAM_FIELDS}:
+                return Response({'error': 'Rating must be an integer from 1 to 5'}, status=status.HTTP_400_BAD_REQUEST)
+            reviews = reviews.filter(rating=int(rating))
+            total_reviews = getattr(product, Product.RATING_HISTOGRAM_FIELDS[int(rating)])
+
+        paginator = KeysetPagination(self.SORT_ORDERINGS[sort])
+        page = paginator.paginate_queryset(reviews, request)
+        serializer = ReviewSerializer(page, many=True)
+        return Response({
+            'product_id': product_id,
+            'total_reviews': total_reviews,
+            'next': paginator.get_next_link(),
+            'reviews': serializer.data
+        }, status=status.HTTP_200_OK)
 
 
 class ReviewView(APIView):
@@ -686,22 +986,25 @@ class ReviewView(APIView):
 
         serializer = ReviewSerializer(data=review_data)
         if serializer.is_valid():
-            serializer.save()
+            # The product rating aggregates are updated in the same transaction
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
  
 
 class Metrics(APIView):
     permission_classes = [IsAdminUser]
+    replica_reads = True
 
     def get(self, request):
         # Total number of orders
         total_orders = Order.objects.count()
 
-        # Top 3 most ordered products
+        # Top 3 most ordered products; lines of deleted products would all share one null group
         top_products = (
-            Order.objects.values("product__name")
-            .annotate(total_quantity=Sum("quantity"))
+            OrderLine.objects.filter(product__isnull=False).values("product_id")
+            .annotate(product_name=Max("product_name"), total_quantity=Sum("quantity"))
             .order_by("-total_quantity")[:3]
         )
 
@@ -714,7 +1017,7 @@ class Metrics(APIView):
         # Prepare the response data
         data = {
             "total_orders": total_orders,
-            "top_products": [{"product": p["product__name"], "total_quantity": p["total_quantity"]} for p in top_products],
+            "top_products": [{"product": p["product_name"], "total_quantity": p["total_quantity"]} for p in top_products],
             "total_customers": total_customers,
             "category_products": [{"category": c["category__name"], "total_products": c["total"]} for c in category_products],
         }
@@ -772,7 +1075,17 @@ class PaymentVerify(APIView):
         if response.status_code == 200:
             data = response.json()
             if data["status"] and data["data"]["status"] == "success":
-                # Payment successful
+                # Payment successful: the checkout's stock hold becomes a sale
+                reservation = request.data.get("reservation")
+                if reservation:
+                    try:
+                        committed = commit_reservation(request.user, uuid.UUID(str(reservation)))
+                    except ValueError:
+                        committed = 0
+                    if not committed:
+                        return Response({
+                            "message": "Payment verified, but the stock reservation has expired.",
+                        }, status=status.HTTP_409_CONFLICT)
                 return Response({"message": "Payment verified successfully!"}, status=200)
 
         # Payment failed
@@ -782,90 +1095,129 @@ class PaymentVerify(APIView):
 class OrderHistory(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        """Retrieve order history for the authenticated user."""
-        orders = Order.objects.filter(user=request.user).order_by('-created_at')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+    def get(self, request, pk=None):
+        """
+        Retrieve the authenticated user's orders, newest first, a page at a time and
+        optionally filtered by ?status=. With a pk, return that order with its lines.
+        """
+        orders = Order.objects.filter(user=request.user)
+
+        if pk is not None:
+            order = get_object_or_404(orders.select_related('user', 'delivery_company').prefetch_related('lines'), pk=pk)
+            return Response(OrderSerializer(order).data)
+
+        order_status = request.query_params.get('status')
+        if order_status is not None:
+            if order_status not in dict(Order._meta.get_field('status').choices):
+                return Response({"detail": "Invalid status."}, status=status.HTTP_400_BAD_REQUEST)
+            orders = orders.filter(status=order_status)
+
+        orders = orders.select_related('delivery_company').annotate(item_count=Sum('lines__quantity'))
+        paginator = KeysetPagination(['-created_at', '-id'])
+        page = paginator.paginate_queryset(orders, request)
+        return Response({
+            'next': paginator.get_next_link(),
+            'orders': OrderListSerializer(page, many=True).data,
+        })
 
 class UpdateProductQuantity(APIView):
     permission_classes = [IsAdminUser]
 
     def post(self, request, product_id):
         """Update the quantity of a specific product."""
-        try:
-            product = Product.objects.get(id=product_id)
-            quantity = request.data.get('quantity')
+        quantity = request.data.get('quantity')
 
-            if quantity is not None and isinstance(quantity, int) and quantity >= 0:
-                product.quantity_available = quantity
-                product.save()
-                return Response({"detail": "Product quantity updated successfully."})
+        if quantity is None or not isinstance(quantity, int) or quantity < 0:
             return Response({"detail": "Invalid quantity provided."}, status=status.HTTP_400_BAD_REQUEST)
-        except Product.DoesNotExist:
+        if not set_stock(product_id, quantity):
             return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "Product quantity updated successfully."})
+
+
+class StockSync(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        """
+        Apply a batch of warehouse stock levels:
+        {"records": [{"product_id": 1, "quantity": 20}, {"barcode": "iSANS1042", "delta": -3}]}
+        """
+        records = request.data.get('records')
+        if not isinstance(records, list) or not records:
+            return Response({"detail": "Records must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated, not_found, errors = apply_stock_levels(records)
+        return Response({
+            "updated": updated,
+            "not_found": not_found,
+            "errors": errors,
+        }, status=status.HTTP_200_OK)
 
 
 class AdminOrderHistory(APIView):
     permission_classes = [IsAdminUser]
+    replica_reads = True
 
     def get(self, request):
         """
         Retrieve all order history for admin
         """
-        # Optimize query with select_related to reduce database hits
-        queryset = Order.objects.select_related(
-            'user', 'product', 'delivery_company'
-        ).all().order_by('-created_at')
-
-        # Serialize data
-        serializer = AdminOrderHistorySerializer(queryset, many=True)
-
-        # Return all orders
-        return Response(serializer.data)
+        # One query for the orders with their user and company, one for all lines;
+        # same JSON as AdminOrderHistorySerializer(queryset, many=True)
+        queryset = Order.objects.order_by('-created_at')
+        return Response(FastAdminOrderHistorySerializer(queryset).data)
 
 class AdminOrderStatistics(APIView):
     permission_classes = [IsAdminUser]
+    replica_reads = True
 
     def get(self, request):
         """
         Provide comprehensive order statistics for admin dashboard
         """
 
-        # Total order statistics
-        total_orders = Order.objects.count()
-        total_revenue = Order.objects.aggregate(
-            total_revenue=Sum(ExpressionWrapper(F('quantity') * F('product__price'), output_field=DecimalField())))
+        # Day boundaries as plain ranges; created_at__date wraps the column in a function
+        # and cannot use the (created_at, status, total_price) index
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        last_week = today - timedelta(days=7)
+        last_month = today - timedelta(days=30)
+
+        # Totals and trends come from one pass over the covering index
+        totals = Order.objects.aggregate(
+            total_orders=Count('id'),
+            total_revenue=Sum('total_price'),
+            today=Count('id', filter=Q(created_at__gte=today)),
+            last_week=Count('id', filter=Q(created_at__gte=last_week)),
+            last_month=Count('id', filter=Q(created_at__gte=last_month)),
+        )
+        recent_orders = {period: totals[period] for period in ('today', 'last_week', 'last_month')}
 
         # Order status breakdown
         status_breakdown = Order.objects.values('status').annotate(
             count=Count('id')
-        )
+        ).order_by()
 
-        today = timezone.now().date()
-        last_week = today - timedelta(days=7)
-        last_month = today - timedelta(days=30)
-
-        recent_orders = {
-            'today': Order.objects.filter(created_at__date=today).count(),
-            'last_week': Order.objects.filter(
-                created_at__date__gte=last_week
-            ).count(),
-            'last_month': Order.objects.filter(
-                created_at__date__gte=last_month
-            ).count()
-        }
-
-        # Top selling products
-        top_products = Order.objects.values('product__name').annotate(
+        # Top selling products, from the stored line totals. Lines whose product was deleted
+        # have no product_id and would otherwise merge into one bogus entry
+        top_products = OrderLine.objects.filter(product__isnull=False).values('product_id').annotate(
+            product_name=Max('product_name'),
             total_quantity=Sum('quantity'),
-            total_revenue=Sum(ExpressionWrapper( F('quantity') * F('product__price'), output_field=DecimalField()))
+            total_revenue=Sum('line_total')
         ).order_by('-total_quantity')[:10]
 
         return Response({
-            'total_orders': total_orders,
-            'total_revenue': total_revenue,
+            'total_orders': totals['total_orders'],
+            'total_revenue': {'total_revenue': totals['total_revenue']},
             'status_breakdown': list(status_breakdown),
             'recent_order_trends': recent_orders,
-            'top_products': list(top_products)
+            # Keyed 'product__name' as when the stats were grouped on the product relation
+            'top_products': [
+                {
+                    'product_id': entry['product_id'],
+                    'product__name': entry['product_name'],
+                    'total_quantity': entry['total_quantity'],
+                    'total_revenue': entry['total_revenue'],
+                }
+                for entry in top_products
+            ]
         })
\ No newline at end of file
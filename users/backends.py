@@ -1,17 +1,17 @@
+import logging
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 
+logger = logging.getLogger(__name__)
+
 class EmailBackend(ModelBackend):
     def authenticate(self, request, email=None, password=None, **kwargs):
         UserModel = get_user_model()
         try:
             user = UserModel.objects.get(email=email)
-            print(f"User found: {user}")  # Debug
             if user.check_password(password):
-                print("Password is correct")  # Debug
                 return user
-            else:
-                print("Password is incorrect")  # Debug
+            logger.debug("Incorrect password for user %s", user.pk)
         except UserModel.DoesNotExist:
-            print("No user found with this email address")  # Debug
+            logger.debug("No user found with this email address")
         return None
@@ -85,6 +85,10 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Unread notifications for a user, newest first
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notification_user_unread_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user.email}: {self.message[:50]}..."
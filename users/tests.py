@@ -1,3 +1,14 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from .models import CustomUser
 
-# Create your tests here.
+
+class LoginQueryCountTests(TestCase):
+    def test_login(self):
+        CustomUser.objects.create_user(email='customer@example.com', password='password')
+        # The user, then the outstanding refresh token
+        with self.assertNumQueries(2):
+            response = APIClient().post(
+                '/users/login/', {'email': 'customer@example.com', 'password': 'password'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)